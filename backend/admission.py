@@ -0,0 +1,354 @@
+import os
+import io
+import json
+import math
+import time
+import atexit
+import asyncio
+import threading
+import contextlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# 預算與佇列上限（可用環境變數覆寫）
+# CPU 預算以「已接受但尚未完成的 CPU 秒數」計算：核心數 x 可接受的排隊時間
+CPU_CORES = os.cpu_count() or 1
+CPU_BUDGET = float(os.environ.get("CHARACTER_ART_CPU_BUDGET", CPU_CORES * 30))
+MEMORY_BUDGET = int(os.environ.get("CHARACTER_ART_MEMORY_BUDGET", 1024 ** 3))
+MAX_QUEUE = int(os.environ.get("CHARACTER_ART_MAX_QUEUE", 16))
+MAX_WAIT = float(os.environ.get("CHARACTER_ART_MAX_WAIT", 30))
+
+# 成本模型（以 1280x720 來源、80-200 欄輸出量測）
+DECODE_SECONDS_PER_MEGAPIXEL = 0.002
+PRESCALE_SECONDS_PER_MEGAPIXEL = 0.001
+CELL_SECONDS = {"grayscale": 3e-7, "ansi": 5e-7, "ansi256": 4.5e-7, "truecolor": 9e-7}
+# 影片轉換時同時保留的原始幀數（共用執行池的在途上限）
+RAW_FRAMES_IN_FLIGHT = 2 * CPU_CORES
+# 每個字元格的結果（Python 物件 + JSON 回應）
+CELL_BYTES = {"grayscale": 8, "ansi": 28, "ansi256": 24, "truecolor": 100}
+# 每個字元格的 JSON 回應大小（未壓縮）
+RESPONSE_CELL_BYTES = {"grayscale": 3.4, "ansi": 12.4, "ansi256": 7.8, "truecolor": 18.8}
+# 映射方式的額外成本與每格取樣的像素數（抖動以像素計算）
+MAPPING_CELL_SECONDS = {"brightness": 0.0, "shape": 2.5e-7, "braille": 2.5e-7, "halfblock": 1.4e-6}
+MAPPING_PIXELS = {"brightness": 1, "shape": 6, "braille": 8, "halfblock": 2}
+DITHERING_SECONDS_PER_PIXEL = 3e-7
+# 區段平行解碼：每多一段要從前一個關鍵幀解碼到起點（最多約一個 GOP），另有分派與傳回結果的成本
+SEGMENT_SEEK_FRAMES = 250
+SEGMENT_SECONDS = 0.05
+
+# 實際轉換耗時的記錄，用來校正成本模型（可用環境變數指定路徑）
+HISTORY_PATH = os.environ.get(
+    "CHARACTER_ART_BENCHMARK_HISTORY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmark_history.json")
+)
+HISTORY_SIZE = 200
+# 記錄後延遲多久寫入檔案（秒）
+HISTORY_FLUSH_DELAY = 1.0
+# 至少幾筆記錄才開始校正
+MIN_HISTORY = 3
+# 各種轉換使用的記錄（benchmark.py 量測的是影片轉換）
+HISTORY_KINDS = {"image": ("image",), "video": ("video", "benchmark")}
+
+@dataclass
+class Cost:
+    """一個請求的預估成本（cpu_seconds 已依記錄校正，model_seconds 為模型的原始估計）"""
+    cpu_seconds: float
+    memory_bytes: int
+    model_seconds: float = 0.0
+
+    def __add__(self, other: "Cost") -> "Cost":
+        return Cost(self.cpu_seconds + other.cpu_seconds, self.memory_bytes + other.memory_bytes,
+                    self.model_seconds + other.model_seconds)
+
+class BenchmarkHistory:
+    """
+    實際轉換耗時的記錄
+
+    每筆記錄模型的估計與實際的 CPU 秒數（經過時間 x 使用的並行數）；校正係數為同一種轉換、
+    同一色彩模式最近記錄的比值中位數（記錄不足時為 1）。記錄來自實際的轉換請求與 benchmark.py
+    （benchmark.py 量測影片轉換，與影片請求一起校正影片的成本）。
+    """
+
+    def __init__(self, path: str = HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # 寫入依序進行，較舊的快照不會蓋過較新的
+        self._write_lock = threading.Lock()
+        self._entries = None
+        self._flush_timer = None
+
+    def _load(self) -> List[Dict[str, any]]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = []
+        return self._entries
+
+    def record(self, color_mode: str, model_seconds: float, actual_seconds: float, kind: str = "video",
+               parallelism: int = 1):
+        """
+        記錄一次轉換；只更新記憶體，檔案在背景執行緒中延遲寫入（可在事件迴圈中呼叫）
+
+        actual_seconds 為經過時間，parallelism 為轉換時同時使用的執行緒或行程數。
+        """
+        if model_seconds <= 0:
+            return
+        with self._lock:
+            entries = self._load()
+            entries.append({
+                "time": round(time.time()),
+                "kind": kind,
+                "color_mode": color_mode,
+                "model_seconds": round(model_seconds, 6),
+                "actual_seconds": round(actual_seconds, 6),
+                "parallelism": max(1, parallelism)
+            })
+            del entries[:-HISTORY_SIZE]
+            # 短時間內的多筆記錄合併成一次寫入
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(HISTORY_FLUSH_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """把尚未寫入的記錄寫入檔案；寫入失敗只影響校正"""
+        with self._write_lock:
+            with self._lock:
+                if self._flush_timer is None:
+                    return
+                self._flush_timer.cancel()
+                self._flush_timer = None
+                # 記錄已被捨棄（例如換了路徑）時不覆寫檔案
+                if self._entries is None:
+                    return
+                entries = list(self._entries)
+                path = self.path
+            try:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, path)
+            except OSError:
+                pass
+
+    def calibration(self, color_mode: str, kind: str = "video") -> Tuple[float, int]:
+        """(校正係數, 使用的記錄數)；kind 為 "image" 或 "video"（含 benchmark.py 的記錄）"""
+        kinds = HISTORY_KINDS.get(kind, (kind,))
+        with self._lock:
+            ratios = sorted(
+                entry["actual_seconds"] * entry.get("parallelism", 1) / entry["model_seconds"]
+                for entry in self._load() if entry["color_mode"] == color_mode and entry.get("kind") in kinds
+            )
+        if len(ratios) < MIN_HISTORY:
+            return 1.0, len(ratios)
+        middle = len(ratios) // 2
+        factor = ratios[middle] if len(ratios) % 2 else (ratios[middle - 1] + ratios[middle]) / 2
+        return factor, len(ratios)
+
+# 所有端點共用；結束時寫入尚未寫入的記錄
+benchmark_history = BenchmarkHistory()
+atexit.register(benchmark_history.flush)
+
+class AdmissionRejected(Exception):
+    """請求未被接受；retry_after 為 None 時表示超過整體預算（重試也無法接受）"""
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def output_grid(width: int, source_width: int, source_height: int) -> Tuple[int, int]:
+    """輸出字元格尺寸（與 ConversionPipeline.output_size 相同，0.55 是字元的寬高比調整）"""
+    if source_width <= 0 or source_height <= 0:
+        return width, max(1, width // 2)
+    return width, max(1, int(width * (source_height / source_width) * 0.55))
+
+def cell_seconds(color_mode: str, mapping: str = "brightness", dithering: bool = False) -> float:
+    """轉換一個字元格的秒數"""
+    seconds = CELL_SECONDS.get(color_mode, CELL_SECONDS["truecolor"]) + MAPPING_CELL_SECONDS.get(mapping, 0.0)
+    if dithering:
+        seconds += DITHERING_SECONDS_PER_PIXEL * MAPPING_PIXELS.get(mapping, 1)
+    return seconds
+
+def calibrated(model_seconds: float, memory_bytes: int, color_mode: str, kind: str) -> Cost:
+    """套用記錄的校正係數"""
+    factor, _ = benchmark_history.calibration(color_mode, kind)
+    return Cost(model_seconds * factor, int(memory_bytes), model_seconds)
+
+def estimate_image_cost(width: int, source_width: int, source_height: int,
+                        color_mode: str = "grayscale", upload_bytes: int = 0,
+                        mapping: str = "brightness", dithering: bool = False) -> Cost:
+    """由輸出寬度、來源尺寸、色彩模式與映射方式估計圖片轉換成本"""
+    columns, rows = output_grid(width, source_width, source_height)
+    cells = columns * rows
+    megapixels = source_width * source_height / 1e6
+
+    cpu = (megapixels * (DECODE_SECONDS_PER_MEGAPIXEL + PRESCALE_SECONDS_PER_MEGAPIXEL)
+           + cells * cell_seconds(color_mode, mapping, dithering))
+    memory = upload_bytes + source_width * source_height * 3 + cells * CELL_BYTES.get(color_mode, CELL_BYTES["truecolor"])
+    return calibrated(cpu, memory, color_mode, "image")
+
+def sampled_frames(info: Dict[str, any], fps: int) -> int:
+    """固定取樣時會轉換的幀數"""
+    frame_interval = max(1, int(info["fps"] / fps)) if info["fps"] else 1
+    return math.ceil(max(1, info["frame_count"]) / frame_interval)
+
+def estimate_video_cost(width: int, info: Dict[str, any], fps: int,
+                        color_mode: str = "grayscale", upload_bytes: int = 0,
+                        mapping: str = "brightness", dithering: bool = False,
+                        segments: int = 1) -> Cost:
+    """
+    由 get_video_info 的結果估計影片轉換成本
+
+    所有幀都要解碼，只有取樣到的幀要轉換；轉換中的原始幀最多 RAW_FRAMES_IN_FLIGHT 幀。
+    segments 為實際使用的區段數：各區段的工作行程另外定位到起點，結果傳回前也在行程中保留一份。
+    """
+    source_width, source_height = info["width"], info["height"]
+    frame_count = max(1, info["frame_count"])
+    sampled = sampled_frames(info, fps)
+
+    columns, rows = output_grid(width, source_width, source_height)
+    cells = columns * rows
+    megapixels = source_width * source_height / 1e6
+
+    cpu = (frame_count * megapixels * DECODE_SECONDS_PER_MEGAPIXEL
+           + sampled * (megapixels * PRESCALE_SECONDS_PER_MEGAPIXEL
+                        + cells * cell_seconds(color_mode, mapping, dithering)))
+    memory = (upload_bytes + min(sampled, RAW_FRAMES_IN_FLIGHT) * source_width * source_height * 3
+              + sampled * cells * CELL_BYTES.get(color_mode, CELL_BYTES["truecolor"]))
+    if segments > 1:
+        cpu += (segments - 1) * (SEGMENT_SECONDS + SEGMENT_SEEK_FRAMES * megapixels * DECODE_SECONDS_PER_MEGAPIXEL)
+        memory += (segments - 1) * source_width * source_height * 3 + sampled * cells * CELL_BYTES.get(
+            color_mode, CELL_BYTES["truecolor"])
+    return calibrated(cpu, memory, color_mode, "video")
+
+def estimate_response_bytes(columns: int, rows: int, frames: int = 1, color_mode: str = "grayscale") -> int:
+    """未壓縮的 JSON 回應大小"""
+    return int(columns * rows * frames * RESPONSE_CELL_BYTES.get(color_mode, RESPONSE_CELL_BYTES["truecolor"]))
+
+def estimate_batch_cost(width: int, items: List[Tuple[str, bytes]], color_mode: str = "grayscale",
+                        mapping: str = "brightness", dithering: bool = False) -> Cost:
+    """批次圖片的總成本（只讀取圖檔標頭取得尺寸）"""
+    total = Cost(0.0, 0)
+    for _, content in items:
+        try:
+            source_width, source_height = Image.open(io.BytesIO(content)).size
+        except Exception:
+            # 無法辨識的項目轉換時會失敗，只計入原始大小
+            total += Cost(0.0, len(content))
+            continue
+        total += estimate_image_cost(width, source_width, source_height, color_mode, len(content), mapping, dithering)
+    return total
+
+class AdmissionController:
+    """
+    全域准入控制
+
+    依預估的 CPU 秒數與記憶體接受請求：預算內立即執行，否則依先來後到排隊，
+    佇列已滿或等待超過 max_wait 時立即拒絕（503 + Retry-After），避免突發流量讓延遲無限增加。
+    單一請求超過預算時只在沒有其他工作時執行；記憶體超過整體預算的請求直接拒絕。
+    """
+
+    def __init__(self, cpu_budget: float = CPU_BUDGET, memory_budget: int = MEMORY_BUDGET,
+                 max_queue: int = MAX_QUEUE, max_wait: float = MAX_WAIT, cores: int = CPU_CORES):
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.cores = cores
+        self.active = 0
+        self.cpu_in_use = 0.0
+        self.memory_in_use = 0
+        self._waiters = deque()
+        self.rejected = 0
+
+    def _fits(self, cost: Cost) -> bool:
+        if self.active == 0:
+            return True
+        return (self.cpu_in_use + cost.cpu_seconds <= self.cpu_budget
+                and self.memory_in_use + cost.memory_bytes <= self.memory_budget)
+
+    def _grant(self, cost: Cost):
+        self.active += 1
+        self.cpu_in_use += cost.cpu_seconds
+        self.memory_in_use += cost.memory_bytes
+
+    def retry_after(self) -> int:
+        """預估執行中與排隊中的工作完成所需秒數"""
+        pending = self.cpu_in_use + sum(cost.cpu_seconds for cost, _ in self._waiters)
+        return max(1, math.ceil(pending / self.cores))
+
+    async def acquire(self, cost: Cost):
+        """取得執行許可；無法接受時拋出 AdmissionRejected"""
+        if cost.memory_bytes > self.memory_budget:
+            self.rejected += 1
+            raise AdmissionRejected(
+                f"預估記憶體 {cost.memory_bytes // 1024 ** 2}MB 超過上限 {self.memory_budget // 1024 ** 2}MB，"
+                f"請降低寬度或幀率"
+            )
+
+        # 有人排隊時不插隊，避免大的請求一直等不到
+        if not self._waiters and self._fits(cost):
+            self._grant(cost)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("伺服器忙碌中，請稍後再試", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (cost, future)
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done():
+                # 逾時的同時剛好被接受
+                return
+            self._waiters.remove(entry)
+            self.rejected += 1
+            raise AdmissionRejected("伺服器忙碌中，請稍後再試", self.retry_after())
+        except asyncio.CancelledError:
+            if future.done():
+                self.release(cost)
+            else:
+                self._waiters.remove(entry)
+            raise
+
+    def release(self, cost: Cost):
+        """歸還預算並依序接受排隊中的請求"""
+        self.active -= 1
+        self.cpu_in_use = max(0.0, self.cpu_in_use - cost.cpu_seconds)
+        self.memory_in_use = max(0, self.memory_in_use - cost.memory_bytes)
+        while self._waiters and self._fits(self._waiters[0][0]):
+            waiting_cost, future = self._waiters.popleft()
+            self._grant(waiting_cost)
+            future.set_result(True)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, cost: Cost):
+        """async with admission.admit(cost): ..."""
+        await self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def stats(self) -> Dict[str, any]:
+        """目前的負載"""
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "cpu_in_use": round(self.cpu_in_use, 3),
+            "cpu_budget": self.cpu_budget,
+            "memory_in_use": self.memory_in_use,
+            "memory_budget": self.memory_budget,
+            "rejected": self.rejected
+        }
+
+# 所有轉換端點共用
+admission = AdmissionController()
@@ -0,0 +1,312 @@
+import json
+import numpy as np
+from typing import List, Tuple, Dict, Optional
+
+# 與 frontend/compression-methods.js 相同的方法名稱
+METHODS = ["ultraMinimal", "delta", "rle", "bitmap", "quadTree", "pattern"]
+
+# 四分樹只在字元變化不多時才可能勝出；超過此比例（行程數 / 格數）就不估算
+QUAD_TREE_MAX_RUN_RATIO = 0.25
+
+# 10 的次方，用來向量化計算十進位位數
+_POWERS_OF_TEN = 10 ** np.arange(1, 19, dtype=np.int64)
+
+def _digits(values: np.ndarray) -> int:
+    """非負整數陣列在 JSON 中的總位數"""
+    if values.size == 0:
+        return 0
+    return int(values.size + np.searchsorted(_POWERS_OF_TEN, values, side='right').sum())
+
+def _json_size(value) -> int:
+    """緊湊 JSON（UTF-8）的位元組數"""
+    return len(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+class ArtGrid:
+    """
+    字元索引格
+
+    將字元行轉為 (height, width) 的字元集索引陣列，所有編碼器與大小估算都在
+    這個陣列上以 NumPy 運算完成。出現最多的字元作為「空白」，不需要存放。
+    """
+
+    def __init__(self, art_lines: List[str]):
+        self.height = len(art_lines)
+        self.width = len(art_lines[0]) if art_lines else 0
+
+        # 每個字元恰好一個碼位：以 UTF-32 一次轉為碼位陣列
+        codepoints = np.frombuffer(''.join(art_lines).encode('utf-32-le'), dtype=np.uint32)
+        unique, inverse, counts = np.unique(codepoints, return_inverse=True, return_counts=True)
+
+        self.charset = [chr(c) for c in unique]
+        self.flat = inverse.reshape(-1).astype(np.int64)
+        self.grid = self.flat.reshape(self.height, self.width)
+        self.blank_index = int(np.argmax(counts)) if counts.size else 0
+        self.blank = self.charset[self.blank_index] if self.charset else ' '
+        self._key_sizes = np.array([_json_size(c) for c in self.charset], dtype=np.int64)
+        # 每個字元在 JSON 字串中的位元組數（不含引號）與出現次數
+        self._char_bytes = self._key_sizes - 2
+        self._counts = counts.astype(np.int64)
+
+        # 行程邊界（跨行連續，與前端 RLE 相同）
+        if self.flat.size:
+            self.run_starts = np.concatenate(([0], np.flatnonzero(self.flat[1:] != self.flat[:-1]) + 1))
+            self.run_lengths = np.diff(np.append(self.run_starts, self.flat.size))
+        else:
+            self.run_starts = self.run_lengths = np.zeros(0, dtype=np.int64)
+
+    def lines(self) -> List[str]:
+        """還原為字元行"""
+        return [''.join(self.charset[i] for i in row) for row in self.grid.tolist()]
+
+    def _positions_by_char(self) -> Tuple[np.ndarray, np.ndarray]:
+        """非空白格依 (字元, 位置) 排序後的字元索引與位置"""
+        positions = np.flatnonzero(self.flat != self.blank_index)
+        chars = self.flat[positions]
+        order = np.argsort(chars, kind='stable')
+        return chars[order], positions[order]
+
+    @staticmethod
+    def _group_starts(chars: np.ndarray) -> np.ndarray:
+        """排序後每個字元群組的起點"""
+        if chars.size == 0:
+            return chars
+        return np.concatenate(([0], np.flatnonzero(chars[1:] != chars[:-1]) + 1))
+
+    def _rle_symbol(self, index: int) -> str:
+        """RLE 中的字元；空白以 '_' 表示（字元集本身含 '_' 時保留原字元）"""
+        if index == self.blank_index and '_' not in self.charset:
+            return '_'
+        return self.charset[index]
+
+    # ---- 大小估算（不建立實際資料） ----
+
+    def estimate_sizes(self) -> Dict[str, int]:
+        """估算每種方法的緊湊 JSON 資料大小（位元組）"""
+        # ["...",...]：每行加上引號與逗號
+        sizes = {"raw": int(self._char_bytes @ self._counts) + 3 * self.height + 1 if self.height else 2}
+        chars, positions = self._positions_by_char()
+        starts = self._group_starts(chars)
+        present = chars[starts] if chars.size else chars
+
+        # {"c":[p,p,...],...}
+        keys = int((self._key_sizes[present] + 3).sum()) + max(0, present.size - 1) + 2
+        commas = max(0, positions.size - present.size)
+        sizes["ultraMinimal"] = keys + commas + _digits(positions)
+
+        deltas = positions.copy()
+        if positions.size:
+            deltas[1:] -= positions[:-1]
+            deltas[starts] = positions[starts]
+        sizes["delta"] = keys + commas + _digits(deltas)
+
+        # [["c",n],...]
+        symbols = np.array([_json_size(self._rle_symbol(i)) for i in range(len(self.charset))], dtype=np.int64)
+        runs = self.run_starts.size
+        run_chars = self.flat[self.run_starts] if runs else self.run_starts
+        sizes["rle"] = int((symbols[run_chars] + 3).sum()) + _digits(self.run_lengths) + max(0, runs - 1) + 2
+
+        # {"c":[...],"b":"...","d":n}
+        digits = self._bitmap_digits()
+        sizes["bitmap"] = (_json_size(self.charset) + 13 + self.flat.size * digits
+                           + (6 if digits > 1 else 0))
+
+        # {"patterns":[...],"encoded":[...]}
+        patterns, inverse = self._row_patterns()
+        pattern_bytes = int(self._char_bytes[patterns].sum()) + 3 * len(patterns) + 1 if len(patterns) else 2
+        sizes["pattern"] = pattern_bytes + _digits(inverse) + max(0, inverse.size - 1) + 26
+
+        if self.flat.size and runs / self.flat.size <= QUAD_TREE_MAX_RUN_RATIO:
+            sizes["quadTree"] = self._quad_tree_size()
+
+        return sizes
+
+    def _quad_tree_size(self) -> int:
+        """
+        四分樹的 JSON 大小，不建立樹
+
+        逐層以陣列處理所有節點：區塊內沒有左右或上下相鄰的字元變化時為葉節點
+        （以累計和 O(1) 判斷），否則計入 {"tl":,"tr":,"bl":,"br":} 的 25 位元組並切成四塊。
+        """
+        grid = self.grid
+        horizontal = np.zeros((self.height + 1, self.width), dtype=np.int64)
+        horizontal[1:, 1:] = np.cumsum(np.cumsum(grid[:, 1:] != grid[:, :-1], axis=0), axis=1)
+        vertical = np.zeros((self.height, self.width + 1), dtype=np.int64)
+        vertical[1:, 1:] = np.cumsum(np.cumsum(grid[1:] != grid[:-1], axis=0), axis=1)
+        # 葉節點：空白為 null，其他為字元字串
+        leaf_sizes = self._key_sizes.copy()
+        leaf_sizes[self.blank_index] = 4
+
+        x = y = np.zeros(1, dtype=np.int64)
+        w = np.array([self.width], dtype=np.int64)
+        h = np.array([self.height], dtype=np.int64)
+        size = 0
+        while x.size:
+            empty = (w <= 0) | (h <= 0)
+            size += 4 * int(empty.sum())
+            x, y, w, h = x[~empty], y[~empty], w[~empty], h[~empty]
+
+            right, bottom = x + w - 1, y + h - 1
+            changes = (horizontal[y + h, right] - horizontal[y, right] - horizontal[y + h, x] + horizontal[y, x]
+                       + vertical[bottom, x + w] - vertical[y, x + w] - vertical[bottom, x] + vertical[y, x])
+            uniform = changes == 0
+            size += int(leaf_sizes[grid[y[uniform], x[uniform]]].sum())
+
+            x, y, w, h = x[~uniform], y[~uniform], w[~uniform], h[~uniform]
+            size += 25 * x.size
+            hw, hh = (w + 1) // 2, (h + 1) // 2
+            x = np.concatenate((x, x + hw, x, x + hw))
+            y = np.concatenate((y, y, y + hh, y + hh))
+            w, h = np.concatenate((hw, w - hw, hw, w - hw)), np.concatenate((hh, hh, h - hh, h - hh))
+        return size
+
+    def _bitmap_digits(self) -> int:
+        """每格需要的十六進位位數"""
+        return max(1, len(format(max(0, len(self.charset) - 1), 'x')))
+
+    def _row_patterns(self) -> Tuple[np.ndarray, np.ndarray]:
+        """不重複的行與每行對應的索引"""
+        if not self.height:
+            return np.zeros((0, 0), dtype=np.int64), np.zeros(0, dtype=np.int64)
+        patterns, inverse = np.unique(self.grid, axis=0, return_inverse=True)
+        return patterns, inverse.reshape(-1)
+
+    # ---- 編碼 ----
+
+    def encode(self, method: str) -> Dict[str, any]:
+        """以指定方法編碼，回傳 {"type", "blank", "data"}"""
+        if method == "raw":
+            data = self.lines()
+        elif method in ("ultraMinimal", "delta"):
+            chars, positions = self._positions_by_char()
+            starts = self._group_starts(chars)
+            data = {}
+            for group, start in enumerate(starts.tolist()):
+                end = starts[group + 1] if group + 1 < starts.size else positions.size
+                values = positions[start:end]
+                if method == "delta":
+                    values = np.diff(values, prepend=0)
+                data[self.charset[chars[start]]] = values.tolist()
+        elif method == "rle":
+            symbols = [self._rle_symbol(i) for i in range(len(self.charset))]
+            data = [[symbols[c], n] for c, n in zip(self.flat[self.run_starts].tolist(), self.run_lengths.tolist())]
+        elif method == "bitmap":
+            digits = self._bitmap_digits()
+            hex_digits = np.array(list('0123456789abcdef'))
+            shifts = 4 * np.arange(digits - 1, -1, -1)
+            nibbles = (self.flat[:, None] >> shifts) & 0xF
+            data = {"c": self.charset, "b": ''.join(hex_digits[nibbles.ravel()].tolist())}
+            if digits > 1:
+                data["d"] = digits
+        elif method == "quadTree":
+            data = self._quad_tree()
+        elif method == "pattern":
+            patterns, inverse = self._row_patterns()
+            data = {
+                "patterns": [''.join(self.charset[i] for i in row) for row in patterns.tolist()],
+                "encoded": inverse.tolist()
+            }
+        else:
+            raise ValueError(f"未知的壓縮方法: {method}")
+
+        encoded = {"type": method, "blank": self.blank, "data": data}
+        if method == "rle" and self._rle_symbol(self.blank_index) != self.blank:
+            # 標明 RLE 中代表空白的記號（字元集含 '_' 時不替換，'_' 就是原字元）
+            encoded["marker"] = self._rle_symbol(self.blank_index)
+        return encoded
+
+    def _quad_tree(self):
+        """四分樹：均勻區塊存字元（空白為 null），否則切成四塊"""
+        grid = self.grid
+        charset = self.charset
+        blank = self.blank_index
+
+        def build(x, y, w, h):
+            if w <= 0 or h <= 0:
+                return None
+            region = grid[y:y + h, x:x + w]
+            first = region[0, 0]
+            if (region == first).all():
+                return None if first == blank else charset[first]
+            hw, hh = (w + 1) // 2, (h + 1) // 2
+            return {
+                "tl": build(x, y, hw, hh),
+                "tr": build(x + hw, y, w - hw, hh),
+                "bl": build(x, y + hh, hw, h - hh),
+                "br": build(x + hw, y + hh, w - hw, h - hh)
+            }
+
+        return build(0, 0, self.width, self.height)
+
+def encode_art(art_lines: List[str], method: str = "auto") -> Dict[str, any]:
+    """
+    壓縮字元藝術
+
+    Args:
+        art_lines: 字元行
+        method: 壓縮方法，"auto" 會估算每種方法的大小並選擇最小者（包含不壓縮的 "raw"）
+
+    Returns:
+        {"type": 方法, "blank": 省略的字元, "data": 壓縮資料, "size": 估算大小}
+    """
+    grid = ArtGrid(art_lines)
+    sizes = grid.estimate_sizes()
+    if method == "auto":
+        method = min(sizes, key=sizes.get)
+    encoded = grid.encode(method)
+    if method in sizes:
+        encoded["size"] = sizes[method]
+    return encoded
+
+def decode_art(encoded: Dict[str, any], width: int, height: int) -> List[str]:
+    """解碼 encode_art 的結果（主要供測試與 Python 端使用）"""
+    method, data = encoded["type"], encoded["data"]
+    blank = encoded.get("blank", ' ')
+
+    if method == "raw":
+        return list(data)
+
+    cells = np.full(width * height, blank, dtype='<U1')
+    if method in ("ultraMinimal", "delta"):
+        for char, values in data.items():
+            positions = np.asarray(values, dtype=np.int64)
+            if method == "delta":
+                positions = np.cumsum(positions)
+            cells[positions] = char
+    elif method == "rle":
+        marker = encoded.get("marker")
+        symbols = [blank if char == marker else char for char, _ in data]
+        cells = np.repeat(np.array(symbols, dtype='<U1'), [n for _, n in data])
+    elif method == "bitmap":
+        digits = data.get("d", 1)
+        values = np.array([int(data["b"][i:i + digits], 16) for i in range(0, len(data["b"]), digits)])
+        cells = np.array(data["c"], dtype='<U1')[values]
+    elif method == "quadTree":
+        grid = cells.reshape(height, width)
+
+        def fill(node, x, y, w, h):
+            if w <= 0 or h <= 0 or node is None:
+                return
+            if isinstance(node, str):
+                grid[y:y + h, x:x + w] = node
+                return
+            hw, hh = (w + 1) // 2, (h + 1) // 2
+            fill(node["tl"], x, y, hw, hh)
+            fill(node["tr"], x + hw, y, w - hw, hh)
+            fill(node["bl"], x, y + hh, hw, h - hh)
+            fill(node["br"], x + hw, y + hh, w - hw, h - hh)
+
+        fill(data, 0, 0, width, height)
+    elif method == "pattern":
+        return [data["patterns"][i] for i in data["encoded"]]
+    else:
+        raise ValueError(f"未知的壓縮方法: {method}")
+
+    return cells.reshape(height, width).view(f'<U{width}').ravel().tolist()
+
+def apply_encoding(result: Dict[str, any], method: Optional[str]) -> Dict[str, any]:
+    """回傳 "art" 換成 "encoded" 的新結果（不修改傳入的結果；method 為 None/"none" 時原樣回傳）"""
+    if not method or method == "none" or "art" not in result:
+        return result
+    encoded = {key: value for key, value in result.items() if key != "art"}
+    encoded["encoded"] = encode_art(result["art"], method)
+    return encoded
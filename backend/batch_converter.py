@@ -0,0 +1,124 @@
+import io
+import os
+import tarfile
+import zipfile
+from typing import List, Tuple, Dict, Iterator
+from concurrent.futures import as_completed
+
+from enhanced_converter import EnhancedImageConverter, ConversionOptions
+from worker_pool import shared_pool
+from json_body import dumps
+
+# 壓縮檔中會被當作圖片處理的副檔名
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+
+# 一批的項目數與展開後的總大小上限（可用環境變數覆寫）
+BATCH_MAX_ITEMS = int(os.environ.get("CHARACTER_ART_BATCH_MAX_ITEMS", 1000))
+BATCH_MAX_BYTES = int(os.environ.get("CHARACTER_ART_BATCH_MAX_BYTES", 512 * 1024 ** 2))
+
+def _is_image_name(name: str) -> bool:
+    """判斷壓縮檔內的檔名是否為圖片（略過隱藏檔與 macOS 中繼資料）"""
+    base = os.path.basename(name)
+    if not base or base.startswith('.') or '__MACOSX' in name:
+        return False
+    return os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+class BatchTooLarge(Exception):
+    """批次的項目數或解壓縮後大小超過上限"""
+
+def expand_upload(filename: str, content: bytes, max_items: int = BATCH_MAX_ITEMS,
+                  max_bytes: int = BATCH_MAX_BYTES) -> List[Tuple[str, bytes]]:
+    """
+    展開上傳的檔案
+
+    Args:
+        filename: 上傳檔名
+        content: 檔案內容
+        max_items: 最多展開的項目數
+        max_bytes: 展開後內容的總大小上限
+
+    Returns:
+        (檔名, 內容) 列表；zip/tar 壓縮檔會展開為其中的圖片，其他檔案原樣回傳
+
+    Raises:
+        BatchTooLarge: 超過項目數或大小上限（壓縮檔在解壓縮前依標頭的大小檢查）
+    """
+    buffer = io.BytesIO(content)
+
+    if zipfile.is_zipfile(buffer):
+        with zipfile.ZipFile(buffer) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir() and _is_image_name(info.filename)]
+            # 讀取時不會超過標頭宣告的大小
+            _check_limits(len(members), sum(info.file_size for info in members), max_items, max_bytes)
+            return [(info.filename, archive.read(info)) for info in members]
+
+    buffer.seek(0)
+    try:
+        with tarfile.open(fileobj=buffer, mode='r:*') as archive:
+            members = [member for member in archive.getmembers() if member.isfile() and _is_image_name(member.name)]
+            _check_limits(len(members), sum(member.size for member in members), max_items, max_bytes)
+            return [(member.name, archive.extractfile(member).read()) for member in members]
+    except tarfile.TarError:
+        pass
+
+    _check_limits(1, len(content), max_items, max_bytes)
+    return [(filename, content)]
+
+def _check_limits(items: int, size: int, max_items: int, max_bytes: int):
+    if items > max_items:
+        raise BatchTooLarge(f"批次最多 {BATCH_MAX_ITEMS} 張圖片")
+    if size > max_bytes:
+        raise BatchTooLarge(f"批次解壓縮後的大小超過上限（{BATCH_MAX_BYTES // 1024 ** 2}MB）")
+
+class BatchImageConverter:
+    """批次圖片轉換器：所有項目共用同一個轉換器（字元集、查找表等），在共用執行池中並行處理"""
+
+    def __init__(self, options: ConversionOptions, num_threads: int = 4):
+        self.options = options
+        self.num_threads = max(1, num_threads)
+        self.converter = EnhancedImageConverter(options)
+
+    def convert_item(self, index: int, filename: str, content: bytes) -> Dict[str, any]:
+        """轉換單一項目；錯誤只影響該項目"""
+        try:
+            result = self.converter.convert_to_art(io.BytesIO(content))
+            return {
+                "index": index,
+                "filename": filename,
+                "status": "success",
+                "data": result
+            }
+        except Exception as e:
+            return {
+                "index": index,
+                "filename": filename,
+                "status": "error",
+                "message": f"處理圖片時發生錯誤: {str(e)}"
+            }
+
+    def convert_all(self, items: List[Tuple[str, bytes]]) -> Iterator[Dict[str, any]]:
+        """並行轉換所有項目，依完成順序逐一產生結果，最後產生一筆摘要"""
+        succeeded = 0
+        # 客戶端中斷時 job 關閉，不再處理尚未開始的項目
+        with shared_pool.job(hint=self.num_threads) as job:
+            futures = [
+                job.submit(self.convert_item, index, filename, content)
+                for index, (filename, content) in enumerate(items)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                if result["status"] == "success":
+                    succeeded += 1
+                yield result
+
+        yield {
+            "status": "done",
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded
+        }
+
+    def stream_ndjson(self, items: List[Tuple[str, bytes]]) -> Iterator[bytes]:
+        """以 NDJSON（每行一個 JSON 物件）串流結果"""
+        for result in self.convert_all(items):
+            yield dumps(result) + b"\n"
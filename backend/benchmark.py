@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+量測本機的轉換速度，寫入成本估計使用的記錄
+
+以 caca.jpg 平移產生的短片，對每種色彩模式與幾種寬度實際轉換，記錄成本模型的估計與
+實際耗時（與 API 請求寫入相同的記錄）。/api/v2/probe 與准入控制依這些記錄校正 CPU 時間。
+
+Usage:
+    python backend/benchmark.py [--widths 80 160] [--frames 48] [--rounds 1]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from enhanced_converter import EnhancedVideoConverter, ConversionOptions
+from video_converter import get_video_info
+from admission import benchmark_history, estimate_video_cost
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "caca.jpg")
+
+COLOR_MODES = ["grayscale", "ansi", "ansi256", "truecolor"]
+
+def make_clip(path: str, frames: int, size=(640, 360), fps: int = 24):
+    """以範例圖片平移產生測試影片"""
+    image = cv2.imread(SAMPLE_IMAGE)
+    image = cv2.resize(image, (size[0] * 2, size[1]))
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    for i in range(frames):
+        offset = i * size[0] // max(1, frames)
+        writer.write(np.ascontiguousarray(image[:, offset:offset + size[0]]))
+    writer.release()
+
+def main(argv=None):
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Record local conversion timings for cost estimation")
+    parser.add_argument("--widths", type=int, nargs="+", default=[80, 160])
+    parser.add_argument("--frames", type=int, default=48)
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "benchmark.avi")
+        make_clip(path, args.frames)
+        info = get_video_info(path)
+
+        for _ in range(args.rounds):
+            for color_mode in COLOR_MODES:
+                for width in args.widths:
+                    cost = estimate_video_cost(width, info, 24, color_mode)
+                    converter = EnhancedVideoConverter(ConversionOptions(width=width, color_mode=color_mode))
+                    started = time.perf_counter()
+                    converter.convert_video(path, fps=24)
+                    actual = time.perf_counter() - started
+                    benchmark_history.record(color_mode, cost.model_seconds, actual, "benchmark", converter.parallelism)
+                    print(f"{color_mode:>9} {width:>4} cols: model {cost.model_seconds:.3f}s, actual {actual:.3f}s")
+
+    for color_mode in COLOR_MODES:
+        factor, samples = benchmark_history.calibration(color_mode)
+        print(f"{color_mode:>9}: calibration x{factor:.2f} ({samples} samples)")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
 import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+from PIL import Image, ImageFilter
 import cv2
-from typing import List, Tuple, Optional, Dict, Union
+from collections import deque
+from typing import List, Tuple, Optional, Dict, Union, BinaryIO
 import colorsys
-from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from concurrent.futures import ProcessPoolExecutor, CancelledError, wait, FIRST_EXCEPTION
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import threading
+import os
+import math
+import time
+
+from glyph_index import GlyphIndex
+from worker_pool import shared_pool, CancellationToken, ConversionCancelled
+from json_body import frame_json, prepend_fields
 
 # 擴展的字元集合（從亮到暗排列 - 黑色映射到空白，白色映射到筆畫最多的字元）
 CHARACTER_SETS = {
@@ -61,6 +71,11 @@ class ConversionOptions:
     invert: bool = False
     dithering: bool = False
     custom_chars: Optional[str] = None
+    gamma: float = 1.0  # >1 提亮中間調，<1 壓暗
+    auto_levels: bool = False  # 自動色階（拉伸 1%-99% 亮度範圍）
+    mapping: str = "brightness"  # brightness, shape（依字形子格覆蓋率匹配）, braille（2x4 點陣）, halfblock（上下兩像素）
+    shape_grid: Tuple[int, int] = (2, 3)  # 字形匹配的子格數 (欄, 列)
+    prescale: int = 3  # 前處理前先以面積平均縮小到輸出寬度的倍數（0 = 在原始解析度前處理）
     
 class ColorPalette:
     """ANSI 色彩調色板"""
@@ -106,60 +121,415 @@ class ColorPalette:
         g = 5 * round(g / 255 * 5)
         b = 5 * round(b / 255 * 5)
         return 16 + (36 * (r // 51)) + (6 * (g // 51)) + (b // 51)
+    
+    @staticmethod
+    def map_ansi_colors(rgb: np.ndarray) -> np.ndarray:
+        """向量化版本的 get_ansi_color，輸入 (..., 3) 陣列，回傳顏色名稱陣列"""
+        names = list(ColorPalette.ANSI_COLORS.keys())
+        palette = np.array(list(ColorPalette.ANSI_COLORS.values()), dtype=np.int32)
+        diff = rgb.astype(np.int32)[..., None, :] - palette
+        distances = np.einsum('...ij,...ij->...i', diff, diff)
+        return np.array(names, dtype=object)[np.argmin(distances, axis=-1)]
+    
+    @staticmethod
+    def map_ansi256_colors(rgb: np.ndarray) -> np.ndarray:
+        """向量化版本的 get_ansi256_color，輸入 (..., 3) 陣列，回傳色碼陣列"""
+        rgb = rgb.astype(np.float64)
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        
+        # 灰階
+        gray_codes = np.where(r < 8, 16, np.where(r > 248, 231, np.round((r - 8) / 247 * 24) + 232))
+        
+        # 彩色
+        cube = [(5 * np.round(c / 255 * 5)) // 51 for c in (r, g, b)]
+        color_codes = 16 + 36 * cube[0] + 6 * cube[1] + cube[2]
+        
+        is_gray = (r == g) & (g == b)
+        return np.where(is_gray, gray_codes, color_codes).astype(np.int64)
 
-class EnhancedImageConverter:
-    """增強版圖片轉換器"""
+
+def resolve_character_set(options: ConversionOptions) -> List[str]:
+    """依選項取得字元集"""
+    if options.custom_chars:
+        return list(options.custom_chars)
+    return CHARACTER_SETS.get(options.art_type, CHARACTER_SETS["block"])
+
+
+# 感知亮度權重（RGB）
+LUMA_WEIGHTS = np.array([0.2989, 0.5870, 0.1140])
+
+# 點字 2x4 點陣的位元值（列 x 欄）：點 1-3 在左欄、點 4-6 在右欄、點 7/8 在最下列
+BRAILLE_BITS = np.array([
+    [0x01, 0x08],
+    [0x02, 0x10],
+    [0x04, 0x20],
+    [0x40, 0x80],
+], dtype=np.intp)
+
+# 全部 256 個點字字元，索引即點位元
+BRAILLE_CHARS = [chr(0x2800 + bits) for bits in range(256)]
+
+# 半格模式使用的上半方塊字元
+HALF_BLOCK = '▀'
+
+# 與 PIL ImageFilter.SHARPEN 相同的卷積核
+SHARPEN_KERNEL = np.array([
+    [-2, -2, -2],
+    [-2, 32, -2],
+    [-2, -2, -2],
+], dtype=np.float32) / 16
+
+
+# 單張大圖切成列帶平行處理的門檻（輸出字元格數）與每帶最少的字元列數
+BAND_MIN_CELLS = 200_000
+MIN_BAND_ROWS = 16
+
+# 鄰域濾鏡在列帶上下需要多讀的像素列數（多讀的列濾波後裁掉，結果與整張處理相同）
+FILTER_HALO = {"denoise": 1, "sharpen": 1}
+
+# 抖動每次以波前處理的像素列數（限制斜切緩衝區的大小）
+DITHER_BLOCK_ROWS = 512
+
+class ConversionPipeline:
+    """
+    轉換管線
+    
+    將 ConversionOptions 編譯為固定的處理階段列表，略過不會改變影像的階段
+    （例如 contrast=1.0），並依輸出尺寸預先配置緩衝區，可在多幀間重複使用。
+    圖片（v1/v2）與影片幀都經由同一條管線處理。
+    """
     
     def __init__(self, options: ConversionOptions):
         self.options = options
-        self._setup_character_set()
+        self.color = options.color_mode != "grayscale"
+        self.chars = resolve_character_set(options)
+        self._glyphs = np.array(self.chars)
+        
+        # 灰度值 -> 字元索引 的查找表（黑色 -> 索引0，白色 -> 最後索引）
+        self._index_lut = np.arange(256, dtype=np.intp) * (len(self.chars) - 1) // 255
+        
+        # 字形匹配：每個字元格取樣 cols x rows 個子格
+        self.glyph_index = None
+        self.samples = (1, 1)
+        if options.mapping == "shape":
+            self.glyph_index = GlyphIndex.for_chars(self.chars, tuple(options.shape_grid))
+            self.samples = self.glyph_index.grid
+        elif options.mapping == "braille":
+            # 點字模式：每個字元格 2x4 個點，字元為 U+2800 + 點位元
+            self.chars = BRAILLE_CHARS
+            self._glyphs = np.array(self.chars)
+            self.samples = (2, 4)
+        elif options.mapping == "halfblock":
+            # 半格模式：每個字元格上下兩個像素，前景色為上半、背景色為下半
+            self.chars = [HALF_BLOCK]
+            self._glyphs = np.array(self.chars)
+            self.samples = (1, 2)
+        
+        # 色調查找表快取：(平均亮度, 色階下限, 色階上限) -> 查找表
+        self._tone_cache: Dict[Tuple[int, int, int], np.ndarray] = {}
+        
+        self.image_stages = self._compile_image_stages()
+        self.array_stages = self._compile_array_stages()
+        self.frame_stages = self._compile_frame_stages()
+        self._local = threading.local()
     
-    def _setup_character_set(self):
-        """設置字元集"""
-        if self.options.custom_chars:
-            self.chars = list(self.options.custom_chars)
+    @property
+    def has_tone(self) -> bool:
+        """是否有任何逐點色調調整"""
+        options = self.options
+        return (options.contrast != 1.0 or options.brightness != 1.0 or options.gamma != 1.0
+                or options.invert or options.auto_levels)
+    
+    @property
+    def stage_names(self) -> List[str]:
+        """已編譯的階段名稱（依執行順序）"""
+        prescale = ["prescale"] if self.options.prescale > 0 else []
+        return prescale + [name for name, _ in self.image_stages] + ["resize"] + \
+            [name for name, _ in self.array_stages] + ["map"]
+    
+    def _compile_image_stages(self) -> List[Tuple[str, callable]]:
+        """編譯影像前處理階段（PIL）"""
+        options = self.options
+        stages = []
+        
+        if options.denoise:
+            stages.append(("denoise", lambda image: image.filter(ImageFilter.MedianFilter(size=3))))
+        if options.sharpen:
+            stages.append(("sharpen", lambda image: image.filter(ImageFilter.SHARPEN)))
+        if self.has_tone:
+            # 對比度、亮度、伽瑪、自動色階、反轉合併為單次查表
+            stages.append(("tone", self._apply_image_tone))
+        
+        return stages
+    
+    def _compile_frame_stages(self) -> List[Tuple[str, callable]]:
+        """編譯影片幀的前處理階段（OpenCV，對應 image_stages）"""
+        options = self.options
+        stages = []
+        
+        if options.denoise:
+            stages.append(("denoise", lambda frame: cv2.medianBlur(frame, 3)))
+        if options.sharpen:
+            stages.append(("sharpen", lambda frame: cv2.filter2D(frame, -1, SHARPEN_KERNEL)))
+        if self.has_tone:
+            stages.append(("tone", self._apply_frame_tone))
+        
+        return stages
+    
+    def _compile_array_stages(self) -> List[Tuple[str, callable]]:
+        """編譯縮放後的陣列階段（NumPy/OpenCV）"""
+        stages = []
+        
+        if self.options.edge_detection:
+            stages.append(("edges", self.apply_edge_detection))
+        if self.options.dithering:
+            stages.append(("dither", self.apply_dithering))
+        
+        return stages
+    
+    def output_size(self, source_width: int, source_height: int) -> Tuple[int, int]:
+        """計算輸出字元格尺寸（0.55 是字元的寬高比調整）"""
+        height = int(self.options.width * (source_height / source_width) * 0.55)
+        return self.options.width, max(1, height)
+    
+    def sample_size(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        """縮放目標尺寸：字元格尺寸乘上每格的子格取樣數"""
+        return size[0] * self.samples[0], size[1] * self.samples[1]
+    
+    def _buffers(self, shape: Tuple[int, int]) -> Dict[str, np.ndarray]:
+        """取得此執行緒對應輸出尺寸的緩衝區（首次使用時配置）"""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None or buffers["index"].shape != shape:
+            buffers = {
+                "luma": np.empty(shape, dtype=np.float64),
+                "index": np.empty(shape, dtype=np.intp),
+                "glyphs": np.empty(shape, dtype=self._glyphs.dtype),
+            }
+            self._local.buffers = buffers
+        return buffers
+    
+    def band_count(self, size: Tuple[int, int]) -> int:
+        """單張圖片切成的列帶數（小圖或單核心時為 1）"""
+        columns, rows = size
+        if columns * rows < BAND_MIN_CELLS:
+            return 1
+        return max(1, min(shared_pool.size, rows // MIN_BAND_ROWS))
+    
+    def prescale_size(self, source_width: int, source_height: int) -> Optional[Tuple[int, int]]:
+        """計算前處理用的中間尺寸；來源不比它大時回傳 None"""
+        if self.options.prescale <= 0:
+            return None
+        
+        width = self.options.width * self.samples[0] * self.options.prescale
+        if source_width <= width:
+            return None
+        
+        height = max(1, round(source_height * width / source_width))
+        return width, height
+    
+    def open_image(self, image_path: Union[str, BinaryIO]) -> Tuple[Image.Image, Tuple[int, int]]:
+        """
+        開啟圖片（檔案路徑或檔案物件）並要求解碼器直接輸出縮小後的影像
+        
+        JPEG 使用 draft() 在 DCT 階段縮小（1/2、1/4、1/8），其他格式解碼後以
+        reduce() 做整數倍縮小；兩者都選擇仍不小於前處理尺寸的最大縮小倍數。
+        回傳圖片與原始尺寸（用於計算輸出字元格）。
+        """
+        image = Image.open(image_path)
+        source_size = image.size
+        
+        target = self.prescale_size(*source_size)
+        if not target:
+            return image, source_size
+        
+        target_mode = 'RGB' if self.color else 'L'
+        if image.format == 'JPEG':
+            image.draft(target_mode, target)
         else:
-            self.chars = CHARACTER_SETS.get(self.options.art_type, CHARACTER_SETS["block"])
+            factor = min(source_size[0] // target[0], source_size[1] // target[1])
+            if factor >= 2:
+                if image.mode != target_mode:
+                    image = image.convert(target_mode)
+                image = image.reduce(factor)
         
-        # 根據字元密度排序（如果有定義的話）
-        self.char_densities = []
-        for char in self.chars:
-            density = CHARACTER_DENSITY.get(char, len(self.char_densities) / len(self.chars))
-            self.char_densities.append(density)
+        return image, source_size
     
-    def preprocess_image(self, image: Image.Image) -> Image.Image:
-        """影像前處理"""
-        # 轉換為 RGB（如果需要）
-        if image.mode != 'RGB' and self.options.color_mode != 'grayscale':
-            image = image.convert('RGB')
-        
-        # 降噪
-        if self.options.denoise:
-            image = image.filter(ImageFilter.MedianFilter(size=3))
-        
-        # 銳化
-        if self.options.sharpen:
-            image = image.filter(ImageFilter.SHARPEN)
-        
-        # 調整對比度
-        if self.options.contrast != 1.0:
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(self.options.contrast)
-        
-        # 調整亮度
-        if self.options.brightness != 1.0:
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(self.options.brightness)
-        
-        # 反轉顏色
-        if self.options.invert:
-            if image.mode == 'L':
-                image = ImageOps.invert(image)
-            else:
-                image = ImageOps.invert(image.convert('RGB'))
+    def preprocess(self, image: Image.Image, bands: int = 1) -> Image.Image:
+        """執行影像前處理階段（bands > 1 時開頭的鄰域濾鏡以列帶平行處理）"""
+        # 灰階模式先轉為單通道，後續各階段只需處理三分之一的資料
+        target_mode = 'RGB' if self.color else 'L'
+        if image.mode != target_mode:
+            image = image.convert(target_mode)
+        
+        # 先以面積平均縮小到輸出格的數倍，濾鏡只需處理小圖，
+        # 前處理時間不再隨來源解析度增長。
+        # 品質容差：與 prescale=0（原始解析度前處理）相比，每格字元索引最多相差 1 階，
+        # 平均差異低於 0.05 階（prescale=3，含降噪/銳化/對比度/亮度）
+        size = self.prescale_size(image.width, image.height)
+        if size:
+            image = image.resize(size, Image.Resampling.BOX)
+        
+        stages = self.image_stages
+        filters = 0
+        while filters < len(stages) and stages[filters][0] in FILTER_HALO:
+            filters += 1
+        if bands > 1 and filters:
+            image = self._filter_bands(image, stages[:filters], bands)
+            stages = stages[filters:]
+        
+        for _, stage in stages:
+            image = stage(image)
         
         return image
     
+    def _filter_bands(self, image: Image.Image, stages: List[Tuple[str, callable]], bands: int) -> Image.Image:
+        """
+        以列帶平行套用鄰域濾鏡
+        
+        每帶上下多取各濾鏡半徑總和的列，濾波後裁掉；接縫處讀到的鄰居與整張處理時相同，
+        結果逐像素一致。PIL 的濾鏡會釋放 GIL，各帶可同時在不同核心上執行。
+        """
+        halo = sum(FILTER_HALO[name] for name, _ in stages)
+        bounds = np.linspace(0, image.height, min(bands, image.height) + 1).astype(int).tolist()
+        image.load()
+        
+        def filter_band(span: Tuple[int, int]) -> Image.Image:
+            top, bottom = span
+            start, end = max(0, top - halo), min(image.height, bottom + halo)
+            band = image.crop((0, start, image.width, end))
+            for _, stage in stages:
+                band = stage(band)
+            return band.crop((0, top - start, image.width, bottom - start))
+        
+        spans = list(zip(bounds, bounds[1:]))
+        result = Image.new(image.mode, image.size)
+        for (top, _), band in zip(spans, shared_pool.map(filter_band, spans, priority=True)):
+            result.paste(band, (0, top))
+        return result
+    
+    def convert_file(self, image_path: Union[str, BinaryIO], bands: Optional[int] = None) -> Dict[str, any]:
+        """執行完整管線：圖片檔案 -> 字元藝術（使用縮小解碼）"""
+        image, source_size = self.open_image(image_path)
+        return self.convert_image(image, source_size, bands)
+    
+    def convert_image(self, image: Image.Image, source_size: Optional[Tuple[int, int]] = None,
+                      bands: Optional[int] = None) -> Dict[str, any]:
+        """
+        執行完整管線：PIL 圖片 -> 字元藝術
+        
+        輸出很大時（例如 1000 欄以上的海報）鄰域濾鏡與字元映射切成列帶，在共用執行池中平行處理；
+        bands 預設依輸出尺寸與池的大小決定。縮放與抖動仍整張處理。
+        """
+        # 輸出尺寸以原始比例計算，不受縮小解碼與中間縮放的取整影響
+        size = self.output_size(*(source_size or image.size))
+        bands = self.band_count(size) if bands is None else bands
+        
+        image = self.preprocess(image, bands)
+        image = image.resize(self.sample_size(size), Image.Resampling.LANCZOS)
+        
+        pixels = np.asarray(image)
+        for _, stage in self.array_stages:
+            pixels = stage(pixels)
+        
+        return self.render_bands(pixels, bands)
+    
+    def convert_frame(self, frame: np.ndarray) -> Dict[str, any]:
+        """執行完整管線：OpenCV 幀（BGR 或灰度）-> 字元藝術，全程不經過 PIL"""
+        size = self.output_size(frame.shape[1], frame.shape[0])
+        
+        # 灰階模式直接由 BGR 取得灰度，縮放與濾鏡只需處理單通道
+        if frame.ndim == 3 and not self.color:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+        # 先縮小再套用濾鏡
+        if self.frame_stages:
+            prescale = self.prescale_size(frame.shape[1], frame.shape[0])
+            if prescale:
+                frame = cv2.resize(frame, prescale, interpolation=cv2.INTER_AREA)
+            for _, stage in self.frame_stages:
+                frame = stage(frame)
+        
+        pixels = cv2.resize(frame, self.sample_size(size), interpolation=cv2.INTER_AREA)
+        if pixels.ndim == 3:
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB)
+        
+        for _, stage in self.array_stages:
+            pixels = stage(pixels)
+        
+        return self.render(pixels)
+    
+    def _apply_image_tone(self, image: Image.Image) -> Image.Image:
+        """以單一查找表套用所有逐點色調調整（PIL 圖片）"""
+        histogram = None
+        if self.options.contrast != 1.0 or self.options.auto_levels:
+            gray = image if image.mode == 'L' else image.convert('L')
+            histogram = np.array(gray.histogram(), dtype=np.int64)
+        
+        lut = self.tone_lut(histogram)
+        return image.point(lut.tolist() * len(image.getbands()))
+    
+    def _apply_frame_tone(self, frame: np.ndarray) -> np.ndarray:
+        """以單一查找表套用所有逐點色調調整（OpenCV 幀）"""
+        histogram = None
+        if self.options.contrast != 1.0 or self.options.auto_levels:
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            histogram = np.bincount(gray.ravel(), minlength=256)
+        
+        return cv2.LUT(frame, self.tone_lut(histogram))
+    
+    def tone_lut(self, histogram: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        取得 uint8 -> uint8 色調查找表
+        
+        依序套用自動色階、對比度、亮度、伽瑪與反轉；對比度與亮度每一步都像
+        PIL ImageEnhance 一樣截斷並限制在 0-255，結果與原本逐次處理一致。
+        對比度與自動色階需要影像的亮度直方圖，查找表依統計量快取。
+        """
+        options = self.options
+        mean, low, high = 0, 0, 255
+        
+        if histogram is not None:
+            total = max(1, int(histogram.sum()))
+            if options.auto_levels:
+                # 忽略兩端各 1% 的像素
+                cumulative = np.cumsum(histogram)
+                low = int(np.searchsorted(cumulative, total * 0.01, side='right'))
+                high = int(np.searchsorted(cumulative, total * 0.99))
+            if options.contrast != 1.0:
+                levels = self._levels(np.arange(256, dtype=np.float32), low, high)
+                mean = int(float(np.dot(histogram, levels)) / total + 0.5)
+        
+        key = (mean, low, high)
+        lut = self._tone_cache.get(key)
+        if lut is None:
+            lut = self._build_tone_lut(mean, low, high)
+            if len(self._tone_cache) >= 256:
+                self._tone_cache.clear()
+            self._tone_cache[key] = lut
+        return lut
+    
+    def _levels(self, values: np.ndarray, low: int, high: int) -> np.ndarray:
+        """將 [low, high] 線性拉伸到 [0, 255]"""
+        if not self.options.auto_levels or high <= low:
+            return values
+        return np.floor(np.clip((values - low) * 255.0 / (high - low), 0, 255))
+    
+    def _build_tone_lut(self, mean: int, low: int, high: int) -> np.ndarray:
+        """建立 256 項查找表"""
+        options = self.options
+        lut = self._levels(np.arange(256, dtype=np.float32), low, high)
+        
+        if options.contrast != 1.0:
+            lut = np.floor(np.clip(mean + options.contrast * (lut - mean), 0, 255))
+        if options.brightness != 1.0:
+            lut = np.floor(np.clip(options.brightness * lut, 0, 255))
+        if options.gamma != 1.0:
+            lut = np.floor(255.0 * (lut / 255.0) ** (1.0 / options.gamma) + 0.5)
+        if options.invert:
+            lut = 255 - lut
+        
+        return lut.astype(np.uint8)
+    
     def apply_edge_detection(self, image: np.ndarray) -> np.ndarray:
         """應用邊緣偵測"""
         if len(image.shape) == 3:
@@ -171,46 +541,220 @@ class EnhancedImageConverter:
         edges = cv2.Canny(gray, self.options.edge_threshold, self.options.edge_threshold * 2)
         
         # 反轉邊緣（讓邊緣變成白色）
-        edges = 255 - edges
-        
-        return edges
+        return 255 - edges
     
     def apply_dithering(self, image: np.ndarray) -> np.ndarray:
-        """應用抖動算法（Floyd-Steinberg）"""
+        """
+        應用抖動算法（Floyd-Steinberg）
+        
+        以波前順序計算：每一列落後上一列兩個像素，同一步的像素互不相依，整步以向量運算處理，
+        步數約為 寬 + 2 x 高 而不是逐像素迴圈。每個像素收到誤差的順序（含每次的截斷）與
+        逐列掃描相同，結果逐像素一致。
+        """
         if len(image.shape) == 3:
             # 轉換為灰度
-            gray = np.dot(image[...,:3], [0.2989, 0.5870, 0.1140])
+            gray = np.dot(image[..., :3], LUMA_WEIGHTS)
         else:
-            gray = image.copy()
+            gray = image.astype(np.float64)
         
-        # 轉換為 float 避免溢出
-        gray = gray.astype(np.float64)
         h, w = gray.shape
         
-        for y in range(h):
-            for x in range(w):
-                old_pixel = gray[y, x]
-                new_pixel = 255.0 if old_pixel > 128 else 0.0
-                gray[y, x] = new_pixel
-                error = old_pixel - new_pixel
+        # 分塊處理；下一塊的第一列一起放進斜切緩衝區，接收本塊最後一列往下擴散的誤差
+        for top in range(0, h, DITHER_BLOCK_ROWS):
+            rows = min(DITHER_BLOCK_ROWS, h - top)
+            block = gray[top:top + rows + 1]
+            
+            # 斜切排列：像素 (y, x) 存在 skewed[x + 2y, y]，第 t 步的像素是 skewed[t] 的連續一段；
+            # 多配置的列與行接住超出影像邊界的誤差
+            steps = w + 2 * (rows - 1)
+            skewed = np.zeros((steps + 3, rows + 1))
+            ys = np.arange(block.shape[0])[:, None]
+            diagonal = (np.arange(w)[None, :] + 2 * ys, ys)
+            skewed[diagonal] = block
+            
+            for t in range(steps):
+                first, last = max(0, (t - w) // 2 + 1), min(rows - 1, t // 2)
+                current = skewed[t, first:last + 1]
+                old_pixels = current.copy()
+                new_pixels = np.where(old_pixels > 128, 255.0, 0.0)
+                current[:] = new_pixels
+                error = old_pixels - new_pixels
                 
-                # 分配誤差到周圍像素
-                if x + 1 < w:
-                    gray[y, x + 1] = np.clip(gray[y, x + 1] + error * 7 / 16, 0, 255)
-                if y + 1 < h:
-                    if x > 0:
-                        gray[y + 1, x - 1] = np.clip(gray[y + 1, x - 1] + error * 3 / 16, 0, 255)
-                    gray[y + 1, x] = np.clip(gray[y + 1, x] + error * 5 / 16, 0, 255)
-                    if x + 1 < w:
-                        gray[y + 1, x + 1] = np.clip(gray[y + 1, x + 1] + error * 1 / 16, 0, 255)
+                # 分配誤差到周圍像素：下一列的右下、正下、左下，最後才是同一列的右方
+                # （左下與右方可能落在同一像素，逐列掃描時上一列的誤差先到）
+                below = slice(first + 1, last + 2)
+                for offset, weight in ((3, 1), (2, 5), (1, 3)):
+                    target = skewed[t + offset, below]
+                    np.clip(target + error * weight / 16, 0.0, 255.0, out=target)
+                target = skewed[t + 1, first:last + 1]
+                np.clip(target + error * 7 / 16, 0.0, 255.0, out=target)
+            
+            block[:] = skewed[diagonal]
         
         return gray.astype(np.uint8)
     
+    def render(self, pixels: np.ndarray) -> Dict[str, any]:
+        """將像素陣列一次性映射為字元行與顏色"""
+        if self.glyph_index is not None:
+            return self._render_shapes(pixels)
+        if self.options.mapping == "braille":
+            return self._render_braille(pixels)
+        if self.options.mapping == "halfblock":
+            return self._render_halfblock(pixels)
+        
+        h, w = pixels.shape[:2]
+        buffers = self._buffers((h, w))
+        index = buffers["index"]
+        
+        if pixels.ndim == 3:
+            # RGB：使用感知亮度公式
+            luma = buffers["luma"]
+            np.dot(pixels, LUMA_WEIGHTS, out=luma)
+            np.clip(luma, 0.0, 255.0, out=luma)
+            luma *= (len(self.chars) - 1) / 255.0
+            np.copyto(index, luma, casting='unsafe')
+        else:
+            np.take(self._index_lut, pixels, out=index)
+        
+        return self._assemble(index, pixels)
+    
+    def render_bands(self, pixels: np.ndarray, bands: int = 1) -> Dict[str, any]:
+        """
+        以列帶平行映射字元
+        
+        每帶為完整的字元列（點字、字形取樣為多個像素列），各帶互不相依；
+        NumPy/OpenCV 的運算會釋放 GIL，結果依序合併，與整張映射相同。
+        """
+        rows = pixels.shape[0] // self.samples[1]
+        bands = min(bands, rows)
+        if bands <= 1:
+            return self.render(pixels)
+        
+        bounds = (np.linspace(0, rows, bands + 1).astype(int) * self.samples[1]).tolist()
+        parts = shared_pool.map(self.render, [pixels[top:bottom] for top, bottom in zip(bounds, bounds[1:])],
+                                priority=True)
+        
+        result = dict(parts[0], height=sum(part["height"] for part in parts))
+        for key in ("art", "colors", "background_colors"):
+            if parts[0].get(key) is not None:
+                result[key] = [row for part in parts for row in part[key]]
+        return result
+    
+    def _render_shapes(self, pixels: np.ndarray) -> Dict[str, any]:
+        """依子格亮度與字形特徵匹配字元（pixels 為子格解析度）"""
+        cols, rows = self.samples
+        h, w = pixels.shape[0] // rows, pixels.shape[1] // cols
+        buffers = self._buffers((h, w))
+        index = buffers["index"]
+        
+        gray = pixels if pixels.ndim == 2 else cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+        cells = gray[:h * rows, :w * cols].reshape(h, rows, w, cols).transpose(0, 2, 1, 3)
+        cells = cells.reshape(h * w, rows * cols).astype(np.float32) / 255.0
+        index.ravel()[:] = self.glyph_index.match(cells)
+        
+        # 顏色取每個字元格的平均
+        cell_pixels = cv2.resize(pixels, (w, h), interpolation=cv2.INTER_AREA) if self.color else None
+        return self._assemble(index, cell_pixels)
+    
+    def _render_braille(self, pixels: np.ndarray) -> Dict[str, any]:
+        """將每個 2x4 點陣區塊打包為點字字元（pixels 為點的解析度）"""
+        h, w = pixels.shape[0] // 4, pixels.shape[1] // 2
+        buffers = self._buffers((h, w))
+        index = buffers["index"]
+        
+        # 亮的點（白色）點亮；啟用抖動時 pixels 已經只有 0/255
+        gray = pixels if pixels.ndim == 2 else cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+        dots = (gray[:h * 4, :w * 2] > 127).reshape(h, 4, w, 2)
+        np.einsum('yrxc,rc->yx', dots.astype(np.intp), BRAILLE_BITS, out=index)
+        
+        # 顏色取每個字元格的平均
+        cell_pixels = cv2.resize(pixels, (w, h), interpolation=cv2.INTER_AREA) if self.color else None
+        return self._assemble(index, cell_pixels)
+    
+    def _render_halfblock(self, pixels: np.ndarray) -> Dict[str, any]:
+        """每個字元格以「▀」表示上下兩個像素（pixels 為兩倍高度）"""
+        h, w = pixels.shape[0] // 2, pixels.shape[1]
+        index = self._buffers((h, w))["index"]
+        index.fill(0)
+        
+        top, bottom = pixels[0:h * 2:2], pixels[1:h * 2:2]
+        
+        # 灰階模式也需要顏色才有意義，改用灰色的 24 位元色
+        color_mode = self.options.color_mode if self.color else "truecolor"
+        result = self._assemble(index, None)
+        result["colors"] = self.map_colors(top, color_mode)
+        result["background_colors"] = self.map_colors(bottom, color_mode)
+        return result
+    
+    def _assemble(self, index: np.ndarray, pixels: Optional[np.ndarray]) -> Dict[str, any]:
+        """由字元索引組成字元行，並附上顏色"""
+        h, w = index.shape
+        glyphs = self._buffers((h, w))["glyphs"]
+        np.take(self._glyphs, index, out=glyphs)
+        if self._glyphs.dtype.itemsize == 4:
+            # 每個字元恰好一個碼位：將每列直接視為長度 w 的字串
+            art_lines = glyphs.view(f'<U{w}').ravel().tolist()
+        else:
+            art_lines = [''.join(row) for row in glyphs.tolist()]
+        
+        return {
+            "art": art_lines,
+            "colors": self.map_colors(pixels) if self.color and pixels is not None else None,
+            "width": w,
+            "height": h,
+        }
+    
+    def map_colors(self, pixels: np.ndarray, color_mode: Optional[str] = None) -> List[List[any]]:
+        """根據顏色模式產生每個字元的顏色資料"""
+        if pixels.ndim == 2:
+            pixels = np.repeat(pixels[..., None], 3, axis=2)
+        
+        color_mode = color_mode or self.options.color_mode
+        if color_mode == "ansi":
+            return ColorPalette.map_ansi_colors(pixels).tolist()
+        if color_mode == "ansi256":
+            return ColorPalette.map_ansi256_colors(pixels).tolist()
+        if color_mode in ["truecolor", "html"]:
+            return [list(map(tuple, row)) for row in pixels.tolist()]
+        
+        return [[None] * pixels.shape[1] for _ in range(pixels.shape[0])]
+
+
+class EnhancedImageConverter:
+    """增強版圖片轉換器"""
+    
+    def __init__(self, options: ConversionOptions):
+        self.options = options
+        self.pipeline = ConversionPipeline(options)
+        self._setup_character_set()
+    
+    def _setup_character_set(self):
+        """設置字元集"""
+        self.chars = self.pipeline.chars
+        
+        # 根據字元密度排序（如果有定義的話）
+        self.char_densities = []
+        for char in self.chars:
+            density = CHARACTER_DENSITY.get(char, len(self.char_densities) / len(self.chars))
+            self.char_densities.append(density)
+    
+    def preprocess_image(self, image: Image.Image) -> Image.Image:
+        """影像前處理"""
+        return self.pipeline.preprocess(image)
+    
+    def apply_edge_detection(self, image: np.ndarray) -> np.ndarray:
+        """應用邊緣偵測"""
+        return self.pipeline.apply_edge_detection(image)
+    
+    def apply_dithering(self, image: np.ndarray) -> np.ndarray:
+        """應用抖動算法（Floyd-Steinberg）"""
+        return self.pipeline.apply_dithering(image)
+    
     def get_char_for_pixel(self, pixel_value: Union[int, np.ndarray]) -> Tuple[str, Optional[str]]:
         """根據像素值獲取對應字元和顏色"""
         if isinstance(pixel_value, np.ndarray) and len(pixel_value) == 3:
             # RGB 像素
-            r, g, b = pixel_value
+            r, g, b = (int(c) for c in pixel_value)
             # 計算亮度（使用感知亮度公式）
             brightness = 0.2989 * float(r) + 0.5870 * float(g) + 0.1140 * float(b)
         else:
@@ -241,77 +785,127 @@ class EnhancedImageConverter:
         
         return char, color_code
     
-    def convert_to_art(self, image_path: str) -> Dict[str, any]:
+    def convert_to_art(self, image_path: Union[str, BinaryIO]) -> Dict[str, any]:
         """轉換圖片為字元藝術"""
-        # 載入圖片
-        image = Image.open(image_path)
-        
-        # 前處理
-        image = self.preprocess_image(image)
-        
-        # 計算新尺寸
-        aspect_ratio = image.height / image.width
-        height = int(self.options.width * aspect_ratio * 0.55)
-        
-        # 調整大小
-        image = image.resize((self.options.width, height), Image.Resampling.LANCZOS)
-        
-        # 轉換為 numpy 陣列
-        if self.options.color_mode == "grayscale" or image.mode == 'L':
-            if image.mode != 'L':
-                image = image.convert('L')
-            pixels = np.array(image)
-        else:
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            pixels = np.array(image)
-        
-        # 邊緣偵測
-        if self.options.edge_detection:
-            pixels = self.apply_edge_detection(pixels)
-        
-        # 抖動
-        if self.options.dithering:
-            pixels = self.apply_dithering(pixels)
-        
-        # 轉換為字元藝術
-        art_lines = []
-        color_data = []
-        
-        for row in pixels:
-            line = ""
-            row_colors = []
-            
-            for pixel in row:
-                char, color = self.get_char_for_pixel(pixel)
-                line += char
-                row_colors.append(color)
-            
-            art_lines.append(line)
-            if self.options.color_mode != "grayscale":
-                color_data.append(row_colors)
+        # 載入圖片（縮小解碼）並執行轉換管線
+        converted = self.pipeline.convert_file(image_path)
         
         result = {
-            "art": art_lines,
-            "width": self.options.width,
-            "height": height,
+            "art": converted["art"],
+            "width": converted["width"],
+            "height": converted["height"],
             "color_mode": self.options.color_mode,
         }
         
-        if color_data:
-            result["colors"] = color_data
+        if converted["colors"]:
+            result["colors"] = converted["colors"]
+        if converted.get("background_colors"):
+            result["background_colors"] = converted["background_colors"]
         
         return result
 
+# 區段平行解碼時每段的最少幀數
+MIN_SEGMENT_FRAMES = 240
+# 區段工作行程數（所有請求共用）：不超過核心數與共用執行池的大小
+SEGMENT_WORKERS = max(1, min(os.cpu_count() or 1, shared_pool.size))
+# 共享記憶體中的取消旗標數（同時使用區段的請求數上限，超過時該請求的區段無法中途停止）
+SEGMENT_CANCEL_SLOTS = 64
+
+# 時間預算：轉換可使用的比例（其餘留給序列化與傳輸）、量測耗時的幀數與降級的下限
+BUDGET_CONVERSION_SHARE = 0.85
+CALIBRATION_FRAMES = 3
+MIN_BUDGET_FPS = 6
+MIN_BUDGET_WIDTH = 40
+
+# 時間不足時依序停用的處理階段
+EXPENSIVE_STAGES = ["dithering", "denoise", "sharpen"]
+
+class SceneChangeSampler:
+    """
+    場景變化感知的幀取樣
+
+    每一幀都縮小到極小的灰階縮圖計算平均絕對差（0-255）：
+    與前一幀差異超過 scene_threshold 視為切換鏡頭，立即輸出；
+    與上一個輸出幀的累積差異超過 change_threshold 時輸出（間隔不小於 1/fps）；
+    距上一個輸出幀超過 max_gap 秒時無論內容都會輸出。
+    """
+    
+    THUMBNAIL_SIZE = (32, 18)
+    
+    def __init__(self, fps: int = 24, change_threshold: float = 6.0,
+                 scene_threshold: float = 30.0, max_gap: float = 2.0):
+        self.min_interval = 1.0 / max(1, fps)
+        self.change_threshold = change_threshold
+        self.scene_threshold = scene_threshold
+        self.max_gap = max_gap
+        self._previous = None
+        self._emitted = None
+        self._emitted_at = None
+    
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """縮圖（先以步距抽樣再做區域平均，成本與原始解析度幾乎無關）"""
+        width, height = self.THUMBNAIL_SIZE
+        step = max(1, min(frame.shape[0] // (height * 4), frame.shape[1] // (width * 4)))
+        small = cv2.resize(frame[::step, ::step], (width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+    
+    def should_emit(self, frame: np.ndarray, timestamp: float) -> bool:
+        """判斷這一幀是否需要輸出"""
+        thumbnail = self._thumbnail(frame)
+        previous, self._previous = self._previous, thumbnail
+        
+        if self._emitted is None:
+            emit = True
+        else:
+            elapsed = timestamp - self._emitted_at
+            scene_change = float(np.abs(thumbnail - previous).mean()) > self.scene_threshold
+            accumulated = float(np.abs(thumbnail - self._emitted).mean()) > self.change_threshold
+            emit = (scene_change or elapsed >= self.max_gap
+                    or (accumulated and elapsed >= self.min_interval - 1e-6))
+        
+        if emit:
+            self._emitted = thumbnail
+            self._emitted_at = timestamp
+        return emit
+
 class EnhancedVideoConverter:
     """增強版影片轉換器"""
     
     def __init__(self, options: ConversionOptions, num_threads: int = 4):
-        self.options = options
         self.num_threads = num_threads
-        self.frame_converter = EnhancedImageConverter(options)
         self._frame_cache = {}
         self._cache_lock = threading.Lock()
+        self._set_options(options)
+        # 最近一次轉換因時間預算所做的調整與預測耗時
+        self.quality_changes = []
+        self.predicted_seconds = None
+        # 最近一次轉換同時使用的執行緒或區段行程數（校正成本模型時換算 CPU 秒數）
+        self.parallelism = 1
+        # 不為 None 時每幀轉換後在工作執行緒中序列化為 JSON 片段（art 依此方法壓縮）
+        self.fragment_encoding = None
+    
+    def _set_options(self, options: ConversionOptions):
+        """更換轉換選項（重建管線並清除快取）"""
+        self.options = options
+        self.frame_converter = EnhancedImageConverter(options)
+        self.pipeline = self.frame_converter.pipeline
+        with self._cache_lock:
+            self._frame_cache.clear()
+    
+    def _convert_frame(self, frame: np.ndarray) -> Dict[str, any]:
+        """執行轉換管線（與圖片共用，並跨幀重複使用緩衝區）"""
+        converted = self.pipeline.convert_frame(frame)
+        
+        result = {
+            "art": converted["art"],
+            "colors": converted["colors"],
+            "background_colors": converted.get("background_colors")
+        }
+        if self.fragment_encoding is not None:
+            result["json"] = frame_json(result, self.fragment_encoding)
+        return result
     
     def _process_frame(self, frame: np.ndarray, frame_number: int) -> Dict[str, any]:
         """處理單一幀"""
@@ -320,60 +914,7 @@ class EnhancedVideoConverter:
             if frame_number in self._frame_cache:
                 return self._frame_cache[frame_number]
         
-        # 轉換為 PIL Image
-        if len(frame.shape) == 2:
-            pil_image = Image.fromarray(frame, mode='L')
-        else:
-            # OpenCV 使用 BGR，需要轉換為 RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(rgb_frame, mode='RGB')
-        
-        # 前處理
-        pil_image = self.frame_converter.preprocess_image(pil_image)
-        
-        # 調整大小
-        aspect_ratio = pil_image.height / pil_image.width
-        height = int(self.options.width * aspect_ratio * 0.55)
-        pil_image = pil_image.resize((self.options.width, height), Image.Resampling.LANCZOS)
-        
-        # 轉換為 numpy 陣列
-        if self.options.color_mode == "grayscale":
-            if pil_image.mode != 'L':
-                pil_image = pil_image.convert('L')
-            pixels = np.array(pil_image)
-        else:
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-            pixels = np.array(pil_image)
-        
-        # 應用特效
-        if self.options.edge_detection:
-            pixels = self.frame_converter.apply_edge_detection(pixels)
-        
-        if self.options.dithering:
-            pixels = self.frame_converter.apply_dithering(pixels)
-        
-        # 轉換為字元藝術
-        art_lines = []
-        color_data = []
-        
-        for row in pixels:
-            line = ""
-            row_colors = []
-            
-            for pixel in row:
-                char, color = self.frame_converter.get_char_for_pixel(pixel)
-                line += char
-                row_colors.append(color)
-            
-            art_lines.append(line)
-            if self.options.color_mode != "grayscale":
-                color_data.append(row_colors)
-        
-        result = {
-            "art": art_lines,
-            "colors": color_data if color_data else None
-        }
+        result = self._convert_frame(frame)
         
         # 緩存結果
         with self._cache_lock:
@@ -385,13 +926,83 @@ class EnhancedVideoConverter:
         
         return result
     
-    def convert_video(self, video_path: str, fps: int = 24) -> Tuple[List[Dict], float, int]:
-        """轉換影片為字元藝術序列"""
+    def convert_video(self, video_path: str, fps: int = 24, sampling: str = "fixed",
+                      max_gap: float = 2.0, segments: int = 1,
+                      cancel_token: Optional[CancellationToken] = None,
+                      time_budget: Optional[float] = None,
+                      encoding: Optional[str] = None) -> Tuple[List[Dict], float, int]:
+        """
+        轉換影片為字元藝術序列
+        
+        Args:
+            video_path: 影片路徑
+            fps: 輸出幀率（adaptive 取樣時為最高幀率）
+            sampling: "fixed" 固定間隔取樣；"adaptive" 只在畫面變化時取樣（見 SceneChangeSampler），
+                      幀的 timestamp 為實際時間，播放時依 timestamp 顯示
+            max_gap: adaptive 取樣時兩個輸出幀的最大間隔（秒）
+            segments: 將影片切成幾個時間區段，各由工作行程解碼與轉換（0 = SEGMENT_WORKERS，
+                      不超過核心數與共用執行池的大小）；太短的影片不切分
+            cancel_token: 取消權杖；取消後在下一個幀邊界停止並拋出 ConversionCancelled
+            time_budget: 時間預算（秒）；依前幾幀的耗時預測會超時時依序停用昂貴的處理、
+                         降低幀率與寬度，仍來不及時回傳已完成的幀。調整記錄在 quality_changes，
+                         轉換結束後恢復原本的選項。有時間預算時不切分區段。
+            encoding: 不為 None 時每幀在轉換的工作執行緒（或區段行程）中序列化為 JSON，
+                      art 依此壓縮方法（"none" 為不壓縮）；完整的幀片段放在 frame["json"]
+        """
+        started = time.perf_counter()
+        self.quality_changes = []
+        self.predicted_seconds = None
+        self.parallelism = 1
+        self.fragment_encoding = encoding
+        original_options = self.options
+        
+        try:
+            if time_budget is not None:
+                fps = self._plan_for_budget(video_path, fps, time_budget * BUDGET_CONVERSION_SHARE)
+                deadline = started + time_budget * BUDGET_CONVERSION_SHARE
+                segments = 1
+            else:
+                deadline = None
+            converted, duration = self._convert_sampled(video_path, fps, sampling, max_gap, segments,
+                                                        cancel_token, deadline)
+        finally:
+            if self.options is not original_options:
+                self._set_options(original_options)
+        
+        frames_data = []
+        for idx, (frame_num, timestamp, result) in enumerate(converted):
+            frame_data = {
+                "frame_number": idx,
+                "timestamp": round(timestamp, 3),
+                "art": result["art"]
+            }
+            
+            if result.get("colors"):
+                frame_data["colors"] = result["colors"]
+            if result.get("background_colors"):
+                frame_data["background_colors"] = result["background_colors"]
+            if "json" in result:
+                frame_data["json"] = prepend_fields(
+                    {"frame_number": idx, "timestamp": frame_data["timestamp"]}, result["json"]
+                )
+            
+            frames_data.append(frame_data)
+        
+        return frames_data, duration, len(frames_data)
+    
+    def _convert_sampled(self, video_path: str, fps: int, sampling: str, max_gap: float, segments: int,
+                         cancel_token: Optional[CancellationToken],
+                         deadline: Optional[float]) -> Tuple[List[Tuple[int, float, Dict]], float]:
+        """解碼、取樣並轉換，回傳 ([(幀號, 時間, 轉換結果), ...], 影片長度)"""
         cap = cv2.VideoCapture(video_path)
         
         if not cap.isOpened():
             raise Exception("無法開啟影片檔案")
         
+        # 快取以輸出幀序號為鍵，不能跨影片沿用
+        with self._cache_lock:
+            self._frame_cache.clear()
+        
         # 獲取影片資訊
         original_fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
@@ -400,49 +1011,374 @@ class EnhancedVideoConverter:
         # 計算幀間隔
         frame_interval = max(1, int(original_fps / fps))
         
-        frames_data = []
-        frame_numbers = []
-        frames_to_process = []
+        segment_count = self._segment_count(segments, total_frames)
+        if segment_count > 1:
+            cap.release()
+            self.parallelism = segment_count
+            converted = self._convert_segments(video_path, total_frames, segment_count, fps, sampling, max_gap,
+                                               cancel_token)
+            return converted, duration
         
-        # 收集需要處理的幀
-        frame_number = 0
-        while cap.isOpened():
+        sampler = SceneChangeSampler(fps, max_gap=max_gap) if sampling == "adaptive" else None
+        truncated = False
+        # 有時間預算時依實際的轉換速度再降低幀率（每次減半，只用於固定取樣）
+        stride = 1
+        started = time.perf_counter()
+        
+        # 邊解碼邊在共用執行池中處理幀（num_threads 只是並行數的提示）
+        try:
+            with shared_pool.job(hint=self.num_threads) as job:
+                if cancel_token is not None:
+                    # 取消時關閉 job，尚未開始的幀直接丟棄
+                    cancel_token.on_cancel(job.close)
+                # 在途的幀不超過並行數的兩倍（也限制保留在記憶體中的原始幀）
+                max_in_flight = 2 * job.max_parallel
+                self.parallelism = job.max_parallel
+                pending = deque()
+                converted = []
+                
+                def collect() -> bool:
+                    frame_num, timestamp, future = pending.popleft()
+                    # 至少等到第一幀，確保有內容可以回傳
+                    timeout = None if deadline is None or not converted else max(0.0, deadline - time.perf_counter())
+                    try:
+                        converted.append((frame_num, timestamp, future.result(timeout=timeout)))
+                        return True
+                    except TimeoutError:
+                        return False
+                
+                for frame_num, timestamp, frame in _iter_sampled_frames(cap, 0, None, frame_interval, sampler,
+                                                                         cancel_token):
+                    if stride > 1 and frame_num % (frame_interval * stride) != 0:
+                        continue
+                    if deadline is not None and converted and time.perf_counter() > deadline:
+                        truncated = True
+                        break
+                    
+                    while len(pending) >= max_in_flight:
+                        if not collect():
+                            truncated = True
+                            break
+                        if deadline is not None and sampler is None and fps // stride > 1:
+                            # 以已完成幀的平均耗時預測剩餘時間，來不及就將幀率減半
+                            elapsed = time.perf_counter() - started
+                            remaining = (total_frames - frame_num) / (frame_interval * stride)
+                            if time.perf_counter() + remaining * elapsed / len(converted) > deadline:
+                                stride *= 2
+                                self._record_change("fps", fps, max(1, fps // stride))
+                    if truncated:
+                        break
+                    
+                    pending.append((frame_num, timestamp,
+                                    job.submit(self._process_frame, frame.copy(), len(converted) + len(pending))))
+                
+                while pending and not truncated:
+                    if not collect():
+                        # 時間預算用完：離開 with 時丟棄尚未開始的幀
+                        truncated = True
+        except CancelledError:
+            raise ConversionCancelled("轉換已取消")
+        finally:
+            cap.release()
+        
+        if truncated:
+            self.quality_changes.append({
+                "stage": "truncated",
+                "frames": len(converted),
+                "until": round(converted[-1][1], 3) if converted else 0.0
+            })
+        return converted, duration
+    
+    def _plan_for_budget(self, video_path: str, fps: int, budget: float) -> int:
+        """
+        依前幾幀的耗時預測轉換時間，超過預算時依序降級
+
+        順序：停用 EXPENSIVE_STAGES、幀率減半（最低 MIN_BUDGET_FPS）、寬度縮為 3/4
+        （最低 MIN_BUDGET_WIDTH），最後再降低幀率。回傳調整後的幀率。
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise Exception("無法開啟影片檔案")
+        
+        original_fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_interval = max(1, int(original_fps / fps))
+        
+        # 量測解碼速度並取得前幾個取樣幀
+        samples = []
+        decoded = 0
+        started = time.perf_counter()
+        while len(samples) < CALIBRATION_FRAMES:
             ret, frame = cap.read()
             if not ret:
                 break
-            
+            if decoded % frame_interval == 0:
+                samples.append(frame)
+            decoded += 1
+        decode_seconds = (time.perf_counter() - started) / max(1, decoded)
+        cap.release()
+        if not samples:
+            return fps
+        
+        parallel = min(max(1, self.num_threads), shared_pool.size)
+        
+        def frame_seconds() -> float:
+            # 第一次轉換包含查找表等初始化，取中位數
+            timings = []
+            for frame in samples:
+                frame_started = time.perf_counter()
+                self._convert_frame(frame)
+                timings.append(time.perf_counter() - frame_started)
+            return float(np.median(timings))
+        
+        def predict(fps: int, per_frame: float) -> float:
+            sampled = math.ceil(total_frames / max(1, int(original_fps / fps)))
+            return decode_seconds * total_frames + per_frame * sampled / parallel
+        
+        per_frame = frame_seconds()
+        predicted = predict(fps, per_frame)
+        while predicted > budget:
+            stage = next((name for name in EXPENSIVE_STAGES if getattr(self.options, name)), None)
+            if stage is not None:
+                self._set_options(replace(self.options, **{stage: False}))
+                self._record_change(stage, True, False)
+                per_frame = frame_seconds()
+            elif fps > MIN_BUDGET_FPS:
+                new_fps = max(MIN_BUDGET_FPS, fps // 2)
+                self._record_change("fps", fps, new_fps)
+                fps = new_fps
+            elif self.options.width > MIN_BUDGET_WIDTH:
+                width = max(MIN_BUDGET_WIDTH, self.options.width * 3 // 4)
+                self._record_change("width", self.options.width, width)
+                self._set_options(replace(self.options, width=width))
+                per_frame = frame_seconds()
+            elif fps > 1:
+                self._record_change("fps", fps, fps // 2)
+                fps //= 2
+            else:
+                break
+            predicted = predict(fps, per_frame)
+        
+        self.predicted_seconds = round(predicted, 3)
+        return fps
+    
+    def _record_change(self, stage: str, before, after):
+        """記錄降級；同一項目多次調整時合併為一筆"""
+        for change in self.quality_changes:
+            if change["stage"] == stage:
+                change["to"] = after
+                return
+        self.quality_changes.append({"stage": stage, "from": before, "to": after})
+    
+    @staticmethod
+    def _segment_count(segments: int, total_frames: int) -> int:
+        return segment_count(segments, total_frames)
+    
+    def _convert_segments(self, video_path: str, total_frames: int, segment_count: int,
+                          fps: int, sampling: str, max_gap: float,
+                          cancel_token: Optional[CancellationToken] = None) -> List[Tuple[int, float, Dict]]:
+        """各區段在共用的工作行程池（segment_executor）中解碼與轉換，依順序接回"""
+        bounds = [total_frames * i // segment_count for i in range(segment_count)]
+        # 最後一段讀到檔案結尾（CAP_PROP_FRAME_COUNT 只是估計值）
+        ranges = [(start, end) for start, end in zip(bounds, bounds[1:] + [None])]
+        
+        results = segment_executor.run([
+            (self.options, video_path, start, end, fps, sampling, max_gap, self.fragment_encoding)
+            for start, end in ranges
+        ], cancel_token)
+        
+        # 依幀號接回；區段邊界重疊時不重複輸出
+        converted = []
+        for segment in results:
+            for frame_num, timestamp, result in segment:
+                if converted and frame_num <= converted[-1][0]:
+                    continue
+                converted.append((frame_num, timestamp, result))
+        return converted
+
+def _frame_timestamp(cap: cv2.VideoCapture, frame_number: int, original_fps: float) -> float:
+    """使用容器記錄的時間（可變幀率影片），取不到時以幀號推算"""
+    position = cap.get(cv2.CAP_PROP_POS_MSEC)
+    return position / 1000 if position > 0 or frame_number == 0 else frame_number / original_fps
+
+def _iter_sampled_frames(cap: cv2.VideoCapture, start: int, end: Optional[int], frame_interval: int,
+                         sampler: Optional[SceneChangeSampler] = None,
+                         cancel_token: Optional[CancellationToken] = None):
+    """
+    從目前位置（第 start 幀）讀到第 end 幀之前，產生需要轉換的 (幀號, 時間, 幀)
+
+    固定取樣以絕對幀號決定是否取樣，因此各區段分開讀取的結果與從頭讀取一致。
+    """
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_number = start
+    while end is None or frame_number < end:
+        if cancel_token is not None:
+            cancel_token.check()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        
+        if sampler is None:
             if frame_number % frame_interval == 0:
-                frames_to_process.append((frame_number, frame.copy()))
-                frame_numbers.append(frame_number)
-            
-            frame_number += 1
+                yield frame_number, frame_number / original_fps, frame
+        else:
+            timestamp = _frame_timestamp(cap, frame_number, original_fps)
+            if sampler.should_emit(frame, timestamp):
+                yield frame_number, timestamp, frame
         
-        cap.release()
+        frame_number += 1
+
+def _open_capture_at(video_path: str, start: int) -> cv2.VideoCapture:
+    """
+    開啟影片並定位到第 start 幀
+
+    解碼器會從前一個關鍵幀解碼到目標幀；後端回報的位置與目標不符時（無法精確定位的格式），
+    改為從頭逐幀前進，確保區段之間不重複也不遺漏。
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception("無法開啟影片檔案")
+    
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if int(round(cap.get(cv2.CAP_PROP_POS_FRAMES))) != start:
+            cap.release()
+            cap = cv2.VideoCapture(video_path)
+            for _ in range(start):
+                if not cap.grab():
+                    break
+    return cap
+
+def segment_count(segments: int, total_frames: int) -> int:
+    """
+    實際使用的區段數（0 = 區段工作行程數）
+
+    不超過 SEGMENT_WORKERS；每段至少 MIN_SEGMENT_FRAMES 幀，否則行程與定位的成本不划算。
+    """
+    if segments == 0 or segments > SEGMENT_WORKERS:
+        segments = SEGMENT_WORKERS
+    return max(1, min(segments, total_frames // MIN_SEGMENT_FRAMES))
+
+class SegmentExecutor:
+    """
+    區段轉換共用的工作行程池
+
+    整個行程只有一個，工作行程數為 SEGMENT_WORKERS，同時的請求不會讓行程數超過核心數。
+    工作行程以 spawn 啟動（不從有多個執行緒的伺服器 fork），啟動後一直重複使用。
+    每個請求佔用一個共享記憶體中的取消旗標：取消時尚未開始的區段直接丟棄，
+    執行中的區段在下一幀停止。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._flags = None
+        self._free_slots = list(range(SEGMENT_CANCEL_SLOTS))
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            if self._flags is None:
+                self._flags = context.RawArray("b", SEGMENT_CANCEL_SLOTS)
+            self._executor = ProcessPoolExecutor(
+                max_workers=SEGMENT_WORKERS, mp_context=context,
+                initializer=_init_segment_worker, initargs=(self._flags,)
+            )
+        return self._executor
+
+    def run(self, segments: List[Tuple], cancel_token: Optional[CancellationToken] = None) -> List:
+        """執行各區段（_convert_segment 的參數），依順序回傳結果"""
+        with self._lock:
+            executor = self._ensure_executor()
+            slot = self._free_slots.pop() if self._free_slots else None
+        if slot is not None:
+            self._flags[slot] = 0
         
-        # 使用多執行緒處理幀
-        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
-            futures = []
-            for idx, (frame_num, frame) in enumerate(frames_to_process):
-                future = executor.submit(self._process_frame, frame, idx)
-                futures.append((idx, frame_num, future))
-            
-            # 收集結果
-            for idx, frame_num, future in futures:
-                result = future.result()
-                timestamp = frame_num / original_fps
-                
-                frame_data = {
-                    "frame_number": idx,
-                    "timestamp": round(timestamp, 3),
-                    "art": result["art"]
-                }
-                
-                if result.get("colors"):
-                    frame_data["colors"] = result["colors"]
-                
-                frames_data.append(frame_data)
+        futures = [executor.submit(_convert_segment, *args, cancel_slot=slot) for args in segments]
+        # 所有區段結束（完成、取消或在下一幀停止）後才釋放旗標
+        remaining = [len(futures)]
         
-        # 按幀號排序
-        frames_data.sort(key=lambda x: x["frame_number"])
+        def release(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0] == 0 and slot is not None:
+                    self._free_slots.append(slot)
         
-        return frames_data, duration, len(frames_data)
\ No newline at end of file
+        for future in futures:
+            future.add_done_callback(release)
+        
+        try:
+            # 定期檢查取消；任一區段失敗時不再等待其他區段
+            pending = set(futures)
+            while pending:
+                if cancel_token is not None:
+                    cancel_token.check()
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_EXCEPTION)
+                if any(future.exception() is not None for future in done):
+                    break
+            return [future.result() for future in futures]
+        except BaseException as e:
+            if slot is not None:
+                self._flags[slot] = 1
+            for future in futures:
+                future.cancel()
+            if isinstance(e, BrokenProcessPool):
+                # 工作行程異常結束（例如記憶體不足）時，下一個請求重新建立行程池
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                executor.shutdown(wait=False)
+            raise
+
+# 所有請求共用
+segment_executor = SegmentExecutor()
+
+class _SegmentCancelFlag:
+    """工作行程中的取消檢查（與 CancellationToken.check 相同的介面）"""
+
+    def __init__(self, flags, slot: int):
+        self.flags = flags
+        self.slot = slot
+
+    def check(self):
+        if self.flags[self.slot]:
+            raise ConversionCancelled("轉換已取消")
+
+# 工作行程中的取消旗標（由 SegmentExecutor 在啟動行程時傳入）
+_segment_cancel_flags = None
+
+def _init_segment_worker(flags):
+    global _segment_cancel_flags
+    _segment_cancel_flags = flags
+
+# 工作行程中重複使用的轉換器（依轉換選項）
+_segment_converters: Dict[str, EnhancedVideoConverter] = {}
+
+def _convert_segment(options: ConversionOptions, video_path: str, start: int, end: Optional[int],
+                     fps: int, sampling: str, max_gap: float,
+                     fragment_encoding: Optional[str] = None,
+                     cancel_slot: Optional[int] = None) -> List[Tuple[int, float, Dict]]:
+    """在工作行程中解碼並轉換一個區段，回傳 [(幀號, 時間, 轉換結果), ...]"""
+    key = repr(options)
+    converter = _segment_converters.get(key)
+    if converter is None:
+        if len(_segment_converters) >= 8:
+            _segment_converters.clear()
+        converter = _segment_converters[key] = EnhancedVideoConverter(options, num_threads=1)
+    converter.fragment_encoding = fragment_encoding
+    
+    cap = _open_capture_at(video_path, start)
+    try:
+        frame_interval = max(1, int(cap.get(cv2.CAP_PROP_FPS) / fps))
+        # 每個區段各自偵測場景變化（區段的第一幀一定輸出）
+        sampler = SceneChangeSampler(fps, max_gap=max_gap) if sampling == "adaptive" else None
+        cancel_flag = None
+        if cancel_slot is not None and _segment_cancel_flags is not None:
+            cancel_flag = _SegmentCancelFlag(_segment_cancel_flags, cancel_slot)
+        return [
+            (frame_num, timestamp, converter._convert_frame(frame))
+            for frame_num, timestamp, frame in _iter_sampled_frames(cap, start, end, frame_interval, sampler,
+                                                                     cancel_flag)
+        ]
+    finally:
+        cap.release()
\ No newline at end of file
@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import mmap
+import struct
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+
+from enhanced_converter import ColorPalette
+
+# 幀容器存放目錄與容量上限（可用環境變數覆寫）
+STORE_DIR = os.environ.get(
+    "CHARACTER_ART_FRAME_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".frame_store")
+)
+STORE_MAX_BYTES = int(os.environ.get("CHARACTER_ART_FRAME_STORE_MAX_BYTES", 2 * 1024 ** 3))
+
+MAGIC = b"CAFRAMES"
+FORMAT_VERSION = 1
+
+# 檔頭：magic + JSON 長度；JSON 之後補齊到 8 位元組
+_PREFIX = struct.Struct("<8sI")
+
+# 幀偏移表：每幀一筆
+OFFSET_DTYPE = np.dtype([("offset", "<u8"), ("timestamp", "<f8"), ("frame_number", "<u4"), ("reserved", "<u4")])
+
+ANSI_NAMES = list(ColorPalette.ANSI_COLORS.keys())
+
+_open_stores: Dict[str, "FrameStore"] = {}
+_open_lock = threading.Lock()
+
+def _align(value: int, alignment: int = 8) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+def _color_kind(colors) -> Optional[str]:
+    """由轉換結果判斷顏色平面的格式"""
+    if not colors or colors[0][0] is None:
+        return None
+    sample = colors[0][0]
+    if isinstance(sample, str):
+        return "ansi"
+    if isinstance(sample, (int, np.integer)):
+        return "ansi256"
+    return "rgb"
+
+def _color_plane_shape(kind: Optional[str], height: int, width: int) -> Optional[Tuple]:
+    if kind is None:
+        return None
+    return (height, width, 3) if kind == "rgb" else (height, width)
+
+def _encode_colors(colors, kind: str) -> np.ndarray:
+    """顏色列表轉為 uint8 平面"""
+    if kind == "ansi":
+        lookup = {name: index for index, name in enumerate(ANSI_NAMES)}
+        return np.array([[lookup[name] for name in row] for row in colors], dtype=np.uint8)
+    return np.asarray(colors, dtype=np.uint8)
+
+def _decode_colors(plane: np.ndarray, kind: str) -> List[List[any]]:
+    """uint8 平面轉回與轉換結果相同格式的顏色列表"""
+    if kind == "ansi":
+        return np.array(ANSI_NAMES, dtype=object)[plane].tolist()
+    if kind == "ansi256":
+        return plane.tolist()
+    return [list(map(tuple, row)) for row in plane.tolist()]
+
+def store_key(content: bytes, settings: Dict[str, any]) -> str:
+    """由影片內容與轉換設定計算容器 ID（相同上傳與設定會重複使用）"""
+    digest = hashlib.sha256(content)
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+def store_path(video_id: str) -> Optional[str]:
+    """容器路徑；ID 格式不正確時回傳 None（避免路徑穿越）"""
+    if not re.fullmatch(r"[0-9a-f]{32}", video_id):
+        return None
+    return os.path.join(STORE_DIR, f"{video_id}.frames")
+
+def write_store(video_id: str, frames_data: List[Dict], charset: List[str], width: int, height: int,
+                fps: int, duration: float, total_frames: int) -> str:
+    """
+    將轉換後的幀寫入容器
+
+    格式：magic、JSON 檔頭、幀偏移表，之後是固定大小的幀資料
+    （字元索引平面 + 前景色平面 + 背景色平面），可直接以 mmap 隨機存取。
+    """
+    charset = list(dict.fromkeys(charset))
+    index_dtype = np.uint8 if len(charset) <= 256 else np.uint16
+
+    # 碼位 -> 字元集索引
+    codepoints = np.array([ord(char) for char in charset], dtype=np.uint32)
+    order = np.argsort(codepoints)
+    sorted_codepoints = codepoints[order]
+
+    first = frames_data[0] if frames_data else {}
+    colors = _color_kind(first.get("colors"))
+    background = _color_kind(first.get("background_colors"))
+
+    frame_dtype = np.dtype(
+        [("glyphs", index_dtype, (height, width))]
+        + ([("colors", np.uint8, _color_plane_shape(colors, height, width))] if colors else [])
+        + ([("background", np.uint8, _color_plane_shape(background, height, width))] if background else [])
+    )
+
+    header = {
+        "version": FORMAT_VERSION,
+        "width": width,
+        "height": height,
+        "frame_count": len(frames_data),
+        "fps": fps,
+        "duration": duration,
+        "total_frames": total_frames,
+        "charset": charset,
+        "glyphs": np.dtype(index_dtype).name,
+        "colors": colors,
+        "background": background,
+        "frame_size": frame_dtype.itemsize
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    table_offset = _align(_PREFIX.size + len(header_bytes))
+    data_offset = _align(table_offset + OFFSET_DTYPE.itemsize * len(frames_data))
+
+    table = np.zeros(len(frames_data), dtype=OFFSET_DTYPE)
+    table["offset"] = data_offset + frame_dtype.itemsize * np.arange(len(frames_data), dtype=np.uint64)
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    path = store_path(video_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, len(header_bytes)) + header_bytes)
+        f.write(b"\0" * (table_offset - f.tell()))
+
+        table["timestamp"] = [frame["timestamp"] for frame in frames_data]
+        table["frame_number"] = [frame["frame_number"] for frame in frames_data]
+        f.write(table.tobytes())
+        f.write(b"\0" * (data_offset - f.tell()))
+
+        record = np.zeros(1, dtype=frame_dtype)
+        for frame in frames_data:
+            art = np.frombuffer(''.join(frame["art"]).encode("utf-32-le"), dtype=np.uint32)
+            positions = np.minimum(np.searchsorted(sorted_codepoints, art), len(charset) - 1)
+            if not np.array_equal(sorted_codepoints[positions], art):
+                raise ValueError("幀中含有字元集以外的字元")
+            record["glyphs"][0] = order[positions].reshape(height, width)
+            if colors:
+                record["colors"][0] = _encode_colors(frame["colors"], colors)
+            if background:
+                record["background"][0] = _encode_colors(frame["background_colors"], background)
+            f.write(record.tobytes())
+    os.replace(tmp_path, path)
+
+    evict(keep=video_id)
+    return path
+
+def evict(keep: Optional[str] = None):
+    """超過容量上限時刪除最久未使用（修改時間最早）的容器"""
+    try:
+        entries = [entry for entry in os.scandir(STORE_DIR) if entry.name.endswith(".frames")]
+    except OSError:
+        return
+
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        if total <= STORE_MAX_BYTES:
+            break
+        if entry.name == f"{keep}.frames":
+            continue
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            total -= size
+        except OSError:
+            # 仍被開啟（Windows）或已被刪除
+            continue
+        with _open_lock:
+            _open_stores.pop(entry.name[:-len(".frames")], None)
+
+class FrameStore:
+    """
+    以 mmap 讀取的幀容器
+
+    幀資料為固定大小的 NumPy 結構陣列，直接對應到 mmap 的記憶體，
+    讀取任意範圍的幀不需要複製或解析整個檔案，多個觀看者共用作業系統的頁面快取。
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("不是幀容器檔案")
+        self.header = json.loads(bytes(self._mmap[_PREFIX.size:_PREFIX.size + header_length]).decode("utf-8"))
+        if self.header["version"] != FORMAT_VERSION:
+            raise ValueError(f"不支援的幀容器版本: {self.header['version']}")
+
+        self.width = self.header["width"]
+        self.height = self.header["height"]
+        self.frame_count = self.header["frame_count"]
+        self.charset = self.header["charset"]
+        self._codepoints = np.array([ord(char) for char in self.charset], dtype=np.uint32)
+
+        shape = (self.height, self.width)
+        fields = [("glyphs", np.dtype(self.header["glyphs"]), shape)]
+        if self.header["colors"]:
+            fields.append(("colors", np.uint8, _color_plane_shape(self.header["colors"], *shape)))
+        if self.header["background"]:
+            fields.append(("background", np.uint8, _color_plane_shape(self.header["background"], *shape)))
+        self.frame_dtype = np.dtype(fields)
+
+        table_offset = _align(_PREFIX.size + header_length)
+        self.table = np.frombuffer(self._mmap, dtype=OFFSET_DTYPE, count=self.frame_count, offset=table_offset)
+        self.data_offset = int(self.table["offset"][0]) if self.frame_count else len(self._mmap)
+        self.frames = np.frombuffer(self._mmap, dtype=self.frame_dtype, count=self.frame_count,
+                                    offset=self.data_offset)
+
+    @classmethod
+    def open(cls, video_id: str) -> Optional["FrameStore"]:
+        """開啟（或重複使用已開啟的）容器；不存在時回傳 None"""
+        path = store_path(video_id)
+        if path is None:
+            return None
+
+        with _open_lock:
+            store = _open_stores.get(video_id)
+            if store is None:
+                if not os.path.exists(path):
+                    return None
+                store = cls(path)
+                _open_stores[video_id] = store
+
+        # 以修改時間記錄最近使用，供容量上限淘汰
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return store
+
+    def info(self) -> Dict[str, any]:
+        """容器資訊與二進位格式說明"""
+        layout = []
+        for name in self.frame_dtype.names:
+            dtype, offset = self.frame_dtype.fields[name][:2]
+            layout.append({"name": name, "dtype": dtype.base.name, "shape": list(dtype.shape), "offset": offset})
+        return dict(self.header, layout=layout)
+
+    def clamp(self, start: int, count: Optional[int]) -> Tuple[int, int]:
+        """將請求的範圍限制在有效幀內"""
+        start = min(max(0, start), self.frame_count)
+        end = self.frame_count if count is None else min(self.frame_count, start + max(0, count))
+        return start, end
+
+    def raw_frames(self, start: int, count: Optional[int] = None) -> memoryview:
+        """連續的幀資料（mmap 上的零複製視圖）"""
+        start, end = self.clamp(start, count)
+        size = self.frame_dtype.itemsize
+        return memoryview(self._mmap)[self.data_offset + start * size:self.data_offset + end * size]
+
+    def read_frames(self, start: int, count: Optional[int] = None) -> List[Dict[str, any]]:
+        """讀取幀並還原為與轉換結果相同的格式"""
+        start, end = self.clamp(start, count)
+        records = self.frames[start:end]
+        table = self.table[start:end]
+
+        # 一次將整段的字元索引轉為字串
+        lines = self._codepoints[records["glyphs"]].reshape(-1, self.width)
+        lines = np.ascontiguousarray(lines).view(f"<U{self.width}").ravel().tolist() if self.width else []
+
+        frames = []
+        for i, record in enumerate(records):
+            frame = {
+                "frame_number": int(table["frame_number"][i]),
+                "timestamp": float(table["timestamp"][i]),
+                "art": lines[i * self.height:(i + 1) * self.height]
+            }
+            if self.header["colors"]:
+                frame["colors"] = _decode_colors(record["colors"], self.header["colors"])
+            if self.header["background"]:
+                frame["background_colors"] = _decode_colors(record["background"], self.header["background"])
+            frames.append(frame)
+        return frames
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import threading
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from typing import List, Tuple, Optional, Dict
+
+# 字形特徵快取目錄（可用環境變數覆寫）
+CACHE_DIR = os.environ.get(
+    "CHARACTER_ART_GLYPH_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".glyph_cache")
+)
+
+# 點陣化字形時依序嘗試的字型（可用環境變數 CHARACTER_ART_FONT 指定）
+FONT_CANDIDATES = [
+    "DejaVuSansMono.ttf",
+    "consola.ttf",
+    "msgothic.ttc",
+    "NotoSansMonoCJK-Regular.ttc",
+    "NotoSansCJK-Regular.ttc",
+    "Menlo.ttc",
+]
+
+# 點陣化時的字型大小（像素）
+RASTER_SIZE = 32
+
+# 特徵格式版本；點陣化方式改變時遞增以淘汰舊快取
+FEATURE_VERSION = 1
+
+_index_cache: Dict[Tuple, "GlyphIndex"] = {}
+_index_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def load_font(size: int = RASTER_SIZE) -> Tuple[ImageFont.ImageFont, str]:
+    """載入可用的字型，回傳 (字型, 字型識別名稱)"""
+    candidates = [os.environ["CHARACTER_ART_FONT"]] if os.environ.get("CHARACTER_ART_FONT") else []
+    for name in candidates + FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size), name
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size), "default"
+
+class GlyphIndex:
+    """
+    字形特徵索引
+
+    將字元集的每個字形點陣化一次，計算 cols x rows 子格的覆蓋率作為特徵向量，
+    並快取到磁碟。轉換時以矩陣運算為每個字元格找出特徵最接近的字形。
+    字型中缺少的字形以其在字元集中的位置作為均勻亮度（等同亮度映射）。
+    """
+
+    def __init__(self, chars: List[str], grid: Tuple[int, int] = (2, 3), features: Optional[np.ndarray] = None):
+        self.chars = chars
+        self.grid = grid
+        self.features = features if features is not None else self._rasterize()
+        self._norms = (self.features ** 2).sum(axis=1)
+
+    @classmethod
+    def for_chars(cls, chars: List[str], grid: Tuple[int, int] = (2, 3)) -> "GlyphIndex":
+        """取得字元集的索引（記憶體與磁碟快取）"""
+        font, font_name = load_font()
+        key = (tuple(chars), tuple(grid), font_name)
+
+        with _index_lock:
+            index = _index_cache.get(key)
+            if index is not None:
+                return index
+
+            digest = hashlib.sha1(repr((key, RASTER_SIZE, FEATURE_VERSION)).encode("utf-8")).hexdigest()
+            cache_path = os.path.join(CACHE_DIR, f"{digest}.npy")
+
+            features = None
+            if os.path.exists(cache_path):
+                try:
+                    features = np.load(cache_path)
+                except (OSError, ValueError):
+                    features = None
+
+            index = cls(chars, grid, features)
+            if features is None:
+                try:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        np.save(f, index.features)
+                    os.replace(tmp_path, cache_path)
+                except OSError:
+                    # 快取目錄不可寫時只使用記憶體快取
+                    pass
+
+            _index_cache[key] = index
+            return index
+
+    def _rasterize(self) -> np.ndarray:
+        """點陣化所有字形並計算子格覆蓋率"""
+        cols, rows = self.grid
+        font, _ = load_font()
+        ascent, descent = font.getmetrics()
+        cell_height = ascent + descent
+        cell_width = max(1, int(max(font.getlength(char) for char in self.chars) + 0.5))
+
+        # 字型缺字時會畫出替代字形（豆腐塊）
+        missing = self._render(font, "\U0010FFFD", cell_width, cell_height)
+
+        features = []
+        fallback = []
+        for position, char in enumerate(self.chars):
+            glyph = self._render(font, char, cell_width, cell_height)
+            if char.strip() and (not glyph.getbbox() or glyph.tobytes() == missing.tobytes()):
+                fallback.append(position)
+            cells = np.asarray(glyph.resize((cols, rows), Image.Resampling.BOX), dtype=np.float32) / 255.0
+            features.append(cells.ravel())
+        features = np.array(features, dtype=np.float32)
+
+        # 讓最密的（實際畫得出來的）字形對應到全白
+        rendered = [position for position in range(len(self.chars)) if position not in fallback]
+        densest = features[rendered].mean(axis=1).max() if rendered else 0
+        if densest > 0:
+            features = np.clip(features / densest, 0.0, 1.0)
+
+        # 缺字：依在字元集中的位置給予均勻亮度
+        for position in fallback:
+            features[position] = position / max(1, len(self.chars) - 1)
+
+        return features
+
+    @staticmethod
+    def _render(font: ImageFont.ImageFont, char: str, width: int, height: int) -> Image.Image:
+        """將單一字形畫在固定大小的字元格中"""
+        image = Image.new("L", (width, height), 0)
+        ImageDraw.Draw(image).text((0, 0), char, fill=255, font=font)
+        return image
+
+    def match(self, cells: np.ndarray) -> np.ndarray:
+        """
+        為每個字元格找出最接近的字形
+
+        Args:
+            cells: (N, rows * cols) 子格亮度，範圍 0-1（白色 = 最密的字形）
+
+        Returns:
+            (N,) 字形索引
+        """
+        # ||c - g||^2 = ||c||^2 - 2 c·g + ||g||^2，其中 ||c||^2 與字形無關
+        distances = self._norms - 2.0 * (cells @ self.features.T)
+        return np.argmin(distances, axis=1)
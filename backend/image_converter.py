@@ -1,10 +1,27 @@
-from PIL import Image
-import numpy as np
+from functools import lru_cache
+
+from enhanced_converter import ConversionOptions, ConversionPipeline
 
 # 字元集合 (從暗到亮排列 - 黑色對應空白，白色對應筆畫最多)
 BLOCK_CHARS =  [' ', '.', "'", '`', ':', '░', '▒', '▓', '█']
 ASCII_CHARS = [" ", ".", ",", ":", ";", "+", "*", "?", "%", "S", "#", "@"]
 
+@lru_cache(maxsize=32)
+def get_pipeline(width: int, art_type: str) -> ConversionPipeline:
+    """
+    取得（並快取）v1 參數對應的轉換管線，讓同一支影片的每一幀重複使用
+    
+    Args:
+        width: 輸出寬度
+        art_type: 藝術類型 ("block" 或 "ascii")
+    
+    Returns:
+        已編譯的轉換管線
+    """
+    chars = BLOCK_CHARS if art_type == "block" else ASCII_CHARS
+    # v1 維持原本的輸出：在原始解析度處理，不先縮小（prescale=0）
+    return ConversionPipeline(ConversionOptions(width=width, custom_chars=''.join(chars), prescale=0))
+
 def convert_image_to_art(image_path: str, width: int = 100, art_type: str = "block") -> list:
     """
     將圖片轉換為字元藝術
@@ -20,51 +37,17 @@ def convert_image_to_art(image_path: str, width: int = 100, art_type: str = "blo
     try:
         print(f"開始處理圖片: {image_path}")
         
-        # 開啟並處理圖片
-        image = Image.open(image_path)
-        print(f"原始圖片大小: {image.size}, 模式: {image.mode}")
-        
-        # 轉換為灰度圖
-        if image.mode != 'L':
-            image = image.convert('L')
+        # 開啟圖片（要求解碼器直接輸出縮小後的影像）
+        pipeline = get_pipeline(width, art_type)
+        image, source_size = pipeline.open_image(image_path)
+        print(f"原始圖片大小: {source_size}, 解碼大小: {image.size}, 模式: {image.mode}")
         
-        # 計算新的高度，保持比例
-        aspect_ratio = image.height / image.width
-        height = int(width * aspect_ratio * 0.55)  # 0.55 是字元的寬高比調整
-        print(f"目標尺寸: {width}x{height}")
-        
-        # 調整圖片大小
-        image = image.resize((width, height), Image.Resampling.LANCZOS)
-        
-        # 轉換為 numpy 陣列
-        pixels = np.array(image)
-        print(f"像素陣列形狀: {pixels.shape}")
-        print(f"像素值範圍: {pixels.min()} - {pixels.max()}")
-        print(f"像素陣列數據類型: {pixels.dtype}")
-        print(f"前5x5像素樣本:")
-        print(pixels[:5, :5])
-        
-        # 選擇字元集
-        chars = BLOCK_CHARS if art_type == "block" else ASCII_CHARS
-        print(f"使用字元集: {chars}")
-        
-        # 將像素值映射到字元
-        art_lines = []
-        for i, row in enumerate(pixels):
-            line = ""
-            for j, pixel in enumerate(row):
-                # 將 0-255 的像素值映射到字元索引
-                # 黑色(0)->索引0(空白)，白色(255)->最後索引(筆畫最多)
-                char_index = int(int(pixel) * (len(chars) - 1) / 255.0)
-                char_index = max(0, min(len(chars) - 1, char_index))  # 確保索引在範圍內
-                line += chars[char_index]
-                
-                # 調試：輸出前幾個像素的映射
-                if i < 2 and j < 5:
-                    print(f"像素[{i},{j}]: {pixel} -> 索引{char_index} -> '{chars[char_index]}'")
-                    
-            art_lines.append(line)
+        # 灰度轉換、調整大小與字元映射都由轉換管線完成
+        result = pipeline.convert_image(image, source_size)
+        print(f"目標尺寸: {result['width']}x{result['height']}")
+        print(f"使用字元集: {pipeline.chars}")
         
+        art_lines = result["art"]
         print(f"轉換完成，共 {len(art_lines)} 行")
         return art_lines
     
@@ -85,35 +68,7 @@ def convert_frame_to_art(frame, width: int = 60, art_type: str = "block") -> lis
         字元藝術行列表
     """
     try:
-        # 轉換 BGR 到 RGB，然後轉為 PIL Image
-        import cv2
-        
-        # 轉換顏色空間並轉為灰度
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # 計算新的高度，保持比例
-        height, original_width = gray_frame.shape
-        aspect_ratio = height / original_width
-        new_height = int(width * aspect_ratio * 0.55)
-        
-        # 調整大小
-        resized_frame = cv2.resize(gray_frame, (width, new_height), interpolation=cv2.INTER_LANCZOS4)
-        
-        # 選擇字元集
-        chars = BLOCK_CHARS if art_type == "block" else ASCII_CHARS
-        
-        # 將像素值映射到字元
-        art_lines = []
-        for row in resized_frame:
-            line = ""
-            for pixel in row:
-                # 將 0-255 的像素值映射到字元索引
-                # 黑色(0)->索引0(空白)，白色(255)->最後索引(筆畫最多)
-                char_index = int(int(pixel) * (len(chars) - 1) / 255.0)
-                line += chars[char_index]
-            art_lines.append(line)
-        
-        return art_lines
+        return get_pipeline(width, art_type).convert_frame(frame)["art"]
     
     except Exception as e:
-        raise Exception(f"幀轉換失敗: {str(e)}")
\ No newline at end of file
+        raise Exception(f"幀轉換失敗: {str(e)}")
@@ -0,0 +1,109 @@
+import json
+import uuid
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from starlette.responses import Response
+
+from art_compression import apply_encoding
+
+# orjson 為選用套件，缺少時以標準函式庫序列化（輸出相同，只是較慢）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 幀中只在有內容時才輸出的欄位
+OPTIONAL_FRAME_FIELDS = ["colors", "background_colors"]
+
+class RawJSON:
+    """
+    已序列化的 JSON
+
+    放在回應內容中時原樣輸出：bytes 為單一值，bytes 的列表為陣列（例如每幀的片段），
+    主執行緒只需串接，不再走訪其中的字元行與顏色。
+    """
+
+    def __init__(self, data: Union[bytes, List[bytes]]):
+        self.data = data
+
+    def chunks(self) -> List[bytes]:
+        if isinstance(self.data, bytes):
+            return [self.data]
+        return [b"[", b",".join(self.data), b"]"]
+
+def _default(value):
+    """標準函式庫序列化時處理 NumPy 型別（orjson 已原生支援）"""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _dumps(value, default) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def fallback(item):
+        try:
+            return default(item)
+        except TypeError:
+            return _default(item)
+
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=fallback).encode('utf-8')
+
+def dumps(value) -> bytes:
+    """序列化為緊湊的 UTF-8 JSON（tuple 直接輸出為陣列，可包含 RawJSON）"""
+    raw = []
+    token = uuid.uuid4().hex
+
+    def default(item):
+        if isinstance(item, RawJSON):
+            raw.append(item)
+            return f"{token}{len(raw) - 1}"
+        return _default(item)
+
+    body = _dumps(value, default)
+    if not raw:
+        return body
+
+    # 以佔位字串序列化後換成原始片段（佔位字串依輸出順序產生）
+    chunks = []
+    for index, item in enumerate(raw):
+        before, body = body.split(f'"{token}{index}"'.encode(), 1)
+        chunks.append(before)
+        chunks.extend(item.chunks())
+    chunks.append(body)
+    return b"".join(chunks)
+
+def frame_json(frame: Dict[str, any], encoding: Optional[str] = None) -> bytes:
+    """
+    序列化一幀：沒有內容的顏色欄位不輸出，art 依 encoding 壓縮
+
+    不修改傳入的 dict（原始的字元行仍可寫入幀容器）。
+    """
+    frame = {
+        key: value for key, value in frame.items()
+        if key not in OPTIONAL_FRAME_FIELDS or value
+    }
+    return dumps(apply_encoding(frame, encoding))
+
+def prepend_fields(fields: Dict[str, any], fragment: bytes) -> bytes:
+    """在已序列化的 JSON 物件前面加上欄位"""
+    head = dumps(fields)
+    if fragment == b"{}":
+        return head
+    return head[:-1] + b"," + fragment[1:]
+
+class JSONBody(Response):
+    """
+    以預先序列化的位元組回應
+
+    端點回傳 Response 時 FastAPI 不再以 jsonable_encoder 走訪整個結果；
+    內容可以是 bytes（直接使用）或包含 RawJSON 的 dict。
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
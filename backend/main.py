@@ -1,11 +1,19 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from starlette.background import BackgroundTask
+from starlette.requests import ClientDisconnect
+from PIL import Image
 import tempfile
+import hashlib
+import asyncio
+import time
 import os
 import sys
 import logging
-from typing import Optional
+from dataclasses import asdict
+from typing import List, Optional, Tuple
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -16,9 +24,24 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from image_converter import convert_image_to_art
-    from video_converter import convert_video_to_art
-    from enhanced_converter import EnhancedImageConverter, EnhancedVideoConverter, ConversionOptions
+    from video_converter import convert_video_to_art, get_video_info as read_video_info
+    from enhanced_converter import EnhancedImageConverter, EnhancedVideoConverter, ConversionOptions, segment_count
     from output_formatter import OutputFormatter
+    from batch_converter import BatchImageConverter, BatchTooLarge, expand_upload, BATCH_MAX_ITEMS, BATCH_MAX_BYTES
+    from frame_store import FrameStore, store_key, write_store
+    from art_compression import METHODS as ENCODING_METHODS, apply_encoding
+    from worker_pool import shared_pool, CancellationToken, ConversionCancelled
+    from json_body import JSONBody, RawJSON, dumps, frame_json
+    from result_cache import read_result, write_result, result_url, entity_tag, matching_etag, cache_headers
+    from upload_store import UploadRejected, create_upload, get_upload, completed_upload, remove_upload
+    from admission import (
+        admission, AdmissionRejected, benchmark_history, estimate_image_cost, estimate_video_cost,
+        estimate_batch_cost, estimate_response_bytes, output_grid, sampled_frames
+    )
+    from response_compression import (
+        ResponseCompressionMiddleware, select_dictionary, dictionary_ids, dictionary_bytes,
+        DICTIONARY_REQUEST_HEADER, DICTIONARY_AVAILABLE_HEADER
+    )
     logger.info("成功導入轉換模組")
 except ImportError as e:
     logger.error(f"無法導入轉換模組: {e}")
@@ -32,8 +55,112 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[DICTIONARY_REQUEST_HEADER, DICTIONARY_AVAILABLE_HEADER],
 )
 
+# 回應壓縮（zstd / brotli / gzip，依 Accept-Encoding 協商）
+app.add_middleware(ResponseCompressionMiddleware, minimum_size=500)
+
+# 上傳檔案分塊寫入臨時檔案的區塊大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def save_upload(upload: UploadFile, max_bytes: Optional[int] = None) -> Tuple[str, bytes, int]:
+    """
+    將上傳檔案分塊寫入臨時檔案（不整個讀入記憶體）
+
+    Args:
+        upload: 上傳檔案
+        max_bytes: 最多寫入的位元組數（只需要檔頭時）
+
+    Returns:
+        (臨時檔案路徑, 內容的 sha256, 檔案大小)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".tmp") as tmp_file:
+        while max_bytes is None or size < max_bytes:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE if max_bytes is None else min(UPLOAD_CHUNK_SIZE, max_bytes - size))
+            if not chunk:
+                break
+            digest.update(chunk)
+            tmp_file.write(chunk)
+            size += len(chunk)
+    return tmp_file.name, digest.digest(), size
+
+def image_size(path: str) -> Tuple[int, int]:
+    """只讀取圖檔標頭取得尺寸"""
+    with Image.open(path) as image:
+        return image.size
+
+# 轉換期間檢查客戶端是否中斷連線的間隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+def convert_image_json(converter: EnhancedImageConverter, path: str, encoding: str) -> Tuple[int, int, bytes]:
+    """在工作執行緒中轉換並序列化圖片，回傳 (寬, 高, JSON)"""
+    result = apply_encoding(converter.convert_to_art(path), encoding)
+    return result["width"], result["height"], dumps(result)
+
+def frame_fragments(frames_data: List[dict], encoding: str) -> List[bytes]:
+    """每幀的 JSON 片段（轉換時已在工作執行緒中產生的直接使用）"""
+    return [frame.get("json") or frame_json(frame, encoding) for frame in frames_data]
+
+def conversion_url(path: str, content_hash: bytes, options: ConversionOptions, **extra) -> str:
+    """轉換結果的 GET 網址（查詢參數與 POST 端點的表單欄位同名）"""
+    params = {name: value for name, value in asdict(options).items() if name != "shape_grid"}
+    return result_url(path, content_hash, dict(params, **extra))
+
+def video_settings(options: ConversionOptions, fps: int, sampling: str, max_gap: float, segments: int) -> dict:
+    """決定影片轉換結果的設定（幀容器的鍵與結果網址）"""
+    # 固定取樣時區段切分不影響結果；adaptive 取樣在每個區段開頭重新偵測
+    return dict(asdict(options), fps=fps, sampling=sampling, max_gap=max_gap,
+                segments=segments if sampling == "adaptive" else 1)
+
+def parse_content_hash(content_hash: str) -> Optional[bytes]:
+    """網址中的內容 sha256（64 位十六進位），格式不正確時回傳 None"""
+    if len(content_hash) != 64:
+        return None
+    try:
+        return bytes.fromhex(content_hash)
+    except ValueError:
+        return None
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """If-None-Match 相符時的 304 回應"""
+    matched = matching_etag(request.headers.get("if-none-match"), etag)
+    if matched is None:
+        return None
+    return Response(status_code=304, headers=cache_headers(matched))
+
+def watch_disconnect(request: Request, cancel_token: CancellationToken) -> asyncio.Task:
+    """背景檢查客戶端連線，中斷時取消權杖；請求結束時取消回傳的 task"""
+    async def watch():
+        while not cancel_token.cancelled:
+            if await request.is_disconnected():
+                cancel_token.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+    return asyncio.create_task(watch())
+
+def admission_rejected_response(e: AdmissionRejected) -> JSONResponse:
+    """准入控制拒絕的回應：忙碌時 503 + Retry-After，超過整體預算時 413"""
+    if e.retry_after is None:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "error", "message": str(e)}
+        )
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error", "message": str(e), "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def upload_rejected_response(e: UploadRejected) -> JSONResponse:
+    """分塊上傳的錯誤：回傳目前的 offset，客戶端可從該處繼續"""
+    content = {"status": "error", "message": str(e)}
+    if e.offset is not None:
+        content["offset"] = e.offset
+    return JSONResponse(status_code=e.status_code, content=content)
+
 @app.get("/")
 async def root():
     return {"message": "Picture/Video to Character Art API", "status": "running"}
@@ -41,10 +168,35 @@ async def root():
 @app.get("/health")
 async def health_check():
     """健康檢查端點"""
-    return {"status": "healthy", "message": "API is running normally"}
+    return {"status": "healthy", "message": "API is running normally", "admission": admission.stats()}
+
+@app.get("/api/v2/zstd-dictionaries")
+async def list_zstd_dictionaries():
+    """列出各字元集的 zstd 字典 ID"""
+    return {"status": "success", "dictionaries": dictionary_ids()}
+
+@app.get("/api/v2/zstd-dictionaries/{dict_id}")
+async def get_zstd_dictionary(dict_id: int):
+    """
+    取得 zstd 字典內容
+    
+    字典 ID 由內容計算，同一 ID 的內容永遠不變，客戶端取得一次即可長期快取。
+    """
+    data = dictionary_bytes(dict_id)
+    if data is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"找不到字典: {dict_id}"}
+        )
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
 
 @app.post("/api/v1/convert")
 async def convert_image(
+    request: Request,
     image: UploadFile = File(...),
     width: int = Form(100),
     art_type: str = Form("block")
@@ -58,18 +210,22 @@ async def convert_image(
                 content={"status": "error", "message": "請上傳圖片檔案"}
             )
         
-        # 創建臨時檔案
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".tmp") as tmp_file:
-            content = await image.read()
-            tmp_file.write(content)
-            temp_path = tmp_file.name
+        # 標示回應壓縮使用的字元集字典
+        select_dictionary(request, art_type)
+        
+        # 分塊寫入臨時檔案
+        temp_path, content_hash, upload_size = await save_upload(image)
         
         try:
-            # 轉換圖片
-            art_lines = convert_image_to_art(temp_path, width, art_type)
+            # 依預估成本取得執行許可後，在共用執行池的優先通道轉換（不阻塞事件迴圈）
+            cost = estimate_image_cost(width, *await run_in_threadpool(image_size, temp_path), upload_bytes=upload_size)
+            async with admission.admit(cost):
+                art_lines = await asyncio.wrap_future(
+                    shared_pool.submit(convert_image_to_art, temp_path, width, art_type, priority=True)
+                )
             
-            # 回傳結果
-            return {
+            # 回傳結果（直接序列化為位元組，不經過 jsonable_encoder）
+            return JSONBody({
                 "status": "success",
                 "type": "image",
                 "meta": {
@@ -79,13 +235,15 @@ async def convert_image(
                     "height": len(art_lines)
                 },
                 "data": art_lines
-            }
+            })
         
         finally:
             # 清理臨時檔案
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
     
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -94,6 +252,7 @@ async def convert_image(
 
 @app.post("/api/v1/convert-video")
 async def convert_video(
+    request: Request,
     video: UploadFile = File(...),
     width: int = Form(60),
     fps: int = Form(24),
@@ -108,18 +267,31 @@ async def convert_video(
                 content={"status": "error", "message": "請上傳影片檔案"}
             )
         
-        # 創建臨時檔案
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".tmp") as tmp_file:
-            content = await video.read()
-            tmp_file.write(content)
-            temp_path = tmp_file.name
+        # 標示回應壓縮使用的字元集字典
+        select_dictionary(request, art_type)
+        
+        # 分塊寫入臨時檔案
+        temp_path, content_hash, upload_size = await save_upload(video)
+        
+        # 客戶端中斷連線時取消轉換
+        cancel_token = CancellationToken()
+        watcher = watch_disconnect(request, cancel_token)
         
         try:
-            # 轉換影片
-            frames_data, duration, total_frames = convert_video_to_art(temp_path, width, fps, art_type)
+            # 依預估成本取得執行許可後，在執行緒中轉換（幀在共用執行池中處理，不阻塞事件迴圈）
+            cost = estimate_video_cost(width, await run_in_threadpool(read_video_info, temp_path), fps, upload_bytes=upload_size)
+            async with admission.admit(cost):
+                # 排隊期間已中斷的請求不再轉換
+                cancel_token.check()
+                frames_data, duration, total_frames = await run_in_threadpool(
+                    convert_video_to_art, temp_path, width, fps, art_type, cancel_token
+                )
             
-            # 回傳結果
-            return {
+            # 沒有人會讀取的回應不再序列化
+            cancel_token.check()
+            
+            # 回傳結果（在執行緒中序列化為位元組，不經過 jsonable_encoder）
+            body = await run_in_threadpool(dumps, {
                 "status": "success",
                 "type": "video",
                 "meta": {
@@ -134,13 +306,23 @@ async def convert_video(
                 "data": {
                     "frames": frames_data
                 }
-            }
+            })
+            return JSONBody(body)
         
         finally:
+            watcher.cancel()
             # 清理臨時檔案
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
     
+    except ConversionCancelled:
+        logger.info(f"客戶端已中斷連線，取消轉換: {video.filename}")
+        return JSONResponse(
+            status_code=499,
+            content={"status": "error", "message": "客戶端已中斷連線"}
+        )
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -149,34 +331,74 @@ async def convert_video(
 
 @app.post("/api/v2/convert")
 async def convert_image_enhanced(
-    image: UploadFile = File(...),
+    request: Request,
+    image: Optional[UploadFile] = File(None),
     width: int = Form(100),
     art_type: str = Form("block"),
     color_mode: str = Form("grayscale"),
     contrast: float = Form(1.0),
     brightness: float = Form(1.0),
+    gamma: float = Form(1.0),
+    auto_levels: bool = Form(False),
     edge_detection: bool = Form(False),
     edge_threshold: int = Form(100),
     denoise: bool = Form(False),
     sharpen: bool = Form(False),
     invert: bool = Form(False),
     dithering: bool = Form(False),
-    custom_chars: Optional[str] = Form(None)
+    custom_chars: Optional[str] = Form(None),
+    mapping: str = Form("brightness"),
+    prescale: int = Form(3),
+    encoding: str = Form("none"),
+    upload_id: Optional[str] = Form(None)
 ):
-    """增強版圖片轉字元藝術 API"""
+    """
+    增強版圖片轉字元藝術 API
+    
+    upload_id 為已完成的分塊上傳（/api/v2/uploads）時不必再上傳檔案。
+    """
     try:
+        # 已完成的分塊上傳直接使用磁碟上的檔案
+        source = None
+        if upload_id is not None:
+            source = completed_upload(upload_id)
+            if source is None:
+                return JSONResponse(
+                    status_code=404,
+                    content={"status": "error", "message": f"找不到已完成的上傳: {upload_id}"}
+                )
+            filename, content_type = source.filename, source.content_type
+        elif image is not None:
+            filename, content_type = image.filename, image.content_type
+        else:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": "請上傳圖片檔案"}
+            )
+        
         # 檢查檔案類型
-        if not image.content_type.startswith('image/'):
+        if not content_type.startswith('image/'):
             return JSONResponse(
                 status_code=400,
                 content={"status": "error", "message": "請上傳圖片檔案"}
             )
         
-        # 創建臨時檔案
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".tmp") as tmp_file:
-            content = await image.read()
-            tmp_file.write(content)
-            temp_path = tmp_file.name
+        if encoding not in ["none", "auto"] + ENCODING_METHODS:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": f"不支援的壓縮方法: {encoding}"}
+            )
+        
+        # 標示回應壓縮使用的字元集字典
+        select_dictionary(request, art_type, mapping, custom_chars)
+        
+        # 分塊寫入臨時檔案（分塊上傳已在磁碟上並算好雜湊，不佔用記憶體預算）
+        if source is not None:
+            # 轉換期間上傳不會被刪除或過期
+            source.acquire()
+            temp_path, content_hash, upload_size = source.path, source.content_hash, 0
+        else:
+            temp_path, content_hash, upload_size = await save_upload(image)
         
         try:
             # 建立轉換選項
@@ -186,63 +408,207 @@ async def convert_image_enhanced(
                 color_mode=color_mode,
                 contrast=contrast,
                 brightness=brightness,
+                gamma=gamma,
+                auto_levels=auto_levels,
                 edge_detection=edge_detection,
                 edge_threshold=edge_threshold,
                 denoise=denoise,
                 sharpen=sharpen,
                 invert=invert,
                 dithering=dithering,
-                custom_chars=custom_chars
+                custom_chars=custom_chars,
+                mapping=mapping,
+                prescale=prescale
             )
             
-            # 轉換圖片
-            converter = EnhancedImageConverter(options)
-            result = converter.convert_to_art(temp_path)
+            # 相同圖片與設定已轉換過時直接使用快取的結果
+            result_id = store_key(content_hash, dict(asdict(options), encoding=encoding))
+            cached = await run_in_threadpool(read_result, result_id)
+            if cached is not None:
+                result_meta, result_json = cached
+                result_width, result_height = result_meta["width"], result_meta["height"]
+            else:
+                # 依預估成本取得執行許可後，在共用執行池的優先通道轉換（不阻塞事件迴圈）
+                source_size = await run_in_threadpool(image_size, temp_path)
+                cost = estimate_image_cost(width, *source_size, color_mode, upload_size, mapping, dithering)
+                async with admission.admit(cost):
+                    converter = EnhancedImageConverter(options)
+                    conversion_started = time.perf_counter()
+                    # 壓縮與序列化也在工作執行緒中完成
+                    result_width, result_height, result_json = await asyncio.wrap_future(
+                        shared_pool.submit(convert_image_json, converter, temp_path, encoding, priority=True)
+                    )
+                    benchmark_history.record(color_mode, cost.model_seconds, time.perf_counter() - conversion_started,
+                                             "image", converter.pipeline.band_count((result_width, result_height)))
+                
+                try:
+                    await run_in_threadpool(
+                        write_result, result_id, {"width": result_width, "height": result_height}, result_json
+                    )
+                except Exception as e:
+                    logger.warning(f"無法寫入結果快取: {e}")
+            
+            # 之後可由內容雜湊與選項組成的網址以 GET 取得（可被瀏覽器與 CDN 快取）
+            url = conversion_url("/api/v2/convert", content_hash, options, encoding=encoding)
             
             # 回傳結果
-            return {
+            return JSONBody({
                 "status": "success",
                 "type": "image",
                 "version": "v2",
                 "meta": {
-                    "original_filename": image.filename,
+                    "original_filename": filename,
                     "art_type": art_type,
                     "color_mode": color_mode,
-                    "width": result["width"],
-                    "height": result["height"],
+                    "width": result_width,
+                    "height": result_height,
+                    "result_url": url,
                     "options": {
                         "contrast": contrast,
                         "brightness": brightness,
+                        "gamma": gamma,
+                        "auto_levels": auto_levels,
                         "edge_detection": edge_detection,
                         "denoise": denoise,
                         "sharpen": sharpen,
                         "invert": invert,
-                        "dithering": dithering
+                        "dithering": dithering,
+                        "mapping": mapping,
+                        "prescale": prescale,
+                        "encoding": encoding
                     }
                 },
-                "data": result
-            }
+                "data": RawJSON(result_json)
+            }, headers={"Content-Location": url})
         
         finally:
-            # 清理臨時檔案
-            if os.path.exists(temp_path):
+            # 清理臨時檔案（分塊上傳保留到過期或刪除，可以用其他設定再次轉換）
+            if source is not None:
+                source.release()
+            elif os.path.exists(temp_path):
                 os.unlink(temp_path)
     
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": f"處理圖片時發生錯誤: {str(e)}"}
         )
 
+@app.get("/api/v2/convert/{content_hash}")
+async def get_converted_image(
+    request: Request,
+    content_hash: str,
+    width: int = 100,
+    art_type: str = "block",
+    color_mode: str = "grayscale",
+    contrast: float = 1.0,
+    brightness: float = 1.0,
+    gamma: float = 1.0,
+    auto_levels: bool = False,
+    edge_detection: bool = False,
+    edge_threshold: int = 100,
+    denoise: bool = False,
+    sharpen: bool = False,
+    invert: bool = False,
+    dithering: bool = False,
+    custom_chars: Optional[str] = None,
+    mapping: str = "brightness",
+    prescale: int = 3,
+    encoding: str = "none"
+):
+    """
+    以內容雜湊與選項讀取已轉換的圖片
+    
+    網址為 POST /api/v2/convert 回應的 meta.result_url（圖片的 sha256 加上同名的選項）。
+    結果永遠不變，回應帶強 ETag 與 Cache-Control: immutable，If-None-Match 相符時回傳 304；
+    尚未轉換或已被淘汰時回傳 404，請改以 POST 上傳。
+    """
+    digest = parse_content_hash(content_hash)
+    if digest is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "找不到轉換結果"}
+        )
+    
+    # 建立轉換選項
+    options = ConversionOptions(
+        width=width,
+        art_type=art_type,
+        color_mode=color_mode,
+        contrast=contrast,
+        brightness=brightness,
+        gamma=gamma,
+        auto_levels=auto_levels,
+        edge_detection=edge_detection,
+        edge_threshold=edge_threshold,
+        denoise=denoise,
+        sharpen=sharpen,
+        invert=invert,
+        dithering=dithering,
+        custom_chars=custom_chars,
+        mapping=mapping,
+        prescale=prescale
+    )
+    
+    result_id = store_key(digest, dict(asdict(options), encoding=encoding))
+    etag = entity_tag(result_id)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    
+    cached = await run_in_threadpool(read_result, result_id)
+    if cached is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "找不到轉換結果，請以 POST /api/v2/convert 上傳圖片"}
+        )
+    result_meta, result_json = cached
+    
+    # 標示回應壓縮使用的字元集字典
+    select_dictionary(request, art_type, mapping, custom_chars)
+    
+    return JSONBody({
+        "status": "success",
+        "type": "image",
+        "version": "v2",
+        "meta": {
+            "art_type": art_type,
+            "color_mode": color_mode,
+            "width": result_meta["width"],
+            "height": result_meta["height"],
+            "result_url": conversion_url("/api/v2/convert", digest, options, encoding=encoding),
+            "options": {
+                "contrast": contrast,
+                "brightness": brightness,
+                "gamma": gamma,
+                "auto_levels": auto_levels,
+                "edge_detection": edge_detection,
+                "denoise": denoise,
+                "sharpen": sharpen,
+                "invert": invert,
+                "dithering": dithering,
+                "mapping": mapping,
+                "prescale": prescale,
+                "encoding": encoding
+            }
+        },
+        "data": RawJSON(result_json)
+    }, headers=cache_headers(etag))
+
 @app.post("/api/v2/convert-video")
 async def convert_video_enhanced(
-    video: UploadFile = File(...),
+    request: Request,
+    video: Optional[UploadFile] = File(None),
     width: int = Form(60),
     fps: int = Form(24),
     art_type: str = Form("block"),
     color_mode: str = Form("grayscale"),
     contrast: float = Form(1.0),
     brightness: float = Form(1.0),
+    gamma: float = Form(1.0),
+    auto_levels: bool = Form(False),
     edge_detection: bool = Form(False),
     edge_threshold: int = Form(100),
     denoise: bool = Form(False),
@@ -250,22 +616,75 @@ async def convert_video_enhanced(
     invert: bool = Form(False),
     dithering: bool = Form(False),
     custom_chars: Optional[str] = Form(None),
-    num_threads: int = Form(4)
+    mapping: str = Form("brightness"),
+    prescale: int = Form(3),
+    num_threads: int = Form(4),
+    encoding: str = Form("none"),
+    sampling: str = Form("fixed"),
+    max_gap: float = Form(2.0),
+    segments: int = Form(1),
+    time_budget: Optional[float] = Form(None),
+    upload_id: Optional[str] = Form(None)
 ):
-    """增強版影片轉字元藝術 API"""
+    """
+    增強版影片轉字元藝術 API
+    
+    time_budget（秒）為整個請求的時間預算：預測會超時時降低品質，調整記錄在 meta.quality_changes。
+    大型影片可先以分塊上傳（/api/v2/uploads）傳送，再以 upload_id 轉換。
+    """
+    request_started = time.monotonic()
     try:
+        # 已完成的分塊上傳直接使用磁碟上的檔案
+        source = None
+        if upload_id is not None:
+            source = completed_upload(upload_id)
+            if source is None:
+                return JSONResponse(
+                    status_code=404,
+                    content={"status": "error", "message": f"找不到已完成的上傳: {upload_id}"}
+                )
+            filename, content_type = source.filename, source.content_type
+        elif video is not None:
+            filename, content_type = video.filename, video.content_type
+        else:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": "請上傳影片檔案"}
+            )
+        
         # 檢查檔案類型
-        if not video.content_type.startswith('video/'):
+        if not content_type.startswith('video/'):
             return JSONResponse(
                 status_code=400,
                 content={"status": "error", "message": "請上傳影片檔案"}
             )
         
-        # 創建臨時檔案
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".tmp") as tmp_file:
-            content = await video.read()
-            tmp_file.write(content)
-            temp_path = tmp_file.name
+        if encoding not in ["none", "auto"] + ENCODING_METHODS:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": f"不支援的壓縮方法: {encoding}"}
+            )
+        
+        if sampling not in ["fixed", "adaptive"]:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": f"不支援的取樣方式: {sampling}"}
+            )
+        
+        # 標示回應壓縮使用的字元集字典
+        select_dictionary(request, art_type, mapping, custom_chars)
+        
+        # 分塊寫入臨時檔案（分塊上傳已在磁碟上並算好雜湊，不佔用記憶體預算）
+        if source is not None:
+            # 轉換期間上傳不會被刪除或過期
+            source.acquire()
+            temp_path, content_hash, upload_size = source.path, source.content_hash, 0
+        else:
+            temp_path, content_hash, upload_size = await save_upload(video)
+        
+        # 客戶端中斷連線時取消轉換
+        cancel_token = CancellationToken()
+        watcher = watch_disconnect(request, cancel_token)
         
         try:
             # 建立轉換選項
@@ -275,45 +694,448 @@ async def convert_video_enhanced(
                 color_mode=color_mode,
                 contrast=contrast,
                 brightness=brightness,
+                gamma=gamma,
+                auto_levels=auto_levels,
                 edge_detection=edge_detection,
                 edge_threshold=edge_threshold,
                 denoise=denoise,
                 sharpen=sharpen,
                 invert=invert,
                 dithering=dithering,
-                custom_chars=custom_chars
+                custom_chars=custom_chars,
+                mapping=mapping,
+                prescale=prescale
             )
             
-            # 轉換影片
-            converter = EnhancedVideoConverter(options, num_threads=num_threads)
-            frames_data, duration, total_frames = converter.convert_video(temp_path, fps)
+            # 相同影片與設定已轉換過時直接從幀容器讀取
+            settings = video_settings(options, fps, sampling, max_gap, segments)
+            store_id = store_key(content_hash, settings)
+            store = FrameStore.open(store_id)
+            video_id = store_id if store is not None else None
+            quality_changes, predicted_seconds = [], None
+            if store is not None:
+                frames_data = await run_in_threadpool(store.read_frames, 0)
+                duration, total_frames = store.header["duration"], store.header["total_frames"]
+            else:
+                # 依預估成本取得執行許可後，在執行緒中轉換（不阻塞事件迴圈）
+                # 區段的工作行程也計入成本（有時間預算時不切分）
+                info = await run_in_threadpool(read_video_info, temp_path)
+                used_segments = segment_count(segments, info["frame_count"]) if time_budget is None else 1
+                cost = estimate_video_cost(width, info, fps, color_mode, upload_size, mapping, dithering,
+                                           used_segments)
+                async with admission.admit(cost):
+                    # 排隊期間已中斷的請求不再轉換
+                    cancel_token.check()
+                    converter = EnhancedVideoConverter(options, num_threads=num_threads)
+                    remaining_budget = None
+                    if time_budget is not None:
+                        # 上傳與排隊的時間也算在預算內
+                        remaining_budget = max(0.0, time_budget - (time.monotonic() - request_started))
+                    conversion_started = time.perf_counter()
+                    frames_data, duration, total_frames = await run_in_threadpool(
+                        converter.convert_video, temp_path, fps, sampling, max_gap, segments, cancel_token,
+                        remaining_budget, encoding
+                    )
+                    quality_changes = converter.quality_changes
+                    predicted_seconds = converter.predicted_seconds
+                    
+                    # 記錄實際耗時以校正成本模型（模型以固定取樣與完整品質估計）
+                    if sampling == "fixed" and not quality_changes:
+                        benchmark_history.record(color_mode, cost.model_seconds, time.perf_counter() - conversion_started,
+                                                 "video", converter.parallelism)
+                    
+                    # 寫入幀容器，之後可依範圍讀取（播放器跳轉不需重新轉換）
+                    # 因時間預算降級的結果不寫入，之後相同的請求仍以完整品質轉換
+                    if frames_data and not quality_changes:
+                        try:
+                            await run_in_threadpool(
+                                write_store, store_id, frames_data, converter.pipeline.chars,
+                                len(frames_data[0]["art"][0]), len(frames_data[0]["art"]),
+                                fps, duration, total_frames
+                            )
+                            video_id = store_id
+                        except Exception as e:
+                            logger.warning(f"無法寫入幀容器: {e}")
+            height = len(frames_data[0]["art"]) if frames_data else 0
+            output_width = len(frames_data[0]["art"][0]) if frames_data else width
+            output_fps = next((change["to"] for change in quality_changes if change["stage"] == "fps"), fps)
+            
+            # 沒有人會讀取的回應不再壓縮與序列化
+            cancel_token.check()
+            
+            # 每一幀各自選擇最小的壓縮方法並序列化；轉換時已在工作執行緒中完成，
+            # 從幀容器讀取時在執行緒中處理。主執行緒只串接各幀的片段
+            fragments = await run_in_threadpool(frame_fragments, frames_data, encoding)
+            
+            # 寫入幀容器的結果之後可由內容雜湊與選項組成的網址以 GET 取得
+            url = None
+            if video_id is not None:
+                url = conversion_url("/api/v2/convert-video", content_hash, options, fps=fps, sampling=sampling,
+                                     max_gap=max_gap, segments=settings["segments"], encoding=encoding)
             
             # 回傳結果
-            return {
+            return JSONBody({
                 "status": "success",
                 "type": "video",
                 "version": "v2",
                 "meta": {
-                    "original_filename": video.filename,
+                    "original_filename": filename,
                     "art_type": art_type,
                     "color_mode": color_mode,
-                    "width": width,
-                    "height": len(frames_data[0]["art"]) if frames_data else 0,
-                    "fps": fps,
+                    "width": output_width,
+                    "height": height,
+                    "fps": output_fps,
                     "duration": duration,
                     "total_frames": total_frames,
+                    "video_id": video_id,
+                    "frames_url": f"/api/v2/videos/{video_id}/frames" if video_id else None,
+                    "result_url": url,
+                    "quality_changes": quality_changes,
+                    "predicted_seconds": predicted_seconds,
                     "options": {
                         "contrast": contrast,
                         "brightness": brightness,
+                        "gamma": gamma,
+                        "auto_levels": auto_levels,
                         "edge_detection": edge_detection,
                         "denoise": denoise,
                         "sharpen": sharpen,
                         "invert": invert,
-                        "dithering": dithering
+                        "dithering": dithering,
+                        "mapping": mapping,
+                        "prescale": prescale,
+                        "encoding": encoding,
+                        "sampling": sampling,
+                        "max_gap": max_gap,
+                        "segments": segments,
+                        "time_budget": time_budget
                     }
                 },
                 "data": {
-                    "frames": frames_data
+                    "frames": RawJSON(fragments)
+                }
+            }, headers={"Content-Location": url} if url else None)
+        
+        finally:
+            watcher.cancel()
+            # 清理臨時檔案（分塊上傳保留到過期或刪除）
+            if source is not None:
+                source.release()
+            elif os.path.exists(temp_path):
+                os.unlink(temp_path)
+    
+    except ConversionCancelled:
+        logger.info(f"客戶端已中斷連線，取消轉換: {filename}")
+        return JSONResponse(
+            status_code=499,
+            content={"status": "error", "message": "客戶端已中斷連線"}
+        )
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"處理影片時發生錯誤: {str(e)}"}
+        )
+
+@app.get("/api/v2/convert-video/{content_hash}")
+async def get_converted_video(
+    request: Request,
+    content_hash: str,
+    width: int = 60,
+    fps: int = 24,
+    art_type: str = "block",
+    color_mode: str = "grayscale",
+    contrast: float = 1.0,
+    brightness: float = 1.0,
+    gamma: float = 1.0,
+    auto_levels: bool = False,
+    edge_detection: bool = False,
+    edge_threshold: int = 100,
+    denoise: bool = False,
+    sharpen: bool = False,
+    invert: bool = False,
+    dithering: bool = False,
+    custom_chars: Optional[str] = None,
+    mapping: str = "brightness",
+    prescale: int = 3,
+    encoding: str = "none",
+    sampling: str = "fixed",
+    max_gap: float = 2.0,
+    segments: int = 1
+):
+    """
+    以內容雜湊與選項讀取已轉換的影片
+    
+    網址為 POST /api/v2/convert-video 回應的 meta.result_url，從幀容器讀取；
+    快取方式同 GET /api/v2/convert/{content_hash}。
+    """
+    digest = parse_content_hash(content_hash)
+    if digest is None or encoding not in ["none", "auto"] + ENCODING_METHODS:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "找不到轉換結果"}
+        )
+    
+    # 建立轉換選項
+    options = ConversionOptions(
+        width=width,
+        art_type=art_type,
+        color_mode=color_mode,
+        contrast=contrast,
+        brightness=brightness,
+        gamma=gamma,
+        auto_levels=auto_levels,
+        edge_detection=edge_detection,
+        edge_threshold=edge_threshold,
+        denoise=denoise,
+        sharpen=sharpen,
+        invert=invert,
+        dithering=dithering,
+        custom_chars=custom_chars,
+        mapping=mapping,
+        prescale=prescale
+    )
+    
+    settings = video_settings(options, fps, sampling, max_gap, segments)
+    video_id = store_key(digest, settings)
+    etag = entity_tag(video_id, encoding)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    
+    store = FrameStore.open(video_id)
+    if store is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "找不到轉換結果，請以 POST /api/v2/convert-video 上傳影片"}
+        )
+    
+    try:
+        # 標示回應壓縮使用的字元集字典
+        select_dictionary(request, art_type, mapping, custom_chars)
+        
+        frames_data = await run_in_threadpool(store.read_frames, 0)
+        fragments = await run_in_threadpool(frame_fragments, frames_data, encoding)
+        
+        return JSONBody({
+            "status": "success",
+            "type": "video",
+            "version": "v2",
+            "meta": {
+                "art_type": art_type,
+                "color_mode": color_mode,
+                "width": store.width,
+                "height": store.height,
+                "fps": store.header["fps"],
+                "duration": store.header["duration"],
+                "total_frames": store.header["total_frames"],
+                "video_id": video_id,
+                "frames_url": f"/api/v2/videos/{video_id}/frames",
+                "result_url": conversion_url("/api/v2/convert-video", digest, options, fps=fps, sampling=sampling,
+                                             max_gap=max_gap, segments=settings["segments"], encoding=encoding),
+                "options": {
+                    "contrast": contrast,
+                    "brightness": brightness,
+                    "gamma": gamma,
+                    "auto_levels": auto_levels,
+                    "edge_detection": edge_detection,
+                    "denoise": denoise,
+                    "sharpen": sharpen,
+                    "invert": invert,
+                    "dithering": dithering,
+                    "mapping": mapping,
+                    "prescale": prescale,
+                    "encoding": encoding,
+                    "sampling": sampling,
+                    "max_gap": max_gap,
+                    "segments": settings["segments"]
+                }
+            },
+            "data": {
+                "frames": RawJSON(fragments)
+            }
+        }, headers=cache_headers(etag))
+    
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"讀取影片時發生錯誤: {str(e)}"}
+        )
+
+@app.post("/api/v2/uploads")
+async def create_chunked_upload(
+    filename: str = Form(...),
+    content_type: Optional[str] = Form(None),
+    size: Optional[int] = Form(None)
+):
+    """
+    建立分塊上傳
+    
+    之後以 PUT /api/v2/uploads/{upload_id}?offset= 依序傳送區塊，完成後呼叫 /complete，
+    再把 upload_id 傳給轉換端點（取代上傳檔案）。連線中斷時以 GET 查詢 offset 後繼續。
+    """
+    try:
+        upload = create_upload(filename, content_type, size)
+        return JSONResponse(status_code=201, content={
+            "status": "success",
+            **upload.info(),
+            "upload_url": f"/api/v2/uploads/{upload.upload_id}"
+        })
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"建立上傳時發生錯誤: {str(e)}"}
+        )
+
+@app.get("/api/v2/uploads/{upload_id}")
+async def get_chunked_upload(upload_id: str):
+    """查詢上傳進度（已收到的 offset）"""
+    upload = get_upload(upload_id)
+    if upload is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"找不到上傳: {upload_id}"}
+        )
+    return JSONResponse(content={"status": "success", **upload.info()}, headers={"Cache-Control": "no-store"})
+
+@app.put("/api/v2/uploads/{upload_id}")
+async def put_upload_chunk(request: Request, upload_id: str, offset: int):
+    """
+    寫入一個區塊（請求本文為原始位元組）
+    
+    區塊直接寫入磁碟並累計 sha256，不會整個留在記憶體中；offset 不符時回傳 409 與目前的 offset。
+    """
+    upload = get_upload(upload_id)
+    if upload is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"找不到上傳: {upload_id}"}
+        )
+    
+    try:
+        new_offset = await upload.append(offset, request.stream())
+        return JSONResponse(content={"status": "success", "upload_id": upload_id, "offset": new_offset})
+    except ClientDisconnect:
+        # 已收到的部分保留，客戶端重新連線後查詢 offset 繼續
+        logger.info(f"上傳中斷於 {upload.offset} 位元組: {upload_id}")
+        return Response(status_code=400)
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"寫入區塊時發生錯誤: {str(e)}", "offset": upload.offset}
+        )
+
+@app.post("/api/v2/uploads/{upload_id}/complete")
+async def complete_chunked_upload(upload_id: str, sha256: Optional[str] = Form(None)):
+    """完成上傳；sha256 為客戶端計算的雜湊時一併驗證"""
+    upload = get_upload(upload_id)
+    if upload is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"找不到上傳: {upload_id}"}
+        )
+    
+    try:
+        upload.finish(sha256)
+        return JSONResponse(content={"status": "success", **upload.info()})
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+
+@app.delete("/api/v2/uploads/{upload_id}")
+async def delete_chunked_upload(upload_id: str):
+    """刪除上傳（未刪除的上傳在 CHARACTER_ART_UPLOAD_TTL 後自動清除）"""
+    if not remove_upload(upload_id):
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"找不到上傳: {upload_id}"}
+        )
+    return JSONResponse(content={"status": "success", "upload_id": upload_id})
+
+# 成本估計時最多讀取的上傳大小（容器標頭通常在檔案開頭）
+PROBE_MAX_BYTES = 8 * 1024 * 1024
+
+@app.post("/api/v2/probe")
+async def probe_conversion(
+    file: UploadFile = File(...),
+    width: int = Form(100),
+    fps: int = Form(24),
+    color_mode: str = Form("grayscale"),
+    mapping: str = Form("brightness"),
+    dithering: bool = Form(False),
+    file_size: Optional[int] = Form(None)
+):
+    """
+    估計轉換成本（不轉換）
+    
+    只讀取上傳檔案的前 8MB，客戶端可以只上傳檔案開頭並以 file_size 告知完整大小。
+    回傳來源尺寸、長度、幀率、輸出字元格，以及預估的 CPU 時間、回應大小與記憶體；
+    CPU 時間依本機的轉換記錄校正。
+    """
+    try:
+        is_video = file.content_type.startswith('video/')
+        if not is_video and not file.content_type.startswith('image/'):
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": "請上傳圖片或影片檔案"}
+            )
+        
+        temp_path, _, upload_size = await save_upload(file, max_bytes=PROBE_MAX_BYTES)
+        upload_bytes = file_size or upload_size
+        
+        try:
+            try:
+                if is_video:
+                    info = await run_in_threadpool(read_video_info, temp_path)
+                else:
+                    source_width, source_height = await run_in_threadpool(image_size, temp_path)
+            except Exception as e:
+                return JSONResponse(
+                    status_code=400,
+                    content={"status": "error", "message": f"無法讀取檔案資訊: {str(e)}"}
+                )
+            
+            if is_video:
+                source = {
+                    "type": "video",
+                    "width": info["width"],
+                    "height": info["height"],
+                    "fps": info["fps"],
+                    "duration": info["duration"],
+                    "frame_count": info["frame_count"]
+                }
+                frames = sampled_frames(info, fps)
+                cost = estimate_video_cost(width, info, fps, color_mode, upload_bytes, mapping, dithering)
+            else:
+                source = {"type": "image", "width": source_width, "height": source_height}
+                frames = 1
+                cost = estimate_image_cost(width, source_width, source_height, color_mode, upload_bytes,
+                                           mapping, dithering)
+            
+            columns, rows = output_grid(width, source["width"], source["height"])
+            calibration, history_samples = benchmark_history.calibration(color_mode, "video" if is_video else "image")
+            
+            return {
+                "status": "success",
+                "type": "probe",
+                "source": source,
+                "output": {
+                    "width": columns,
+                    "height": rows,
+                    "frames": frames,
+                    "fps": fps if is_video else None
+                },
+                "estimate": {
+                    "cpu_seconds": round(cost.cpu_seconds, 3),
+                    "memory_bytes": cost.memory_bytes,
+                    "response_bytes": estimate_response_bytes(columns, rows, frames, color_mode),
+                    "calibration": round(calibration, 3),
+                    "history_samples": history_samples,
+                    "exceeds_memory_budget": cost.memory_bytes > admission.memory_budget
                 }
             }
         
@@ -325,7 +1147,188 @@ async def convert_video_enhanced(
     except Exception as e:
         return JSONResponse(
             status_code=500,
-            content={"status": "error", "message": f"處理影片時發生錯誤: {str(e)}"}
+            content={"status": "error", "message": f"估計轉換成本時發生錯誤: {str(e)}"}
+        )
+
+@app.get("/api/v2/videos/{video_id}")
+async def get_video_info(request: Request, video_id: str):
+    """已轉換影片的資訊與幀容器格式（video_id 由內容決定，可永久快取）"""
+    store = FrameStore.open(video_id)
+    if store is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": f"找不到影片: {video_id}"}
+        )
+    etag = entity_tag(video_id)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    return JSONBody({"status": "success", "video_id": video_id, "meta": store.info()}, headers=cache_headers(etag))
+
+@app.get("/api/v2/videos/{video_id}/frames")
+async def get_video_frames(
+    request: Request,
+    video_id: str,
+    start: int = 0,
+    count: Optional[int] = None,
+    format: str = "json",
+    encoding: str = "none"
+):
+    """
+    讀取已轉換影片的任意幀範圍
+    
+    format=json 回傳與 convert-video 相同格式的幀；format=binary 直接回傳
+    mmap 上連續的固定大小幀資料（格式見 /api/v2/videos/{video_id} 的 layout）。
+    同一網址的內容永遠不變，回應帶強 ETag 與 Cache-Control: immutable。
+    """
+    try:
+        store = FrameStore.open(video_id)
+        if store is None:
+            return JSONResponse(
+                status_code=404,
+                content={"status": "error", "message": f"找不到影片: {video_id}"}
+            )
+        
+        if encoding not in ["none", "auto"] + ENCODING_METHODS:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": f"不支援的壓縮方法: {encoding}"}
+            )
+        
+        first, end = store.clamp(start, count)
+        etag = entity_tag(video_id, first, end, format, encoding)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        if format == "binary":
+            return Response(
+                content=await run_in_threadpool(store.raw_frames, first, end - first),
+                media_type="application/octet-stream",
+                headers=dict(cache_headers(etag), **{
+                    "X-Frame-Start": str(first),
+                    "X-Frame-Count": str(end - first),
+                    "X-Frame-Size": str(store.frame_dtype.itemsize)
+                })
+            )
+        
+        frames_data = await run_in_threadpool(store.read_frames, first, end - first)
+        fragments = await run_in_threadpool(frame_fragments, frames_data, encoding)
+        
+        return JSONBody({
+            "status": "success",
+            "video_id": video_id,
+            "start": first,
+            "count": end - first,
+            "frame_count": store.frame_count,
+            "frames": RawJSON(fragments)
+        }, headers=cache_headers(etag))
+    
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"讀取影片幀時發生錯誤: {str(e)}"}
+        )
+
+@app.post("/api/v2/convert-batch")
+async def convert_batch_enhanced(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    width: int = Form(100),
+    art_type: str = Form("block"),
+    color_mode: str = Form("grayscale"),
+    contrast: float = Form(1.0),
+    brightness: float = Form(1.0),
+    gamma: float = Form(1.0),
+    auto_levels: bool = Form(False),
+    edge_detection: bool = Form(False),
+    edge_threshold: int = Form(100),
+    denoise: bool = Form(False),
+    sharpen: bool = Form(False),
+    invert: bool = Form(False),
+    dithering: bool = Form(False),
+    custom_chars: Optional[str] = Form(None),
+    mapping: str = Form("brightness"),
+    prescale: int = Form(3),
+    num_threads: int = Form(4)
+):
+    """
+    批次圖片轉字元藝術 API
+    
+    接受多張圖片或 zip/tar 壓縮檔，所有項目共用同一組轉換選項並行處理。
+    結果以 NDJSON 串流回傳：每完成一張就輸出一行，單張失敗不影響整批，
+    最後一行為摘要。
+    """
+    try:
+        # 標示回應壓縮使用的字元集字典
+        select_dictionary(request, art_type, mapping, custom_chars)
+        
+        # 讀取並展開上傳檔案（整批的項目數與解壓縮後大小有上限）
+        items = []
+        total_bytes = 0
+        for upload in files:
+            content = await upload.read()
+            expanded = await run_in_threadpool(
+                expand_upload, upload.filename, content,
+                BATCH_MAX_ITEMS - len(items), BATCH_MAX_BYTES - total_bytes
+            )
+            items.extend(expanded)
+            total_bytes += sum(len(data) for _, data in expanded)
+        
+        if not items:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": "請上傳圖片檔案或包含圖片的壓縮檔"}
+            )
+        
+        # 建立轉換選項
+        options = ConversionOptions(
+            width=width,
+            art_type=art_type,
+            color_mode=color_mode,
+            contrast=contrast,
+            brightness=brightness,
+            gamma=gamma,
+            auto_levels=auto_levels,
+            edge_detection=edge_detection,
+            edge_threshold=edge_threshold,
+            denoise=denoise,
+            sharpen=sharpen,
+            invert=invert,
+            dithering=dithering,
+            custom_chars=custom_chars,
+            mapping=mapping,
+            prescale=prescale
+        )
+        
+        # 整批的預估成本在串流結束前都佔用預算
+        cost = await run_in_threadpool(estimate_batch_cost, width, items, color_mode, mapping, dithering)
+        converter = BatchImageConverter(options, num_threads=num_threads)
+        
+        async def stream():
+            async with admission.admit(cost):
+                # 取得許可後先停在這裡，讓回應開始前就能回傳 503
+                yield b""
+                async for line in iterate_in_threadpool(converter.stream_ndjson(items)):
+                    yield line
+        
+        # 無法接受時在這裡拋出 AdmissionRejected；之後串流結束、中斷或從未開始
+        # （由背景工作或垃圾回收關閉產生器）都會離開 admit 並歸還預算
+        lines = stream()
+        await lines.__anext__()
+        return StreamingResponse(lines, media_type="application/x-ndjson", background=BackgroundTask(lines.aclose))
+    
+    except BatchTooLarge as e:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "error", "message": str(e)}
+        )
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": f"處理批次圖片時發生錯誤: {str(e)}"}
         )
 
 if __name__ == "__main__":
@@ -4,6 +4,15 @@ from typing import List, Dict, Optional, Tuple
 from io import BytesIO
 import html
 
+from enhanced_converter import ColorPalette
+
+# xterm 256 色的前 16 色與 6x6x6 色塊各階的亮度
+XTERM_BASE_COLORS = [
+    (0, 0, 0), (128, 0, 0), (0, 128, 0), (128, 128, 0), (0, 0, 128), (128, 0, 128), (0, 128, 128), (192, 192, 192),
+    (128, 128, 128), (255, 0, 0), (0, 255, 0), (255, 255, 0), (0, 0, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+]
+XTERM_CUBE_LEVELS = [0, 95, 135, 175, 215, 255]
+
 class OutputFormatter:
     """輸出格式化器，支援多種輸出格式"""
     
@@ -13,11 +22,8 @@ class OutputFormatter:
         return '\n'.join(art_lines)
     
     @staticmethod
-    def to_ansi(art_lines: List[str], colors: Optional[List[List[any]]] = None) -> str:
-        """轉換為 ANSI 終端格式"""
-        if not colors:
-            return '\n'.join(art_lines)
-        
+    def _ansi_color_code(color: any, background: bool = False) -> Optional[str]:
+        """將顏色資料轉換為 ANSI SGR 參數（前景或背景）"""
         # ANSI 顏色碼
         ANSI_COLORS = {
             'black': 30,
@@ -30,24 +36,58 @@ class OutputFormatter:
             'white': 37,
         }
         
+        if isinstance(color, str) and color in ANSI_COLORS:
+            return str(ANSI_COLORS[color] + (10 if background else 0))
+        elif isinstance(color, int):
+            # ANSI 256 色
+            return f"{48 if background else 38};5;{color}"
+        elif isinstance(color, (tuple, list)) and len(color) == 3:
+            # True Color (24-bit)
+            r, g, b = color
+            return f"{48 if background else 38};2;{r};{g};{b}"
+        return None
+    
+    @staticmethod
+    def _rgb_color(color: any) -> Optional[Tuple[int, int, int]]:
+        """將顏色資料（ANSI 顏色名稱、ANSI 256 色碼或 RGB）轉換為 RGB"""
+        if isinstance(color, str):
+            return ColorPalette.ANSI_COLORS.get(color)
+        elif isinstance(color, int) and 0 <= color < 256:
+            # xterm 256 色：16 個基本色、6x6x6 色塊、24 階灰
+            if color < 16:
+                return XTERM_BASE_COLORS[color]
+            if color < 232:
+                index = color - 16
+                return tuple(XTERM_CUBE_LEVELS[index // 6 ** p % 6] for p in (2, 1, 0))
+            gray = 8 + 10 * (color - 232)
+            return gray, gray, gray
+        elif isinstance(color, (tuple, list)) and len(color) == 3:
+            return tuple(color)
+        return None
+    
+    @staticmethod
+    def to_ansi(art_lines: List[str], colors: Optional[List[List[any]]] = None,
+                background_colors: Optional[List[List[any]]] = None) -> str:
+        """轉換為 ANSI 終端格式（background_colors 用於半格模式的背景色）"""
+        if not colors and not background_colors:
+            return '\n'.join(art_lines)
+        
+        def color_at(grid, row_idx, col_idx):
+            if grid and row_idx < len(grid) and col_idx < len(grid[row_idx]):
+                return grid[row_idx][col_idx]
+            return None
+        
         output_lines = []
         for row_idx, line in enumerate(art_lines):
             colored_line = ""
             for col_idx, char in enumerate(line):
-                if colors and row_idx < len(colors) and col_idx < len(colors[row_idx]):
-                    color = colors[row_idx][col_idx]
-                    if isinstance(color, str) and color in ANSI_COLORS:
-                        color_code = ANSI_COLORS[color]
-                        colored_line += f"\033[{color_code}m{char}\033[0m"
-                    elif isinstance(color, int):
-                        # ANSI 256 色
-                        colored_line += f"\033[38;5;{color}m{char}\033[0m"
-                    elif isinstance(color, tuple) and len(color) == 3:
-                        # True Color (24-bit)
-                        r, g, b = color
-                        colored_line += f"\033[38;2;{r};{g};{b}m{char}\033[0m"
-                    else:
-                        colored_line += char
+                codes = [
+                    OutputFormatter._ansi_color_code(color_at(colors, row_idx, col_idx)),
+                    OutputFormatter._ansi_color_code(color_at(background_colors, row_idx, col_idx), background=True),
+                ]
+                codes = [code for code in codes if code]
+                if codes:
+                    colored_line += f"\033[{';'.join(codes)}m{char}\033[0m"
                 else:
                     colored_line += char
             output_lines.append(colored_line)
@@ -57,8 +97,9 @@ class OutputFormatter:
     @staticmethod
     def to_html(art_lines: List[str], colors: Optional[List[List[any]]] = None, 
                 font_size: int = 8, font_family: str = "monospace",
-                background_color: str = "#000000") -> str:
-        """轉換為 HTML 格式"""
+                background_color: str = "#000000",
+                background_colors: Optional[List[List[any]]] = None) -> str:
+        """轉換為 HTML 格式（background_colors 用於半格模式的背景色）"""
         html_content = f"""<!DOCTYPE html>
 <html lang="zh-TW">
 <head>
@@ -98,15 +139,20 @@ class OutputFormatter:
             for col_idx, char in enumerate(line):
                 char_escaped = html.escape(char) if char != ' ' else '&nbsp;'
                 
+                style = "color: #00ff00"
                 if colors and row_idx < len(colors) and col_idx < len(colors[row_idx]):
-                    color = colors[row_idx][col_idx]
-                    if isinstance(color, tuple) and len(color) == 3:
+                    color = OutputFormatter._rgb_color(colors[row_idx][col_idx])
+                    if color:
                         r, g, b = color
-                        html_content += f'<span class="char" style="color: rgb({r},{g},{b})">{char_escaped}</span>'
-                    else:
-                        html_content += f'<span class="char" style="color: #00ff00">{char_escaped}</span>'
-                else:
-                    html_content += f'<span class="char" style="color: #00ff00">{char_escaped}</span>'
+                        style = f"color: rgb({r},{g},{b})"
+                
+                if background_colors and row_idx < len(background_colors) and col_idx < len(background_colors[row_idx]):
+                    color = OutputFormatter._rgb_color(background_colors[row_idx][col_idx])
+                    if color:
+                        r, g, b = color
+                        style += f"; background-color: rgb({r},{g},{b})"
+                
+                html_content += f'<span class="char" style="{style}">{char_escaped}</span>'
             
             html_content += '</div>\n'
         
@@ -173,8 +219,12 @@ class OutputFormatter:
         return json.dumps(data, indent=2, ensure_ascii=False)
     
     @staticmethod
-    def create_animated_gif(frames: List[Dict], output_path: str, fps: int = 24):
-        """創建動畫 GIF（需要額外的圖片處理）"""
+    def create_animated_gif(frames: List[Dict], output_path: str, fps: int = 24, use_timestamps: bool = False):
+        """
+        創建動畫 GIF（需要額外的圖片處理）
+        
+        use_timestamps 為 True 時每幀的顯示時間取自相鄰幀的 timestamp（適應性取樣的影片）
+        """
         from PIL import Image, ImageDraw, ImageFont
         
         images = []
@@ -217,6 +267,10 @@ class OutputFormatter:
         # 保存為 GIF
         if images:
             duration = int(1000 / fps)  # 毫秒
+            if use_timestamps:
+                timestamps = [frame["timestamp"] for frame in frames]
+                duration = [max(20, int(round((end - start) * 1000)))
+                            for start, end in zip(timestamps, timestamps[1:])] + [duration]
             images[0].save(
                 output_path,
                 save_all=True,
@@ -226,13 +280,20 @@ class OutputFormatter:
             )
     
     @staticmethod
-    def to_css_animation(frames: List[Dict], animation_name: str = "ascii-animation") -> str:
-        """生成 CSS 動畫"""
+    def to_css_animation(frames: List[Dict], animation_name: str = "ascii-animation", use_timestamps: bool = False) -> str:
+        """生成 CSS 動畫（use_timestamps 為 True 時關鍵影格位置依各幀的 timestamp）"""
+        total = len(frames) / 24
+        timing = f"steps({len(frames)})"
+        if use_timestamps and frames:
+            # 每幀維持到下一個關鍵影格
+            total = frames[-1]["timestamp"] + 1 / 24
+            timing = "steps(1, end)"
+        
         css_content = f"""
 .{animation_name} {{
     font-family: monospace;
     white-space: pre;
-    animation: {animation_name}-frames {len(frames) / 24}s steps({len(frames)}) infinite;
+    animation: {animation_name}-frames {total}s {timing} infinite;
 }}
 
 @keyframes {animation_name}-frames {{
@@ -240,6 +301,8 @@ class OutputFormatter:
         
         for idx, frame in enumerate(frames):
             percentage = (idx / len(frames)) * 100
+            if use_timestamps:
+                percentage = frame["timestamp"] / total * 100
             frame_content = '\\A'.join(frame["art"])
             css_content += f"""    {percentage:.2f}% {{
         content: "{frame_content}";
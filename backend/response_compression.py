@@ -0,0 +1,280 @@
+import os
+import gzip
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional, Set
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+# zstd / brotli 為選用套件，缺少時只提供其餘的編碼
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 預先訓練的字典（由 train_dictionaries.py 產生）
+DICTIONARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zstd_dictionaries")
+
+# 使用自己字典的映射方式（其餘依字元集選擇字典）
+DICTIONARY_MAPPINGS = ["braille", "halfblock"]
+
+# 客戶端在請求中列出已取得的字典 ID；回應中標示使用的字典與可取得的字典
+DICTIONARY_REQUEST_HEADER = "X-Zstd-Dictionary"
+DICTIONARY_AVAILABLE_HEADER = "X-Zstd-Dictionary-Available"
+
+# 只壓縮文字類回應
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+# 同樣優先權時的偏好順序
+PREFERENCE = ["zstd", "br", "gzip"]
+
+def available_encodings():
+    """伺服器支援的內容編碼"""
+    return [
+        encoding for encoding in PREFERENCE
+        if (encoding != "zstd" or zstandard is not None) and (encoding != "br" or brotli is not None)
+    ]
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    依 Accept-Encoding 選擇內容編碼
+
+    Returns:
+        "zstd" / "br" / "gzip"，或 None（不壓縮）
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+@lru_cache(maxsize=None)
+def load_dictionaries() -> Dict[str, "zstandard.ZstdCompressionDict"]:
+    """載入所有字典（字元集 -> 字典）"""
+    dictionaries = {}
+    if zstandard is None or not os.path.isdir(DICTIONARY_DIR):
+        return dictionaries
+
+    for name in sorted(os.listdir(DICTIONARY_DIR)):
+        key, ext = os.path.splitext(name)
+        if ext != ".zdict":
+            continue
+        with open(os.path.join(DICTIONARY_DIR, name), "rb") as f:
+            dictionary = zstandard.ZstdCompressionDict(f.read())
+        dictionary.precompute_compress(level=ZSTD_LEVEL)
+        dictionaries[key] = dictionary
+    return dictionaries
+
+def dictionary_ids() -> Dict[str, int]:
+    """字元集 -> 字典 ID"""
+    return {key: dictionary.dict_id() for key, dictionary in load_dictionaries().items()}
+
+def dictionary_bytes(dict_id: int) -> Optional[bytes]:
+    """依 ID 取得字典內容"""
+    for dictionary in load_dictionaries().values():
+        if dictionary.dict_id() == dict_id:
+            return dictionary.as_bytes()
+    return None
+
+def dictionary_key(art_type: str, mapping: str = "brightness", custom_chars: Optional[str] = None) -> Optional[str]:
+    """轉換設定對應的字典（自定義字元沒有字典）"""
+    if custom_chars:
+        return None
+    return mapping if mapping in DICTIONARY_MAPPINGS else art_type
+
+def select_dictionary(request, art_type: str, mapping: str = "brightness", custom_chars: Optional[str] = None):
+    """由端點呼叫：標示這個回應適用的字典"""
+    request.state.zstd_dictionary = dictionary_key(art_type, mapping, custom_chars)
+
+class _Compressor:
+    """單一回應的壓縮器（一次壓縮或串流）"""
+
+    def __init__(self, encoding: str, dictionary=None):
+        self.encoding = encoding
+        self.dictionary = dictionary
+        self._stream = None
+
+    def compress(self, body: bytes) -> bytes:
+        """一次壓縮整個回應"""
+        if self.encoding == "zstd":
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=self.dictionary).compress(body)
+        if self.encoding == "br":
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+    def compress_chunk(self, chunk: bytes, final: bool) -> bytes:
+        """串流壓縮；每個區塊都會送出（客戶端能即時解壓）"""
+        if self._stream is None:
+            if self.encoding == "zstd":
+                self._stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=self.dictionary).compressobj()
+            elif self.encoding == "br":
+                self._stream = brotli.Compressor(quality=BROTLI_QUALITY)
+            else:
+                self._stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+        if self.encoding == "zstd":
+            data = self._stream.compress(chunk)
+            return data + self._stream.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            data = self._stream.process(chunk)
+            return data + (self._stream.finish() if final else self._stream.flush())
+        data = self._stream.compress(chunk)
+        return data + self._stream.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class ResponseCompressionMiddleware:
+    """
+    依 Accept-Encoding 協商壓縮回應（zstd、brotli、gzip）
+
+    端點以 select_dictionary 標示字元集；客戶端在 X-Zstd-Dictionary 標頭列出已取得的
+    字典 ID 時，zstd 回應會使用該字典壓縮。適用的字典 ID 會以 X-Zstd-Dictionary-Available
+    告知，客戶端可從 /api/v2/zstd-dictionaries/{id} 取得一次後長期快取。
+    """
+
+    def __init__(self, app, minimum_size: int = 500, thread_minimum_size: int = 128 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_minimum_size = thread_minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = negotiate(headers.get("accept-encoding", ""))
+        held = set()
+        for value in headers.get(DICTIONARY_REQUEST_HEADER.lower(), "").split(","):
+            if value.strip().isdigit():
+                held.add(int(value.strip()))
+
+        # 端點透過 request.state 寫入的字典選擇
+        state = scope.setdefault("state", {})
+        responder = _CompressionResponder(self, encoding, held, state, send)
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    """處理單一回應的 ASGI 訊息"""
+
+    def __init__(self, middleware: ResponseCompressionMiddleware, encoding: Optional[str],
+                 held: Set[int], state: dict, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.held = held
+        self.state = state
+        self._send = send
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _prepare(self, headers: MutableHeaders):
+        """決定是否壓縮並設定回應標頭"""
+        content_type = headers.get("content-type", "")
+        if ("content-encoding" in headers or self.start_message["status"] == 206
+                or not content_type.startswith(COMPRESSIBLE_TYPES)):
+            self.passthrough = True
+            return
+
+        dictionary = None
+        key = self.state.get("zstd_dictionary")
+        if key is not None and zstandard is not None:
+            dictionary = load_dictionaries().get(key)
+
+        headers.add_vary_header("Accept-Encoding")
+        if dictionary is not None:
+            headers.add_vary_header(DICTIONARY_REQUEST_HEADER)
+            headers[DICTIONARY_AVAILABLE_HEADER] = str(dictionary.dict_id())
+
+        if self.encoding is None:
+            self.passthrough = True
+            return
+
+        # 只有客戶端已持有的字典才能使用
+        if self.encoding != "zstd" or dictionary is None or dictionary.dict_id() not in self.held:
+            dictionary = None
+        self.compressor = _Compressor(self.encoding, dictionary)
+        headers["Content-Encoding"] = self.encoding
+        if dictionary is not None:
+            headers[DICTIONARY_REQUEST_HEADER] = str(dictionary.dict_id())
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # 等第一個本文區塊決定是否壓縮後再送出
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body":
+            if self.start_message is not None:
+                await self._send(self.start_message)
+                self.start_message = None
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            self._prepare(headers)
+
+            if not self.passthrough and not more_body and len(body) < self.middleware.minimum_size:
+                # 太小的回應不值得壓縮
+                del headers["Content-Encoding"]
+                if DICTIONARY_REQUEST_HEADER in headers:
+                    del headers[DICTIONARY_REQUEST_HEADER]
+                self.passthrough = True
+
+            if not self.passthrough:
+                # 壓縮後是不同的位元組：強 ETag 加上內容編碼（與字典），與未壓縮的版本區分
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    suffix = self.encoding
+                    if DICTIONARY_REQUEST_HEADER in headers:
+                        suffix += f"-{headers[DICTIONARY_REQUEST_HEADER]}"
+                    headers["ETag"] = f'{etag[:-1]}-{suffix}"'
+                if more_body:
+                    del headers["Content-Length"]
+                    body = self.compressor.compress_chunk(body, final=False)
+                else:
+                    if len(body) >= self.middleware.thread_minimum_size:
+                        body = await anyio.to_thread.run_sync(self.compressor.compress, body)
+                    else:
+                        body = self.compressor.compress(body)
+                    headers["Content-Length"] = str(len(body))
+                    self.compressor = None
+
+            await self._send(self.start_message)
+            self.start_message = None
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        if not self.passthrough and self.compressor is not None:
+            body = self.compressor.compress_chunk(body, final=not more_body)
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
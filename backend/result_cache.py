@@ -0,0 +1,107 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+# 圖片轉換結果（已序列化的 JSON）的存放目錄與容量上限（可用環境變數覆寫）
+CACHE_DIR = os.environ.get(
+    "CHARACTER_ART_RESULT_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".result_cache")
+)
+CACHE_MAX_BYTES = int(os.environ.get("CHARACTER_ART_RESULT_CACHE_MAX_BYTES", 512 * 1024 ** 2))
+
+# 結果網址由內容雜湊與選項決定，內容永遠不變，瀏覽器與 CDN 可以永久快取
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+def result_path(result_id: str) -> Optional[str]:
+    """結果檔案路徑；ID 格式不正確時回傳 None（避免路徑穿越）"""
+    if not re.fullmatch(r"[0-9a-f]{32}", result_id):
+        return None
+    return os.path.join(CACHE_DIR, f"{result_id}.json")
+
+def write_result(result_id: str, meta: Dict[str, any], body: bytes):
+    """寫入結果：第一行為 meta（寬、高等），之後是原樣回傳的 JSON"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = result_path(result_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(json.dumps(meta).encode("utf-8") + b"\n")
+        f.write(body)
+    os.replace(tmp_path, path)
+    evict(keep=result_id)
+
+def read_result(result_id: str) -> Optional[Tuple[Dict[str, any], bytes]]:
+    """讀取結果 (meta, JSON)；不存在時回傳 None"""
+    path = result_path(result_id)
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            meta = json.loads(f.readline())
+            body = f.read()
+        # 以修改時間記錄最近使用，供容量上限淘汰
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return meta, body
+
+def evict(keep: Optional[str] = None):
+    """超過容量上限時刪除最久未使用（修改時間最早）的結果"""
+    try:
+        entries = [entry for entry in os.scandir(CACHE_DIR) if entry.name.endswith(".json")]
+    except OSError:
+        return
+
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if entry.name == f"{keep}.json":
+            continue
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            total -= size
+        except OSError:
+            continue
+
+def result_url(path: str, content_hash: bytes, params: Dict[str, any]) -> str:
+    """
+    結果的 GET 網址：/<端點>/<內容 sha256>?<選項>
+
+    選項依端點宣告的順序排列，同一結果只有一個網址（CDN 的快取鍵）；
+    客戶端也可以自行計算檔案的 sha256 組出網址，不必上傳。
+    """
+    query = urlencode([
+        (name, str(value).lower() if isinstance(value, bool) else value)
+        for name, value in params.items() if value is not None
+    ])
+    return f"{path}/{content_hash.hex()}?{query}"
+
+def entity_tag(*parts) -> str:
+    """由決定回應內容的各項計算強 ETag"""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+def matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    If-None-Match 中與 etag 相符的值（回傳給 304），沒有時回傳 None
+
+    壓縮後的回應在 ETag 後加上內容編碼（見 ResponseCompressionMiddleware），
+    比對時只看編碼前的部分。
+    """
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        opaque = tag[2:] if tag.startswith("W/") else tag
+        if opaque == etag or opaque.startswith(etag[:-1] + "-"):
+            return tag
+    return None
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """不可變結果的快取標頭"""
+    return {"ETag": etag, "Cache-Control": IMMUTABLE}
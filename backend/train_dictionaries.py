@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+訓練各字元集的 zstd 字典
+
+以代表性的轉換結果（與 API 回應相同的 JSON 格式）為樣本，為每個字元集訓練一個字典，
+輸出到 zstd_dictionaries/<字元集>.zdict。字典 ID 由內容計算，內容改變時 ID 也會改變，
+客戶端可以放心長期快取。
+
+Usage:
+    python backend/train_dictionaries.py [額外的樣本圖片 ...]
+"""
+
+import os
+import sys
+import json
+import random
+import hashlib
+import argparse
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import zstandard
+from enhanced_converter import ConversionPipeline, ConversionOptions, CHARACTER_SETS
+from response_compression import DICTIONARY_DIR, DICTIONARY_MAPPINGS
+
+DEFAULT_SAMPLES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "caca.jpg")]
+
+# zstd 保留 ID 0-32767 與 2^31 以上
+DICT_ID_MIN = 32768
+DICT_ID_MAX = 2 ** 31 - 1
+
+def synthetic_images():
+    """漸層與幾何圖形，補足照片以外的畫面"""
+    size = 256
+    x = np.linspace(0, 255, size)[None, :].repeat(size, axis=0)
+    y = x.T
+    yy, xx = np.mgrid[:size, :size]
+    circle = ((xx - size / 2) ** 2 + (yy - size / 2) ** 2 < (size / 3) ** 2) * 255.0
+
+    images = [
+        np.stack([x, y, 255 - x], axis=-1),
+        np.stack([circle, x, y], axis=-1),
+        np.stack([circle, circle, circle], axis=-1),
+    ]
+    return [Image.fromarray(image.astype(np.uint8), mode='RGB') for image in images]
+
+def crops(image, count, rng):
+    """隨機裁切，模擬不同構圖"""
+    width, height = image.size
+    result = [image]
+    for _ in range(count):
+        scale = rng.uniform(0.3, 0.8)
+        x0, y0 = rng.uniform(0, 1 - scale), rng.uniform(0, 1 - scale)
+        result.append(image.crop((int(x0 * width), int(y0 * height),
+                                  int((x0 + scale) * width), int((y0 + scale) * height))))
+    return result
+
+def build_samples(key, images):
+    """以 API 回應的格式產生訓練樣本"""
+    if key in DICTIONARY_MAPPINGS:
+        settings = [dict(art_type="block", mapping=key)]
+        if key in CHARACTER_SETS:
+            settings.append(dict(art_type=key))
+    else:
+        settings = [dict(art_type=key), dict(art_type=key, mapping="shape")]
+
+    samples = []
+    for setting in settings:
+        for color_mode in ["grayscale", "ansi", "ansi256", "truecolor"]:
+            for width in [40, 80, 120]:
+                pipeline = ConversionPipeline(ConversionOptions(width=width, color_mode=color_mode, **setting))
+                for image in images:
+                    result = pipeline.convert_image(image)
+                    body = {
+                        "status": "success",
+                        "type": "image",
+                        "version": "v2",
+                        "meta": {"art_type": setting["art_type"], "color_mode": color_mode,
+                                 "width": result["width"], "height": result["height"]},
+                        "data": result
+                    }
+                    samples.append(json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    return samples
+
+def content_dict_id(data: bytes) -> int:
+    """由字典內容（不含檔頭）計算穩定的 ID"""
+    digest = int(hashlib.sha256(data[8:]).hexdigest()[:8], 16)
+    return DICT_ID_MIN + digest % (DICT_ID_MAX - DICT_ID_MIN)
+
+def train(key, images, dict_size):
+    """訓練一個字典並寫入檔案，回傳 ID"""
+    dictionary = zstandard.train_dictionary(dict_size, build_samples(key, images))
+    data = bytearray(dictionary.as_bytes())
+
+    # 字典格式：magic (4 bytes) + 字典 ID (4 bytes, little endian) + ...
+    dict_id = content_dict_id(bytes(data))
+    data[4:8] = dict_id.to_bytes(4, "little")
+
+    path = os.path.join(DICTIONARY_DIR, f"{key}.zdict")
+    with open(path, "wb") as f:
+        f.write(data)
+    return dict_id
+
+def main(argv=None):
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Train per-charset zstd dictionaries")
+    parser.add_argument("images", nargs="*", help="Additional sample images")
+    parser.add_argument("--size", type=int, default=16384, help="Dictionary size in bytes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    images = synthetic_images()
+    for path in DEFAULT_SAMPLES + args.images:
+        images.extend(crops(Image.open(path).convert("RGB"), 4, rng))
+
+    os.makedirs(DICTIONARY_DIR, exist_ok=True)
+    for key in list(CHARACTER_SETS) + [key for key in DICTIONARY_MAPPINGS if key not in CHARACTER_SETS]:
+        dict_id = train(key, images, args.size)
+        print(f"{key}: {dict_id}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import mimetypes
+from typing import AsyncIterator, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+# 分塊上傳的存放目錄、單一檔案上限與保留時間（可用環境變數覆寫）
+UPLOAD_DIR = os.environ.get(
+    "CHARACTER_ART_UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".uploads")
+)
+UPLOAD_MAX_BYTES = int(os.environ.get("CHARACTER_ART_UPLOAD_MAX_BYTES", 4 * 1024 ** 3))
+UPLOAD_TTL = float(os.environ.get("CHARACTER_ART_UPLOAD_TTL", 24 * 3600))
+
+class UploadRejected(Exception):
+    """上傳的狀態不允許這個操作"""
+
+    def __init__(self, message: str, status_code: int = 409, offset: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.offset = offset
+
+class Upload:
+    """
+    一個分塊上傳
+
+    區塊依偏移量依序寫入 UPLOAD_DIR/<upload_id>.part，同時累計 sha256，完成時不必再讀一次檔案。
+    連線中斷時已收到的部分保留，客戶端查詢 offset 後從該處繼續。
+    """
+
+    def __init__(self, upload_id: str, filename: str, content_type: str, size: Optional[int]):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size  # 宣告的完整大小（未知時為 None）
+        self.path = os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+        self.offset = 0
+        self.content_hash: Optional[bytes] = None
+        self.writing = False
+        self.readers = 0  # 正在讀取檔案的轉換數
+        self.removed = False
+        self._digest = hashlib.sha256()
+
+    @property
+    def complete(self) -> bool:
+        return self.content_hash is not None
+
+    @property
+    def limit(self) -> int:
+        return self.size if self.size is not None else UPLOAD_MAX_BYTES
+
+    def info(self) -> Dict[str, any]:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size": self.size,
+            "offset": self.offset,
+            "complete": self.complete,
+            "sha256": self.content_hash.hex() if self.complete else None
+        }
+
+    async def append(self, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        從 offset 接續寫入區塊
+
+        offset 必須等於目前已收到的位元組數（重送的區塊回傳 409 與目前的 offset）。
+        寫入過程中斷時保留已寫入的部分，回傳新的 offset。
+        """
+        if self.complete:
+            raise UploadRejected("上傳已完成，不能再寫入", 409, self.offset)
+        if self.writing:
+            raise UploadRejected("另一個區塊正在上傳", 409, self.offset)
+        if offset != self.offset:
+            raise UploadRejected(f"偏移量不符，目前已收到 {self.offset} 位元組", 409, self.offset)
+
+        self.writing = True
+        try:
+            # 檔案寫入與雜湊都在執行緒中進行，不阻塞事件迴圈
+            f = await run_in_threadpool(self._open)
+            try:
+                async for chunk in chunks:
+                    if self.offset + len(chunk) > self.limit:
+                        raise UploadRejected(f"超過檔案大小上限（{self.limit} 位元組）", 413, self.offset)
+                    await run_in_threadpool(self._write, f, chunk)
+                    self.offset += len(chunk)
+            finally:
+                # 寫入失敗時去掉不完整的區塊，檔案內容與雜湊保持一致
+                await run_in_threadpool(self._close, f)
+        finally:
+            self.writing = False
+        return self.offset
+
+    def _open(self):
+        f = open(self.path, "r+b")
+        f.seek(self.offset)
+        return f
+
+    def _write(self, f, chunk: bytes):
+        f.write(chunk)
+        self._digest.update(chunk)
+
+    def _close(self, f):
+        try:
+            f.truncate(self.offset)
+        finally:
+            f.close()
+
+    def acquire(self):
+        """轉換開始讀取檔案；使用中的上傳不會過期，刪除會延到最後一個轉換結束"""
+        self.readers += 1
+
+    def release(self):
+        """轉換結束（更新修改時間，保留時間從最後一次使用起算）"""
+        self.readers -= 1
+        if self.readers:
+            return
+        try:
+            if self.removed:
+                os.remove(self.path)
+            else:
+                os.utime(self.path)
+        except OSError:
+            pass
+
+    def finish(self, sha256: Optional[str] = None) -> bytes:
+        """結束上傳並回傳內容的 sha256；sha256 為客戶端計算的值時一併驗證"""
+        if self.complete:
+            return self.content_hash
+        if self.writing:
+            raise UploadRejected("區塊仍在上傳", 409, self.offset)
+        if self.size is not None and self.offset != self.size:
+            raise UploadRejected(f"尚未收到完整檔案（{self.offset}/{self.size} 位元組）", 409, self.offset)
+
+        digest = self._digest.digest()
+        if sha256 is not None and sha256.lower() != digest.hex():
+            raise UploadRejected("檔案內容與 sha256 不符，請重新上傳", 400, self.offset)
+        self.content_hash = digest
+        return digest
+
+_uploads: Dict[str, Upload] = {}
+
+def create_upload(filename: str, content_type: Optional[str] = None, size: Optional[int] = None) -> Upload:
+    """建立上傳（先清除過期的上傳）"""
+    if size is not None and not 0 <= size <= UPLOAD_MAX_BYTES:
+        raise UploadRejected(f"檔案大小超過上限（{UPLOAD_MAX_BYTES} 位元組）", 413)
+
+    expire()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    upload = Upload(uuid.uuid4().hex, filename, content_type, size)
+    open(upload.path, "wb").close()
+    _uploads[upload.upload_id] = upload
+    return upload
+
+def get_upload(upload_id: str) -> Optional[Upload]:
+    """取得上傳；不存在或已過期時回傳 None"""
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+        return None
+    upload = _uploads.get(upload_id)
+    if upload is None or not os.path.exists(upload.path):
+        _uploads.pop(upload_id, None)
+        return None
+    return upload
+
+def completed_upload(upload_id: str) -> Optional[Upload]:
+    """取得已完成的上傳供轉換使用（更新修改時間；轉換期間以 acquire/release 標示使用中）"""
+    upload = get_upload(upload_id)
+    if upload is None or not upload.complete:
+        return None
+    try:
+        os.utime(upload.path)
+    except OSError:
+        return None
+    return upload
+
+def remove_upload(upload_id: str) -> bool:
+    """刪除上傳（轉換中的上傳在轉換結束後才刪除檔案）"""
+    upload = get_upload(upload_id)
+    if upload is None:
+        return False
+    _uploads.pop(upload_id, None)
+    upload.removed = True
+    if upload.readers:
+        # 轉換仍在讀取檔案，結束時再刪除
+        return True
+    try:
+        os.remove(upload.path)
+    except OSError:
+        pass
+    return True
+
+def expire(now: Optional[float] = None):
+    """刪除超過 UPLOAD_TTL 沒有寫入或使用的上傳（包括之前的行程留下的檔案）"""
+    now = time.time() if now is None else now
+    try:
+        entries = [entry for entry in os.scandir(UPLOAD_DIR) if entry.name.endswith(".part")]
+    except OSError:
+        return
+
+    for entry in entries:
+        upload_id = entry.name[:-len(".part")]
+        upload = _uploads.get(upload_id)
+        if upload is not None and (upload.writing or upload.readers):
+            continue
+        try:
+            if now - entry.stat().st_mtime <= UPLOAD_TTL:
+                continue
+            os.remove(entry.path)
+        except OSError:
+            continue
+        _uploads.pop(upload_id, None)
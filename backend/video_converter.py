@@ -1,8 +1,13 @@
 import cv2
 import numpy as np
+from collections import deque
+from concurrent.futures import CancelledError
+from typing import Optional
 from image_converter import convert_frame_to_art
+from worker_pool import shared_pool, CancellationToken, ConversionCancelled
 
-def convert_video_to_art(video_path: str, width: int = 60, fps: int = 24, art_type: str = "block"):
+def convert_video_to_art(video_path: str, width: int = 60, fps: int = 24, art_type: str = "block",
+                         cancel_token: Optional[CancellationToken] = None):
     """
     將影片轉換為字元藝術序列
     
@@ -11,6 +16,7 @@ def convert_video_to_art(video_path: str, width: int = 60, fps: int = 24, art_ty
         width: 輸出寬度
         fps: 目標幀率
         art_type: 藝術類型 ("block" 或 "ascii")
+        cancel_token: 取消權杖；取消後在下一幀停止並拋出 ConversionCancelled
     
     Returns:
         tuple: (frames_data, duration, total_frames)
@@ -32,42 +38,60 @@ def convert_video_to_art(video_path: str, width: int = 60, fps: int = 24, art_ty
         
         frames_data = []
         frame_number = 0
-        output_frame = 0
         
         print(f"開始處理影片: {duration:.2f}秒, {total_frames}幀, 原始FPS: {original_fps:.2f}")
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # 按指定間隔提取幀
-            if frame_number % frame_interval == 0:
-                # 轉換這一幀為字元藝術
-                art_lines = convert_frame_to_art(frame, width, art_type)
+        # 邊解碼邊在共用執行池中轉換幀
+        try:
+            with shared_pool.job() as job:
+                if cancel_token is not None:
+                    # 取消時關閉 job，尚未開始的幀直接丟棄
+                    cancel_token.on_cancel(job.close)
+                # 在途的幀不超過並行數的兩倍（也限制保留在記憶體中的原始幀）
+                max_in_flight = 2 * job.max_parallel
+                pending = deque()
                 
-                timestamp = frame_number / original_fps
+                def collect():
+                    timestamp, future = pending.popleft()
+                    frames_data.append({
+                        "frame_number": len(frames_data),
+                        "timestamp": round(timestamp, 3),
+                        "art": future.result()
+                    })
+                    
+                    # 簡單進度提示
+                    if len(frames_data) % 10 == 0:
+                        print(f"已處理 {len(frames_data)} 幀...")
                 
-                frames_data.append({
-                    "frame_number": output_frame,
-                    "timestamp": round(timestamp, 3),
-                    "art": art_lines
-                })
+                while cap.isOpened():
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    
+                    # 按指定間隔提取幀
+                    if frame_number % frame_interval == 0:
+                        while len(pending) >= max_in_flight:
+                            collect()
+                        pending.append((frame_number / original_fps,
+                                        job.submit(convert_frame_to_art, frame, width, art_type)))
+                    
+                    frame_number += 1
                 
-                output_frame += 1
-                
-                # 簡單進度提示
-                if output_frame % 10 == 0:
-                    print(f"已處理 {output_frame} 幀...")
-            
-            frame_number += 1
-        
-        cap.release()
+                while pending:
+                    collect()
+        except CancelledError:
+            raise ConversionCancelled("轉換已取消")
+        finally:
+            cap.release()
         
-        print(f"影片處理完成！共輸出 {output_frame} 幀")
+        print(f"影片處理完成！共輸出 {len(frames_data)} 幀")
         
-        return frames_data, duration, output_frame
+        return frames_data, duration, len(frames_data)
     
+    except ConversionCancelled:
+        raise
     except Exception as e:
         raise Exception(f"影片轉換失敗: {str(e)}")
 
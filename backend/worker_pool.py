@@ -0,0 +1,202 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+# 共用池的執行緒數（預設為 CPU 核心數，可用環境變數覆寫）
+POOL_SIZE = int(os.environ.get("CHARACTER_ART_WORKERS", os.cpu_count() or 1))
+
+class ConversionCancelled(Exception):
+    """轉換已取消（客戶端中斷連線）"""
+
+class CancellationToken:
+    """
+    取消權杖
+
+    端點偵測到客戶端中斷時呼叫 cancel()；轉換在每一幀的邊界呼叫 check()，
+    以 on_cancel 註冊的工作會立即關閉，尚未開始的幀任務直接丟棄。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """註冊取消時要執行的動作（已取消時立即執行）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def check(self):
+        """已取消時拋出 ConversionCancelled"""
+        if self._event.is_set():
+            raise ConversionCancelled("轉換已取消")
+
+class Job:
+    """
+    一個請求在共用池中的工作
+
+    同一工作的任務依提交順序執行；max_parallel 為同時執行的上限（客戶端的 num_threads 只是提示，
+    不會超過池的大小）。
+    """
+
+    def __init__(self, pool: "WorkerPool", priority: bool = False, max_parallel: Optional[int] = None):
+        self.pool = pool
+        self.priority = priority
+        self.max_parallel = max(1, min(max_parallel or pool.size, pool.size))
+        self.pending = deque()
+        self.running = 0
+        self.closed = False
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """提交任務，回傳 concurrent.futures.Future"""
+        future = Future()
+        self.pool._enqueue(self, (future, fn, args, kwargs))
+        return future
+
+    def close(self):
+        """結束工作：尚未開始的任務全部取消"""
+        self.pool._close(self)
+
+    def __enter__(self) -> "Job":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class WorkerPool:
+    """
+    整個行程共用的執行池
+
+    所有請求的幀與圖片任務都在這裡執行，總執行緒數固定為主機的核心數，不會因同時的請求而超額。
+    排程時優先通道（單張圖片）先於一般通道（影片幀、批次）；同一通道內輪流從各個工作取任務，
+    長影片不會讓其他請求一直等待。
+    """
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = max(1, size)
+        self._condition = threading.Condition()
+        self._lanes = (deque(), deque())  # (優先, 一般) 中有待執行任務的工作
+        self._threads = []
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """fork 出的子行程沒有父行程的執行緒"""
+        self._condition = threading.Condition()
+        self._lanes = (deque(), deque())
+        self._threads = []
+
+    def job(self, priority: bool = False, hint: Optional[int] = None) -> Job:
+        """建立工作；hint 為客戶端要求的並行數"""
+        return Job(self, priority, hint)
+
+    def submit(self, fn: Callable, *args, priority: bool = False, **kwargs) -> Future:
+        """提交單一任務（自成一個工作）"""
+        job = self.job(priority)
+        future = job.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: job.close())
+        return future
+
+    def map(self, fn: Callable, items: List, priority: bool = False) -> List:
+        """
+        平行執行 fn(item)，依順序回傳結果
+
+        呼叫端的執行緒也會執行還沒開始的項目：在池的執行緒中呼叫（例如單張圖片的列帶）時，
+        不會因為等待子任務而佔住執行緒，池再忙也不會卡住。
+        """
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+
+        with self.job(priority) as job:
+            futures = [job.submit(fn, item) for item in items[1:]]
+            results = [fn(items[0])]
+            for item, future in zip(items[1:], futures):
+                results.append(fn(item) if future.cancel() else future.result())
+        return results
+
+    def _start(self):
+        while len(self._threads) < self.size:
+            thread = threading.Thread(target=self._worker, name=f"character-art-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _enqueue(self, job: Job, task):
+        with self._condition:
+            if job.closed:
+                task[0].cancel()
+                return
+            if not self._threads:
+                self._start()
+            if not job.pending:
+                self._lanes[0 if job.priority else 1].append(job)
+            job.pending.append(task)
+            self._condition.notify()
+
+    def _close(self, job: Job):
+        with self._condition:
+            job.closed = True
+            while job.pending:
+                job.pending.popleft()[0].cancel()
+            for lane in self._lanes:
+                if job in lane:
+                    lane.remove(job)
+
+    def _next_task(self):
+        """輪流選出下一個任務：優先通道先，跳過已達並行上限的工作"""
+        for lane in self._lanes:
+            for _ in range(len(lane)):
+                job = lane.popleft()
+                if job.running >= job.max_parallel:
+                    lane.append(job)
+                    continue
+                task = job.pending.popleft()
+                job.running += 1
+                if job.pending:
+                    lane.append(job)
+                return job, task
+        return None, None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                job, task = self._next_task()
+                while task is None:
+                    self._condition.wait()
+                    job, task = self._next_task()
+
+            future, fn, args, kwargs = task
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    job.running -= 1
+                    # 工作的並行數降下來後可能有任務可以執行
+                    if job.pending and not job.closed:
+                        lane = self._lanes[0 if job.priority else 1]
+                        if job not in lane:
+                            lane.append(job)
+                        self._condition.notify()
+
+# 所有轉換共用
+shared_pool = WorkerPool()
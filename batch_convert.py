@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Enhanced Character Art Converter - Headless Batch Converter
+
+Walks directories of images and videos, converts them across a process pool
+and writes any OutputFormatter format. Completed items are recorded in a
+manifest so interrupted runs resume without redoing work.
+
+Usage:
+    python batch_convert.py photos/ clips/ -o out/ --width 120 --image-format html
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import hashlib
+import argparse
+from dataclasses import asdict
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from enhanced_converter import EnhancedImageConverter, EnhancedVideoConverter, ConversionOptions, CHARACTER_SETS
+from output_formatter import OutputFormatter
+from worker_pool import shared_pool
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v'}
+
+IMAGE_FORMATS = {'text': '.txt', 'ansi': '.ans', 'html': '.html', 'svg': '.svg', 'json': '.json'}
+VIDEO_FORMATS = {'json': '.json', 'gif': '.gif', 'css': '.css'}
+
+MANIFEST_NAME = '.manifest.jsonl'
+
+# 每個工作行程各自建立一次的轉換器（跨項目重複使用轉換管線）
+_image_converter = None
+_video_converter = None
+
+def init_worker(options: ConversionOptions):
+    """Create converters once per worker process"""
+    global _image_converter, _video_converter
+    # 行程池已佔滿所有核心，行程內的執行池只用一個執行緒（圖片也不再切成列帶並行）
+    shared_pool.size = 1
+    _image_converter = EnhancedImageConverter(options)
+    _video_converter = EnhancedVideoConverter(options, num_threads=1)
+
+def collect_sources(inputs):
+    """Walk input paths and return (root, path, kind) for every image/video"""
+    sources = []
+    for entry in inputs:
+        entry = Path(entry)
+        if entry.is_file():
+            candidates = [(entry.parent, entry)]
+        else:
+            candidates = [(entry, path) for path in sorted(entry.rglob('*')) if path.is_file()]
+
+        for root, path in candidates:
+            suffix = path.suffix.lower()
+            if suffix in IMAGE_EXTENSIONS:
+                sources.append((root, path, 'image'))
+            elif suffix in VIDEO_EXTENSIONS:
+                sources.append((root, path, 'video'))
+    return sources
+
+def options_fingerprint(options: ConversionOptions, args) -> str:
+    """Hash of everything that affects the output"""
+    settings = dict(asdict(options), fps=args.fps, sampling=args.sampling, max_gap=args.max_gap,
+                    image_format=args.image_format, video_format=args.video_format)
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def item_key(path: Path, fingerprint: str) -> str:
+    """Manifest key: source path, size, modification time and options"""
+    stat = path.stat()
+    return f"{path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{fingerprint}"
+
+def load_manifest(manifest_path: Path) -> set:
+    """Read keys of completed items"""
+    done = set()
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    # 中斷時寫到一半的最後一行
+                    continue
+    return done
+
+def convert_one(source: str, output: str, kind: str, image_format: str, video_format: str, fps: int,
+                sampling: str = 'fixed', max_gap: float = 2.0):
+    """Convert one file inside a worker process and write the output"""
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    if kind == 'image':
+        result = _image_converter.convert_to_art(source)
+        art, colors = result["art"], result.get("colors")
+        background_colors = result.get("background_colors")
+
+        if image_format == 'text':
+            content = OutputFormatter.to_text(art)
+        elif image_format == 'ansi':
+            content = OutputFormatter.to_ansi(art, colors, background_colors)
+        elif image_format == 'html':
+            content = OutputFormatter.to_html(art, colors, background_colors=background_colors)
+        elif image_format == 'svg':
+            content = OutputFormatter.to_svg(art, colors)
+        else:
+            content = OutputFormatter.to_json(art, colors, {"source": os.path.basename(source)})
+    else:
+        frames, duration, total_frames = _video_converter.convert_video(source, fps, sampling, max_gap)
+
+        if video_format == 'gif':
+            OutputFormatter.create_animated_gif(frames, output, fps, use_timestamps=sampling == 'adaptive')
+            content = None
+        elif video_format == 'css':
+            content = OutputFormatter.to_css_animation(frames, use_timestamps=sampling == 'adaptive')
+        else:
+            content = json.dumps({
+                "fps": fps,
+                "duration": duration,
+                "total_frames": total_frames,
+                "frames": frames
+            }, ensure_ascii=False)
+
+    if content is not None:
+        # 先寫入暫存檔再改名，中斷時不會留下不完整的輸出
+        tmp_output = output + '.part'
+        with open(tmp_output, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_output, output)
+
+    return time.perf_counter() - start
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Convert directories of images and videos to character art")
+    parser.add_argument('inputs', nargs='+', help="Image/video files or directories to walk")
+    parser.add_argument('-o', '--output', required=True, help="Output directory")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument('--image-format', choices=sorted(IMAGE_FORMATS), default='text')
+    parser.add_argument('--video-format', choices=sorted(VIDEO_FORMATS), default='json')
+    parser.add_argument('--fps', type=int, default=24, help="Output frame rate for videos")
+    parser.add_argument('--sampling', choices=['fixed', 'adaptive'], default='fixed',
+                        help="adaptive: only emit frames when the picture changes")
+    parser.add_argument('--max-gap', type=float, default=2.0, help="Longest gap between adaptive frames (seconds)")
+    parser.add_argument('--restart', action='store_true', help="Ignore the manifest and convert everything again")
+
+    parser.add_argument('--width', type=int, default=100)
+    parser.add_argument('--art-type', choices=sorted(CHARACTER_SETS), default='block')
+    parser.add_argument('--color-mode', choices=['grayscale', 'ansi', 'ansi256', 'truecolor', 'html'], default='grayscale')
+    parser.add_argument('--contrast', type=float, default=1.0)
+    parser.add_argument('--brightness', type=float, default=1.0)
+    parser.add_argument('--gamma', type=float, default=1.0)
+    parser.add_argument('--auto-levels', action='store_true')
+    parser.add_argument('--edge-detection', action='store_true')
+    parser.add_argument('--edge-threshold', type=int, default=100)
+    parser.add_argument('--denoise', action='store_true')
+    parser.add_argument('--sharpen', action='store_true')
+    parser.add_argument('--invert', action='store_true')
+    parser.add_argument('--dithering', action='store_true')
+    parser.add_argument('--custom-chars', default=None)
+    parser.add_argument('--mapping', choices=['brightness', 'shape', 'braille', 'halfblock'], default='brightness')
+    parser.add_argument('--prescale', type=int, default=3)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main entry point"""
+    args = parse_args(argv)
+
+    options = ConversionOptions(
+        width=args.width,
+        art_type=args.art_type,
+        color_mode=args.color_mode,
+        contrast=args.contrast,
+        brightness=args.brightness,
+        gamma=args.gamma,
+        auto_levels=args.auto_levels,
+        edge_detection=args.edge_detection,
+        edge_threshold=args.edge_threshold,
+        denoise=args.denoise,
+        sharpen=args.sharpen,
+        invert=args.invert,
+        dithering=args.dithering,
+        custom_chars=args.custom_chars,
+        mapping=args.mapping,
+        prescale=args.prescale
+    )
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    if args.restart and manifest_path.exists():
+        manifest_path.unlink()
+
+    fingerprint = options_fingerprint(options, args)
+    done = load_manifest(manifest_path)
+
+    # 排除已完成的項目
+    pending = []
+    for root, path, kind in collect_sources(args.inputs):
+        key = item_key(path, fingerprint)
+        if key in done:
+            continue
+        suffix = IMAGE_FORMATS[args.image_format] if kind == 'image' else VIDEO_FORMATS[args.video_format]
+        # 保留原副檔名（a.png -> a.png.txt），避免同名不同格式的來源互相覆蓋
+        relative = path.relative_to(root)
+        output = output_dir / relative.with_name(relative.name + suffix)
+        pending.append((key, path, output, kind))
+
+    # 影片通常最花時間，先送出以避免尾端只剩一個長工作
+    pending.sort(key=lambda item: item[3] != 'video')
+
+    print(f"=== Batch Converter: {len(pending)} to convert, {len(done)} already done ===")
+    if not pending:
+        return 0
+
+    failed = 0
+    with open(manifest_path, 'a', encoding='utf-8') as manifest, \
+            ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=init_worker, initargs=(options,)) as executor:
+        futures = {
+            executor.submit(convert_one, str(path), str(output), kind,
+                            args.image_format, args.video_format, args.fps,
+                            args.sampling, args.max_gap): (key, path, output)
+            for key, path, output, kind in pending
+        }
+
+        for count, future in enumerate(as_completed(futures), start=1):
+            key, path, output = futures[future]
+            try:
+                elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{count}/{len(pending)}] ✗ {path}: {e}")
+                continue
+
+            manifest.write(json.dumps({"key": key, "source": str(path), "output": str(output)}, ensure_ascii=False) + "\n")
+            manifest.flush()
+            print(f"[{count}/{len(pending)}] ✓ {path} ({elapsed:.2f}s)")
+
+    print(f"Done: {len(pending) - failed} converted, {failed} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
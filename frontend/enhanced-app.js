@@ -10,6 +10,11 @@ let useV2API = true; // Use enhanced API
 // API base URL
 const API_BASE = 'http://localhost:8002';
 
+// Videos larger than this are sent with resumable chunked uploads
+const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+const UPLOAD_RETRIES = 5;
+
 // Initialize
 document.addEventListener('DOMContentLoaded', function() {
     setupEventListeners();
@@ -210,7 +215,20 @@ async function convertFile() {
     
     // Create FormData
     const formData = new FormData();
-    formData.append(isVideo ? 'video' : 'image', currentFile);
+    
+    try {
+        if (isVideo && currentFile.size > CHUNKED_UPLOAD_THRESHOLD) {
+            // Large videos: upload in chunks first, then convert by upload id
+            formData.append('upload_id', await uploadInChunks(currentFile));
+        } else {
+            formData.append(isVideo ? 'video' : 'image', currentFile);
+        }
+    } catch (error) {
+        console.error('Upload error:', error);
+        showStatus(`Upload failed: ${error.message}`, 'error');
+        convertBtn.disabled = false;
+        return;
+    }
     
     // Append all parameters
     Object.keys(params).forEach(key => {
@@ -249,6 +267,65 @@ async function convertFile() {
     }
 }
 
+// Upload a file in chunks; after a dropped connection resume from the offset the server has
+async function uploadInChunks(file) {
+    const createData = new FormData();
+    createData.append('filename', file.name);
+    createData.append('content_type', file.type);
+    createData.append('size', file.size);
+    
+    const created = await fetch(`${API_BASE}/api/v2/uploads`, { method: 'POST', body: createData });
+    if (!created.ok) {
+        const error = await created.json();
+        throw new Error(error.message || `HTTP error! status: ${created.status}`);
+    }
+    const upload = await created.json();
+    const uploadUrl = `${API_BASE}${upload.upload_url}`;
+    
+    let offset = 0;
+    let failures = 0;
+    while (offset < file.size) {
+        showStatus(`Uploading... ${Math.floor(offset * 100 / file.size)}%`, 'loading');
+        let error;
+        try {
+            const response = await fetch(`${uploadUrl}?offset=${offset}`, {
+                method: 'PUT',
+                body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+            });
+            const result = await response.json().catch(() => ({}));
+            if (response.ok || (response.status === 409 && result.offset !== undefined)) {
+                // A 409 carries the offset the server already has; continue from there
+                offset = result.offset;
+                failures = 0;
+                continue;
+            }
+            error = new Error(result.message || `HTTP error! status: ${response.status}`);
+            error.retryable = response.status >= 500;
+        } catch (networkError) {
+            error = networkError;
+            error.retryable = true;
+        }
+        
+        // Only network errors and server errors are retried; 413 and other client errors fail at once
+        if (!error.retryable || ++failures > UPLOAD_RETRIES) {
+            throw error;
+        }
+        // Ask the server how much it received and continue from there
+        await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+        const status = await fetch(uploadUrl).then(response => response.json()).catch(() => null);
+        if (status && status.offset !== undefined) {
+            offset = status.offset;
+        }
+    }
+    
+    const completed = await fetch(`${uploadUrl}/complete`, { method: 'POST' });
+    if (!completed.ok) {
+        const error = await completed.json();
+        throw new Error(error.message || `HTTP error! status: ${completed.status}`);
+    }
+    return upload.upload_id;
+}
+
 // Show status
 function showStatus(message, type) {
     const statusBar = document.getElementById('statusBar');
@@ -6,7 +6,60 @@ Simple decoder for ultra-compressed character art format
 
 import json
 
-def decode_ultra_minimal(compressed_data, width, height):
+# 有 NumPy 時使用向量化解碼，否則退回純 Python（保持任何環境都能使用）
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _is_codepoint_data(compressed_data, default_char):
+    """所有字符都是單一碼位時才能放進 uint32 碼位陣列"""
+    return np is not None and len(default_char) == 1 and all(len(char) == 1 for char in compressed_data)
+
+def _scatter(grid, compressed_data):
+    """
+    將每個字符的位置一次寫入扁平的碼位陣列
+
+    越界的位置（< 0 或 >= width * height）與原本的逐點檢查一樣略過；
+    字符依字典順序寫入，重疊位置以後面的字符為準。
+    """
+    size = grid.size
+    for char, positions in compressed_data.items():
+        positions = np.asarray(positions, dtype=np.int64)
+        if positions.size and (positions.min() < 0 or positions.max() >= size):
+            positions = positions[(positions >= 0) & (positions < size)]
+        grid[positions] = ord(char)
+
+def _grid_to_lines(grid, width):
+    """(height, width) 碼位陣列轉為字串陣列"""
+    if width == 0:
+        return [''] * grid.shape[0]
+    return np.ascontiguousarray(grid).view(f'<U{width}').ravel().tolist()
+
+def _decode_lists(compressed_data, width, height, default_char=' '):
+    """純 Python 解碼（沒有 NumPy 或字符不是單一碼位時使用）"""
+    result = [[default_char for _ in range(width)] for _ in range(height)]
+    
+    for char, positions in compressed_data.items():
+        for pos in positions:
+            row = pos // width
+            col = pos % width
+            if 0 <= row < height and 0 <= col < width:
+                result[row][col] = char
+    
+    return result
+
+def decode_to_codepoints(compressed_data, width, height, default_char=' '):
+    """
+    解碼為 (height, width) 的 uint32 Unicode 碼位陣列（需要 NumPy）
+
+    適合直接交給其他 NumPy 程式處理，不必建立字串。
+    """
+    grid = np.full(width * height, ord(default_char), dtype=np.uint32)
+    _scatter(grid, compressed_data)
+    return grid.reshape(height, width)
+
+def decode_ultra_minimal(compressed_data, width, height, default_char=' '):
     """
     解碼極簡格式的字符藝術
     
@@ -14,23 +67,111 @@ def decode_ultra_minimal(compressed_data, width, height):
         compressed_data: dict, 格式為 {"字符": [位置1, 位置2, ...]}
         width: int, 圖像寬度
         height: int, 圖像高度
+        default_char: str, 未指定位置的填充字符
     
     Returns:
         list of str, 每個元素是一行字符
     """
-    # 初始化空白圖像
-    result = [[' ' for _ in range(width)] for _ in range(height)]
+    if not _is_codepoint_data(compressed_data, default_char):
+        return [''.join(row) for row in _decode_lists(compressed_data, width, height, default_char)]
     
-    # 填入字符
-    for char, positions in compressed_data.items():
-        for pos in positions:
-            row = pos // width
-            col = pos % width
-            if 0 <= row < height and 0 <= col < width:
-                result[row][col] = char
+    return _grid_to_lines(decode_to_codepoints(compressed_data, width, height, default_char), width)
+
+def decode_batch(frames_data, width, height, default_char=' '):
+    """
+    批量解碼多個幀
+
+    所有幀寫入同一個預先配置的 (幀數, height, width) 碼位陣列，
+    最後一次轉換為字串。
+
+    Returns:
+        list of (list of str)，每個元素是一幀
+    """
+    frames_data = list(frames_data)
+    if not all(_is_codepoint_data(frame, default_char) for frame in frames_data):
+        return [decode_ultra_minimal(frame, width, height, default_char) for frame in frames_data]
     
-    # 轉換為字串陣列
-    return [''.join(row) for row in result]
+    grids = np.full((len(frames_data), width * height), ord(default_char), dtype=np.uint32)
+    for grid, frame in zip(grids, frames_data):
+        _scatter(grid, frame)
+    
+    lines = _grid_to_lines(grids.reshape(len(frames_data) * height, width), width)
+    return [lines[i * height:(i + 1) * height] for i in range(len(frames_data))]
+
+def iter_json_frames(source, chunk_size=1 << 16):
+    """
+    逐一讀出多幀 JSON（頂層陣列）中的每一幀，不需要一次載入整個檔案
+
+    Args:
+        source: 檔名或已開啟的文字檔
+        chunk_size: 每次讀取的字元數
+
+    Yields:
+        每一幀的 dict；頂層是單一物件時只產生一次
+    """
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8') as f:
+            yield from iter_json_frames(f, chunk_size)
+        return
+    
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    in_array = None
+    
+    while True:
+        # 略過空白與分隔符號
+        while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ',')):
+            pos += 1
+        
+        if pos < len(buffer):
+            if in_array is None:
+                in_array = buffer[pos] == '['
+                if in_array:
+                    pos += 1
+                continue
+            if in_array and buffer[pos] == ']':
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # 物件剛好在緩衝區尾端結束時可能還沒讀完（例如數字）
+                if end < len(buffer) or eof:
+                    yield value
+                    if not in_array:
+                        return
+                    pos = end
+                    continue
+            except ValueError:
+                if eof:
+                    raise ValueError("Unexpected end of JSON data")
+        elif eof:
+            if in_array:
+                raise ValueError("Unexpected end of JSON data")
+            return
+        
+        chunk = source.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def stream_decode(source, width, height, batch_size=256, default_char=' '):
+    """
+    串流解碼大型多幀 JSON 檔案
+
+    每讀到 batch_size 幀就批量解碼一次，記憶體用量與檔案大小無關。
+
+    Yields:
+        每一幀的字串陣列
+    """
+    batch = []
+    for frame_data in iter_json_frames(source):
+        batch.append(frame_data)
+        if len(batch) >= batch_size:
+            yield from decode_batch(batch, width, height, default_char)
+            batch = []
+    if batch:
+        yield from decode_batch(batch, width, height, default_char)
 
 def decode_from_file(filename, width, height):
     """從檔案讀取並解碼"""
@@ -43,10 +184,7 @@ def decode_from_file(filename, width, height):
     
     # 處理動畫（多幀）
     elif isinstance(data, list):
-        frames = []
-        for frame_data in data:
-            frames.append(decode_ultra_minimal(frame_data, width, height))
-        return frames
+        return decode_batch(data, width, height)
     
     else:
         raise ValueError("Unknown data format")
@@ -93,9 +231,7 @@ if __name__ == "__main__":
     
     # 範例 3: 批量處理
     print("\n=== 範例 3: 批量處理 ===")
-    def batch_decode(frames_data, width, height):
-        """批量解碼多個幀"""
-        return [decode_ultra_minimal(frame, width, height) for frame in frames_data]
+    batch_decode = decode_batch
     
     # 動畫資料
     animation_data = [
@@ -119,7 +255,15 @@ class CharacterArtDecoder:
     
     def decode(self, compressed_data):
         """解碼壓縮資料"""
-        return decode_ultra_minimal(compressed_data, self.width, self.height)
+        return decode_ultra_minimal(compressed_data, self.width, self.height, self.default_char)
+    
+    def decode_batch(self, frames_data):
+        """批量解碼多個幀"""
+        return decode_batch(frames_data, self.width, self.height, self.default_char)
+    
+    def decode_stream(self, source, batch_size=256):
+        """串流解碼多幀 JSON 檔案"""
+        return stream_decode(source, self.width, self.height, batch_size, self.default_char)
     
     def decode_with_callback(self, compressed_data, callback):
         """解碼時對每個字符執行回調"""
@@ -138,14 +282,8 @@ class CharacterArtDecoder:
     
     def decode_to_matrix(self, compressed_data):
         """解碼為二維陣列（保持矩陣格式）"""
-        result = [[self.default_char for _ in range(self.width)] 
-                  for _ in range(self.height)]
-        
-        for char, positions in compressed_data.items():
-            for pos in positions:
-                row = pos // self.width
-                col = pos % self.width
-                if 0 <= row < self.height and 0 <= col < self.width:
-                    result[row][col] = char
+        if not _is_codepoint_data(compressed_data, self.default_char):
+            return _decode_lists(compressed_data, self.width, self.height, self.default_char)
         
-        return result
\ No newline at end of file
+        grid = decode_to_codepoints(compressed_data, self.width, self.height, self.default_char)
+        return grid.view('<U1').tolist()
\ No newline at end of file
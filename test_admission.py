@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Test script for admission control
+"""
+
+import sys
+import os
+import io
+import asyncio
+import tempfile
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from admission import (
+    AdmissionController, AdmissionRejected, BenchmarkHistory, Cost, admission, benchmark_history,
+    estimate_image_cost, estimate_video_cost
+)
+import result_cache
+from PIL import Image
+
+def test_cost_model():
+    """Cost grows with output size, frame count and colour depth"""
+    print("=== Testing Cost Model ===")
+
+    # 不使用本機的轉換記錄（各色彩模式的校正係數不同）
+    path = benchmark_history.path
+    benchmark_history.path, benchmark_history._entries = os.path.join(tempfile.mkdtemp(), "history.json"), None
+    try:
+        small = estimate_image_cost(80, 1280, 720, "grayscale")
+        wide = estimate_image_cost(400, 1280, 720, "grayscale")
+        color = estimate_image_cost(400, 1280, 720, "truecolor")
+
+        info = {"width": 1280, "height": 720, "fps": 30.0, "frame_count": 300, "duration": 10.0}
+        full = estimate_video_cost(100, info, fps=30)
+        sampled = estimate_video_cost(100, info, fps=10)
+        segmented = estimate_video_cost(100, info, fps=30, segments=4)
+    finally:
+        benchmark_history.path, benchmark_history._entries = path, None
+    assert small.cpu_seconds < wide.cpu_seconds < color.cpu_seconds
+    assert wide.memory_bytes < color.memory_bytes
+    assert sampled.cpu_seconds < full.cpu_seconds and sampled.memory_bytes < full.memory_bytes
+    # 區段的工作行程各自定位到起點，也各自保留結果
+    assert segmented.cpu_seconds > full.cpu_seconds and segmented.memory_bytes > full.memory_bytes
+    print(f"  ✓ 10s 720p video at 30fps: {full.cpu_seconds:.2f}s CPU, {full.memory_bytes / 1024 ** 2:.0f}MB")
+
+def test_queue_and_reject():
+    """Requests over budget wait in order; a full queue is rejected with Retry-After"""
+    print("\n=== Testing Queue and Rejection ===")
+
+    async def scenario():
+        controller = AdmissionController(cpu_budget=10, memory_budget=1000, max_queue=1, max_wait=5, cores=2)
+        first, second = Cost(8, 100), Cost(8, 100)
+
+        await controller.acquire(first)
+        waiter = asyncio.ensure_future(controller.acquire(second))
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 1
+
+        try:
+            await controller.acquire(Cost(1, 1))
+            assert False, "queue limit not enforced"
+        except AdmissionRejected as e:
+            assert e.retry_after == 8
+            print(f"  ✓ Rejected with Retry-After {e.retry_after}")
+
+        controller.release(first)
+        await waiter
+        assert controller.active == 1 and controller.cpu_in_use == 8
+        controller.release(second)
+
+        try:
+            await controller.acquire(Cost(1, 5000))
+            assert False, "memory budget not enforced"
+        except AdmissionRejected as e:
+            assert e.retry_after is None
+
+        # 等待逾時也會拒絕
+        controller.max_wait = 0.01
+        await controller.acquire(first)
+        try:
+            await controller.acquire(second)
+            assert False, "wait timeout not enforced"
+        except AdmissionRejected:
+            assert controller.stats()["queued"] == 0
+        print("  ✓ Queued request admitted in order, timeouts and oversize requests rejected")
+
+    asyncio.run(scenario())
+
+def test_endpoint_rejection():
+    """Conversion endpoints answer 503 + Retry-After when busy"""
+    print("\n=== Testing Endpoint Rejection ===")
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 32), color='white').save(buffer, format='PNG')
+    files = {"image": ("a.png", buffer.getvalue(), "image/png")}
+    client = TestClient(app)
+
+    # 轉換結果與耗時記錄寫到暫存目錄，不留在原始碼目錄中
+    cache_dir, path = result_cache.CACHE_DIR, benchmark_history.path
+    result_cache.CACHE_DIR = tempfile.mkdtemp(prefix="result_cache_test_")
+    benchmark_history.path, benchmark_history._entries = os.path.join(tempfile.mkdtemp(), "history.json"), None
+    try:
+        assert client.post("/api/v2/convert", files=files, data={"width": "20"}).status_code == 200
+
+        # 批次串流結束後歸還預算
+        batch = client.post("/api/v2/convert-batch", files=[("files", files["image"])], data={"width": "20"})
+        assert batch.status_code == 200 and batch.text.count("\n") == 2
+        assert admission.active == 0 and admission.cpu_in_use == 0
+
+        max_queue = admission.max_queue
+        admission.max_queue = 0
+        admission._grant(Cost(admission.cpu_budget, 0))
+        try:
+            # 相同圖片與設定會直接使用快取的結果，換一個寬度才需要轉換
+            response = client.post("/api/v2/convert", files=files, data={"width": "21"})
+            assert response.status_code == 503
+            assert int(response.headers["retry-after"]) >= 1
+            print(f"  ✓ 503, Retry-After: {response.headers['retry-after']}")
+
+            # 批次串流在開始前就回傳 503
+            batch = client.post("/api/v2/convert-batch", files=[("files", files["image"])], data={"width": "20"})
+            assert batch.status_code == 503
+        finally:
+            admission.release(Cost(admission.cpu_budget, 0))
+            admission.max_queue = max_queue
+    finally:
+        result_cache.CACHE_DIR = cache_dir
+        benchmark_history.path, benchmark_history._entries = path, None
+
+def test_probe():
+    """Probe reports the output grid and a calibrated estimate without converting"""
+    print("\n=== Testing Probe ===")
+
+    history = BenchmarkHistory(os.path.join(tempfile.mkdtemp(), "history.json"))
+    for actual in (1.5, 2.0):
+        history.record("ansi", 1.0, actual, "image")
+    assert history.calibration("ansi", "image") == (1.0, 2)
+    history.record("ansi", 1.0, 2.5, "image")
+    assert history.calibration("ansi", "image") == (2.0, 3)
+    assert history.calibration("truecolor", "image") == (1.0, 0)
+
+    # 影片與圖片分開校正；經過時間依並行數換算成 CPU 秒數，benchmark.py 的記錄用於影片
+    assert history.calibration("ansi", "video") == (1.0, 0)
+    history.record("ansi", 1.0, 1.0, "video", parallelism=4)
+    history.record("ansi", 1.0, 2.0, "video", parallelism=2)
+    history.record("ansi", 1.0, 6.0, "benchmark")
+    assert history.calibration("ansi", "video") == (4.0, 3)
+    assert history.calibration("ansi", "image") == (2.0, 3)
+
+    # 記錄只更新記憶體，檔案稍後一次寫入
+    assert not os.path.exists(history.path)
+    history.flush()
+    assert BenchmarkHistory(history.path).calibration("ansi", "image") == (2.0, 3)
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 100), color='white').save(buffer, format='PNG')
+    client = TestClient(app)
+
+    # 只傳部分內容也能讀出尺寸，file_size 用來估計上傳
+    path = benchmark_history.path
+    benchmark_history.path, benchmark_history._entries = history.path, None
+    try:
+        response = client.post("/api/v2/probe", files={"file": ("a.png", buffer.getvalue()[:512], "image/png")},
+                               data={"width": "40", "color_mode": "ansi", "file_size": "1000000"})
+    finally:
+        benchmark_history.path, benchmark_history._entries = path, None
+    assert response.status_code == 200
+    result = response.json()
+    assert result["source"] == {"type": "image", "width": 200, "height": 100}
+    assert result["output"]["width"] == 40 and result["output"]["frames"] == 1
+    assert result["estimate"]["calibration"] == 2.0 and result["estimate"]["history_samples"] == 3
+    print(f"  ✓ {result['output']}, {result['estimate']['cpu_seconds']}s CPU")
+
+    response = client.post("/api/v2/probe", files={"file": ("a.bin", b"not media", "application/octet-stream")})
+    assert response.status_code == 400
+
+def main():
+    """Run all tests"""
+    print("Admission Control - Test Suite")
+    print("=" * 50)
+
+    test_cost_model()
+    test_queue_and_reject()
+    test_endpoint_rejection()
+    test_probe()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
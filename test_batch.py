@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test script for batch image conversion
+"""
+
+import sys
+import os
+import io
+import json
+import zipfile
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from batch_converter import BatchImageConverter, BatchTooLarge, expand_upload
+from enhanced_converter import ConversionOptions
+from PIL import Image
+
+def make_png(color):
+    """Create a small PNG image in memory"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 32), color=color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def test_expand_archive():
+    """Zip archives expand to the images they contain"""
+    print("=== Testing Archive Expansion ===")
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('photos/a.png', make_png('white'))
+        zf.writestr('photos/b.png', make_png('black'))
+        zf.writestr('notes.txt', 'not an image')
+        zf.writestr('__MACOSX/photos/._a.png', b'')
+
+    items = expand_upload('photos.zip', archive.getvalue())
+    print(f"  items: {[name for name, _ in items]}")
+    assert [name for name, _ in items] == ['photos/a.png', 'photos/b.png']
+
+    single = make_png('gray')
+    assert expand_upload('single.png', single) == [('single.png', single)]
+
+    # 項目數與解壓縮後大小超過上限時在解壓縮前拒絕
+    for limits in [(1, 10 ** 6), (2, len(make_png('white')))]:
+        try:
+            expand_upload('photos.zip', archive.getvalue(), *limits)
+            assert False, "archive over the limit should be rejected"
+        except BatchTooLarge:
+            pass
+
+def test_batch_errors_are_per_item():
+    """A broken image fails only its own item"""
+    print("\n=== Testing Batch Conversion ===")
+
+    items = [('white.png', make_png('white')), ('broken.png', b'not an image'), ('black.png', make_png('black'))]
+    converter = BatchImageConverter(ConversionOptions(width=20), num_threads=2)
+    lines = [json.loads(line) for line in converter.stream_ndjson(items)]
+
+    summary = lines[-1]
+    results = sorted(lines[:-1], key=lambda r: r["index"])
+    print(f"  summary: {summary}")
+    assert summary == {"status": "done", "total": 3, "succeeded": 2, "failed": 1}
+    assert [r["status"] for r in results] == ["success", "error", "success"]
+    assert set(results[0]["data"]["art"][0]) == {'█'}
+    assert set(results[2]["data"]["art"][0]) == {' '}
+
+def test_endpoint_limits():
+    """The batch endpoint answers 413 for archives over the limits"""
+    print("\n=== Testing Batch Limits ===")
+
+    from fastapi.testclient import TestClient
+    import main
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('a.png', make_png('white'))
+        zf.writestr('b.png', make_png('black'))
+    files = [("files", ("photos.zip", archive.getvalue(), "application/zip")),
+             ("files", ("c.png", make_png('gray'), "image/png"))]
+
+    max_items = main.BATCH_MAX_ITEMS
+    main.BATCH_MAX_ITEMS = 2
+    try:
+        response = TestClient(main.app).post("/api/v2/convert-batch", files=files, data={"width": "20"})
+    finally:
+        main.BATCH_MAX_ITEMS = max_items
+    assert response.status_code == 413
+    print(f"  ✓ {response.json()['message']}")
+
+def main():
+    """Run all tests"""
+    print("Batch Converter - Test Suite")
+    print("=" * 50)
+
+    test_expand_archive()
+    test_batch_errors_are_per_item()
+    test_endpoint_limits()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test script for the headless batch converter CLI
+"""
+
+import sys
+import os
+import io
+import json
+import tempfile
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+import batch_convert
+from enhanced_converter import ConversionOptions
+from worker_pool import shared_pool
+from PIL import Image
+import numpy as np
+import cv2
+
+def make_tree():
+    """Create a small directory of images and a video"""
+    root = tempfile.mkdtemp(prefix="batch_convert_test_")
+    os.makedirs(os.path.join(root, "photos", "nested"))
+    Image.new('RGB', (64, 32), color='white').save(os.path.join(root, "photos", "a.png"))
+    Image.new('RGB', (64, 32), color='black').save(os.path.join(root, "photos", "nested", "b.jpg"))
+    with open(os.path.join(root, "photos", "notes.txt"), "w") as f:
+        f.write("not an image")
+
+    writer = cv2.VideoWriter(os.path.join(root, "clip.avi"), cv2.VideoWriter_fourcc(*"MJPG"), 12, (64, 48))
+    for index in range(12):
+        writer.write(np.full((48, 64, 3), index * 20, dtype=np.uint8))
+    writer.release()
+    return root
+
+def test_convert_and_resume():
+    """A run converts every source; a second run skips what the manifest records"""
+    print("=== Testing Convert And Resume ===")
+
+    root = make_tree()
+    output = os.path.join(root, "out")
+    argv = [root, "-o", output, "-j", "2", "--width", "20", "--fps", "12"]
+    assert batch_convert.main(argv) == 0
+
+    with open(os.path.join(output, "photos", "a.png.txt"), encoding="utf-8") as f:
+        assert set(f.read().split("\n")[0]) == {'█'}
+    assert os.path.exists(os.path.join(output, "photos", "nested", "b.jpg.txt"))
+    with open(os.path.join(output, "clip.avi.json"), encoding="utf-8") as f:
+        assert len(json.load(f)["frames"]) == 12
+    assert not os.path.exists(os.path.join(output, "photos", "notes.txt.txt"))
+
+    manifest_path = os.path.join(output, batch_convert.MANIFEST_NAME)
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = f.read()
+    assert len(manifest.splitlines()) == 3
+
+    # 第二次執行全部略過，清單不變
+    modified = os.path.getmtime(os.path.join(output, "photos", "a.png.txt"))
+    assert batch_convert.main(argv) == 0
+    with open(manifest_path, encoding="utf-8") as f:
+        assert f.read() == manifest
+    assert os.path.getmtime(os.path.join(output, "photos", "a.png.txt")) == modified
+
+    # 設定改變時重新轉換
+    assert batch_convert.main(argv[:-4] + ["--width", "24", "--fps", "12"]) == 0
+    with open(manifest_path, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 6
+    print("  ✓ 3 converted, rerun skipped all")
+
+def test_worker_uses_one_thread():
+    """Each worker process runs its conversions on a single thread"""
+    print("\n=== Testing Worker Initialization ===")
+
+    size = shared_pool.size
+    shared_pool.size = 4
+    try:
+        batch_convert.init_worker(ConversionOptions(width=2000))
+        assert shared_pool.size == 1
+        assert batch_convert._image_converter.pipeline.band_count((2000, 1000)) == 1
+    finally:
+        shared_pool.size = size
+    print("  ✓ Pool size 1, no row bands")
+
+def main():
+    """Run all tests"""
+    print("Batch Convert CLI - Test Suite")
+    print("=" * 50)
+
+    test_convert_and_resume()
+    test_worker_uses_one_thread()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
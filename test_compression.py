@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test script for server-side character art compression
+"""
+
+import sys
+import os
+import io
+import json
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from art_compression import ArtGrid, METHODS, encode_art, decode_art, apply_encoding
+from enhanced_converter import ConversionPipeline, ConversionOptions
+from PIL import Image
+import numpy as np
+
+def make_art(art_type="ascii", mapping="brightness"):
+    """Convert a gradient with a dark border into character art"""
+    x = np.linspace(0, 255, 200)[None, :].repeat(100, axis=0)
+    x[:20] = 0
+    image = Image.fromarray(x.astype(np.uint8), mode='L').convert('RGB')
+    return ConversionPipeline(ConversionOptions(width=60, art_type=art_type, mapping=mapping)).convert_image(image)
+
+def test_round_trip():
+    """Every method decodes back to the original lines"""
+    print("=== Testing Round Trip ===")
+
+    for art_type, mapping in [("ascii", "brightness"), ("chinese", "brightness"), ("block", "braille")]:
+        result = make_art(art_type, mapping)
+        grid = ArtGrid(result["art"])
+        for method in ["raw"] + METHODS:
+            encoded = grid.encode(method)
+            assert decode_art(encoded, result["width"], result["height"]) == result["art"], method
+        print(f"  ✓ {art_type}/{mapping}")
+
+def test_size_estimates_are_exact():
+    """Estimated sizes match the serialized payloads"""
+    print("\n=== Testing Size Estimates ===")
+
+    grid = ArtGrid(make_art()["art"])
+    sizes = grid.estimate_sizes()
+    print(f"  {sizes}")
+    for method, size in sizes.items():
+        data = grid.encode(method)["data"]
+        assert len(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')) == size, method
+
+    # 四分樹與需要跳脫的字元（奇數尺寸、各種大小的區塊）
+    rng = np.random.default_rng(0)
+    for height, width in [(1, 1), (7, 13), (33, 64), (50, 1)]:
+        cells = np.full((height, width), ' ')
+        cells[rng.random((height, width)) < 0.05] = '"'
+        cells[height // 2:, :width // 3] = '\\'
+        cells[:height // 3, width // 2:] = '█'
+        grid = ArtGrid([''.join(row) for row in cells])
+        sizes = dict(grid.estimate_sizes(), quadTree=grid._quad_tree_size())
+        for method, size in sizes.items():
+            data = grid.encode(method)["data"]
+            assert len(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')) == size, method
+
+def test_auto_picks_smallest():
+    """Auto mode chooses the smallest method and keeps the frontend layout"""
+    print("\n=== Testing Auto Selection ===")
+
+    art = ["    ", "    ", "  ##"]
+    encoded = encode_art(art)
+    print(f"  {encoded}")
+    assert encoded["type"] == "delta"
+    assert encoded["data"] == {"#": [10, 1]}
+
+    rle = encode_art(art, "rle")
+    assert rle["data"] == [["_", 10], ["#", 2]]
+
+    # 字元集含 '_' 時 '_' 是原字元，不能解碼成空白
+    underscored = [" _ _", "  __", "_  #"]
+    for method in ["rle", "auto"]:
+        assert decode_art(encode_art(underscored, method), 4, 3) == underscored, method
+    underscored = ["____", "_ _#", "____"]
+    assert decode_art(encode_art(underscored, "rle"), 4, 3) == underscored
+
+    # 不修改傳入的結果（可能是多個請求共用的快取）
+    original = {"art": art, "width": 4, "height": 3}
+    result = apply_encoding(original, "auto")
+    assert "art" not in result and decode_art(result["encoded"], 4, 3) == art
+    assert original == {"art": art, "width": 4, "height": 3}
+
+def main():
+    """Run all tests"""
+    print("Art Compression - Test Suite")
+    print("=" * 50)
+
+    test_round_trip()
+    test_size_estimates_are_exact()
+    test_auto_picks_smallest()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test script for the standalone Python decoder (frontend/simple-decoder.py)
+"""
+
+import sys
+import os
+import io
+import json
+import importlib.util
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend')
+
+# 檔名含連字號，無法直接 import
+spec = importlib.util.spec_from_file_location('simple_decoder', os.path.join(FRONTEND_DIR, 'simple-decoder.py'))
+decoder = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(decoder)
+
+def reference_decode(compressed_data, width, height):
+    """Per-position decoding used before vectorization"""
+    result = [[' ' for _ in range(width)] for _ in range(height)]
+    for char, positions in compressed_data.items():
+        for pos in positions:
+            row, col = pos // width, pos % width
+            if 0 <= row < height and 0 <= col < width:
+                result[row][col] = char
+    return [''.join(row) for row in result]
+
+def test_matches_reference():
+    """Vectorized decoding matches the per-position loop, including out-of-range positions"""
+    print("=== Testing Vectorized Decode ===")
+
+    data = {"つ": [0, 50, 100, -1, 500], "の": [25, 75, 125], "愛": [0, 150]}
+    expected = reference_decode(data, 50, 10)
+    assert decoder.decode_ultra_minimal(data, 50, 10) == expected
+    assert decoder.decode_from_string("つ:0,50,100,-1,500;の:25,75,125;愛:0,150", 50, 10) == expected
+    assert decoder.CharacterArtDecoder(50, 10).decode_to_matrix(data) == [list(line) for line in expected]
+    print("  ✓ Same output as per-position loop")
+
+def test_batch_and_stream():
+    """Multi-frame files decode in batches and as a stream"""
+    print("\n=== Testing Batch and Stream Decode ===")
+
+    path = os.path.join(FRONTEND_DIR, 'test-animation.json')
+    with open(path, 'r', encoding='utf-8') as f:
+        frames_data = json.load(f)
+    expected = [reference_decode(frame, 80, 3) for frame in frames_data]
+
+    assert decoder.decode_from_file(path, 80, 3) == expected
+    assert list(decoder.stream_decode(path, 80, 3, batch_size=3)) == expected
+
+    # 極小的讀取區塊：物件會跨越多次讀取
+    text = json.dumps(frames_data, ensure_ascii=False, indent=1)
+    assert list(decoder.iter_json_frames(io.StringIO(text), chunk_size=5)) == frames_data
+    print(f"  ✓ {len(expected)} frames")
+
+def main():
+    """Run all tests"""
+    print("Simple Decoder - Test Suite")
+    print("=" * 50)
+
+    test_matches_reference()
+    test_batch_and_stream()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
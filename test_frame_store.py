@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for the memory-mapped frame store
+"""
+
+import sys
+import os
+import io
+import tempfile
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+import frame_store
+from frame_store import FrameStore, store_key, write_store
+from enhanced_converter import ConversionPipeline, ConversionOptions
+import numpy as np
+
+# 測試時寫入暫存目錄
+frame_store.STORE_DIR = tempfile.mkdtemp(prefix="frame_store_test_")
+
+def make_frames(options, count=6):
+    """Convert a moving gradient into frame dicts like EnhancedVideoConverter"""
+    pipeline = ConversionPipeline(options)
+    frames = []
+    for i in range(count):
+        x = (np.linspace(0, 255, 160)[None, :] + i * 30) % 256
+        frame = np.stack([x.repeat(90, axis=0)] * 3, axis=-1).astype(np.uint8)
+        frame[..., 2] = 255 - frame[..., 2]
+        result = pipeline.convert_frame(frame)
+        data = {"frame_number": i * 2, "timestamp": i / 12, "art": result["art"]}
+        if result["colors"]:
+            data["colors"] = result["colors"]
+        if "background_colors" in result:
+            data["background_colors"] = result["background_colors"]
+        frames.append(data)
+    return frames, pipeline.chars
+
+def test_round_trip():
+    """Frames read back through mmap match what was written"""
+    print("=== Testing Frame Store Round Trip ===")
+
+    cases = [
+        ConversionOptions(width=40, art_type="ascii"),
+        ConversionOptions(width=40, art_type="chinese", color_mode="ansi"),
+        ConversionOptions(width=40, color_mode="ansi256", mapping="braille"),
+        ConversionOptions(width=40, color_mode="truecolor", mapping="halfblock"),
+    ]
+    for options in cases:
+        frames, charset = make_frames(options)
+        video_id = store_key(b"video", {"case": repr(options)})
+        write_store(video_id, frames, charset, len(frames[0]["art"][0]), len(frames[0]["art"]), 12, 0.5, 12)
+
+        store = FrameStore.open(video_id)
+        assert store.read_frames(0) == frames
+        assert store.read_frames(2, 3) == frames[2:5]
+        assert store.read_frames(5, 10) == frames[5:]
+        assert len(store.raw_frames(1, 2)) == 2 * store.frame_dtype.itemsize
+        print(f"  ✓ {options.color_mode}/{options.mapping}: {store.frame_dtype.itemsize} bytes per frame")
+
+def test_invalid_ids():
+    """Unknown or malformed ids are not opened"""
+    print("\n=== Testing Invalid IDs ===")
+
+    assert FrameStore.open("0" * 32) is None
+    assert FrameStore.open("../../etc/passwd") is None
+    print("  ✓ Rejected")
+
+def main():
+    """Run all tests"""
+    print("Frame Store - Test Suite")
+    print("=" * 50)
+
+    test_round_trip()
+    test_invalid_ids()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
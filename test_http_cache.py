@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script for immutable result URLs and ETags
+"""
+
+import sys
+import os
+import io
+import hashlib
+import tempfile
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+import frame_store
+from admission import benchmark_history
+import result_cache
+from result_cache import entity_tag, matching_etag, result_url
+from PIL import Image
+import numpy as np
+import cv2
+
+result_cache.CACHE_DIR = tempfile.mkdtemp(prefix="result_cache_test_")
+frame_store.STORE_DIR = tempfile.mkdtemp(prefix="frame_store_test_")
+benchmark_history.path = os.path.join(tempfile.mkdtemp(prefix="benchmark_test_"), "history.json")
+
+def test_matching_etag():
+    """Compressed and weak forms of a tag still match"""
+    print("=== Testing ETag Matching ===")
+
+    etag = entity_tag("a", 1)
+    assert etag == entity_tag("a", 1) != entity_tag("a", 2)
+    assert matching_etag(etag, etag) == etag
+    compressed = etag[:-1] + '-zstd-123"'
+    assert matching_etag(f'"other", {compressed}', etag) == compressed
+    assert matching_etag("W/" + etag, etag) == "W/" + etag
+    assert matching_etag('"other"', etag) is None and matching_etag(None, etag) is None
+    assert result_url("/x", b"\x01\x02", {"width": 5, "invert": True, "chars": None}) == "/x/0102?width=5&invert=true"
+    print("  ✓ Matching rules")
+
+def test_image_url():
+    """A converted image is served again from its GET URL"""
+    print("\n=== Testing Image URL ===")
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.random.default_rng(1).integers(0, 256, (40, 60, 3), dtype=np.uint8)).save(buffer, format='PNG')
+    image = buffer.getvalue()
+    client = TestClient(app)
+    identity = {"accept-encoding": "identity"}
+
+    posted = client.post("/api/v2/convert", files={"image": ("a.png", image, "image/png")},
+                         data={"width": "30", "color_mode": "ansi256", "encoding": "auto"}, headers=identity)
+    assert posted.status_code == 200
+    url = posted.json()["meta"]["result_url"]
+    assert posted.headers["content-location"] == url and hashlib.sha256(image).hexdigest() in url
+
+    response = client.get(url, headers=identity)
+    assert response.status_code == 200 and "immutable" in response.headers["cache-control"]
+    document = posted.json()
+    document["meta"].pop("original_filename")
+    assert response.json() == document
+
+    # 參數順序不同、省略預設值仍是同一個結果
+    content_hash = hashlib.sha256(image).hexdigest()
+    reordered = client.get(f"/api/v2/convert/{content_hash}?encoding=auto&color_mode=ansi256&width=30", headers=identity)
+    assert reordered.headers["etag"] == response.headers["etag"] and reordered.content == response.content
+
+    etag = response.headers["etag"]
+    assert client.get(url, headers={"if-none-match": etag}).status_code == 304
+
+    compressed = client.get(url, headers={"accept-encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip" and compressed.headers["etag"] == etag[:-1] + '-gzip"'
+    revalidated = client.get(url, headers={"accept-encoding": "gzip", "if-none-match": compressed.headers["etag"]})
+    assert revalidated.status_code == 304 and revalidated.headers["etag"] == compressed.headers["etag"]
+
+    assert client.get(f"/api/v2/convert/{content_hash}?width=31").status_code == 404
+    assert client.get("/api/v2/convert/not-a-hash").status_code == 404
+    print(f"  ✓ {url.split('?')[0]}")
+
+def test_video_url():
+    """A converted video is served again from the frame store"""
+    print("\n=== Testing Video URL ===")
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    path = os.path.join(tempfile.mkdtemp(), "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 12, (64, 48))
+    for index in range(12):
+        frame = np.full((48, 64, 3), index * 20, dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+    with open(path, "rb") as f:
+        video = f.read()
+
+    client = TestClient(app)
+    posted = client.post("/api/v2/convert-video", files={"video": ("clip.avi", video, "video/x-msvideo")},
+                         data={"width": "20", "color_mode": "truecolor", "fps": "12"})
+    assert posted.status_code == 200
+    meta = posted.json()["meta"]
+
+    response = client.get(meta["result_url"])
+    assert response.status_code == 200 and response.json()["data"] == posted.json()["data"]
+    assert client.get(meta["result_url"], headers={"if-none-match": response.headers["etag"]}).status_code == 304
+
+    frames = client.get(meta["frames_url"] + "?start=2&count=3")
+    assert "immutable" in frames.headers["cache-control"]
+    assert client.get(meta["frames_url"] + "?start=2&count=3",
+                      headers={"if-none-match": frames.headers["etag"]}).status_code == 304
+    assert client.get(meta["frames_url"] + "?start=2&count=4",
+                      headers={"if-none-match": frames.headers["etag"]}).status_code == 200
+    print(f"  ✓ {len(posted.json()['data']['frames'])} frames")
+
+def main():
+    """Run all tests"""
+    print("HTTP Caching - Test Suite")
+    print("=" * 50)
+
+    test_matching_etag()
+    test_image_url()
+    test_video_url()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for pre-serialized JSON responses
+"""
+
+import sys
+import os
+import io
+import json
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+import json_body
+from json_body import RawJSON, dumps, frame_json, prepend_fields
+from PIL import Image
+import numpy as np
+
+def test_raw_fragments():
+    """Raw fragments are spliced in place; tuples and NumPy values need no conversion"""
+    print("=== Testing Raw Fragments ===")
+
+    frames = [dumps({"art": ["ab"], "colors": [[(1, 2, 3), (4, 5, 6)]]}), dumps({"art": ["cd"]})]
+    body = dumps({
+        "status": "success",
+        "name": "\"quoted\" 名稱",
+        "data": {"frames": RawJSON(frames), "single": RawJSON(b'{"x":1}')},
+        "size": np.int64(3),
+        "grid": np.arange(3, dtype=np.uint8)
+    })
+    assert json.loads(body) == {
+        "status": "success",
+        "name": "\"quoted\" 名稱",
+        "data": {
+            "frames": [{"art": ["ab"], "colors": [[[1, 2, 3], [4, 5, 6]]]}, {"art": ["cd"]}],
+            "single": {"x": 1}
+        },
+        "size": 3,
+        "grid": [0, 1, 2]
+    }
+    assert json.loads(dumps({"frames": RawJSON([])})) == {"frames": []}
+    assert json.loads(prepend_fields({"frame_number": 2}, frames[1])) == {"frame_number": 2, "art": ["cd"]}
+    print("  ✓ Fragments, tuples and NumPy values serialized")
+
+def test_frame_json():
+    """Frames drop empty colour fields and are encoded without touching the original"""
+    print("\n=== Testing Frame JSON ===")
+
+    frame = {"frame_number": 0, "timestamp": 0.0, "art": ["aaaa", "aaab"], "colors": None,
+             "background_colors": [[(0, 0, 0)] * 4] * 2}
+    encoded = json.loads(frame_json(frame, "rle"))
+    assert "colors" not in encoded and "art" not in encoded and encoded["encoded"]["type"] == "rle"
+    assert frame["art"] == ["aaaa", "aaab"]
+    assert json.loads(frame_json(frame, "none"))["art"] == frame["art"]
+    print("  ✓ Original frame kept for the frame store")
+
+def test_stdlib_fallback():
+    """Without orjson the output is the same"""
+    print("\n=== Testing Standard Library Fallback ===")
+
+    value = {"art": ["█▓"], "colors": [[(255, 0, 0), (0, 0, 255)]], "n": np.float64(0.5),
+             "frames": RawJSON([b'{"a":1}'])}
+    fast = dumps(value)
+    orjson = json_body.orjson
+    json_body.orjson = None
+    try:
+        assert dumps(value) == fast
+    finally:
+        json_body.orjson = orjson
+    print(f"  ✓ {fast.decode()}")
+
+def test_endpoint_body():
+    """v2 endpoints return the same document as before"""
+    print("\n=== Testing Endpoint Body ===")
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (40, 60, 3), dtype=np.uint8)).save(buffer, format='PNG')
+    client = TestClient(app)
+    response = client.post("/api/v2/convert", files={"image": ("a.png", buffer.getvalue(), "image/png")},
+                           data={"width": "30", "color_mode": "truecolor", "encoding": "auto"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    result = response.json()
+    assert result["meta"]["width"] == result["data"]["width"] == 30
+    assert "encoded" in result["data"] and len(result["data"]["colors"][0][0]) == 3
+    print(f"  ✓ {len(response.content)} bytes")
+
+def main():
+    """Run all tests"""
+    print("Pre-serialized JSON - Test Suite")
+    print("=" * 50)
+
+    test_raw_fragments()
+    test_frame_json()
+    test_stdlib_fallback()
+    test_endpoint_body()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Test script for the compiled conversion pipeline
+"""
+
+import sys
+import os
+import io
+import time
+import multiprocessing
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+import enhanced_converter
+from enhanced_converter import (
+    EnhancedImageConverter, EnhancedVideoConverter, ConversionOptions, ConversionPipeline, SceneChangeSampler,
+    segment_count, segment_executor
+)
+from worker_pool import CancellationToken, ConversionCancelled
+from glyph_index import GlyphIndex
+from image_converter import get_pipeline
+from output_formatter import OutputFormatter
+from PIL import Image, ImageEnhance, ImageOps
+import numpy as np
+import cv2
+import tempfile
+
+def make_gradient(width=200, height=100):
+    """Create an RGB gradient test image"""
+    x = np.linspace(0, 255, width)[None, :].repeat(height, axis=0)
+    y = np.linspace(0, 255, height)[:, None].repeat(width, axis=1)
+    return Image.fromarray(np.stack([x, y, 255 - x], axis=-1).astype(np.uint8), mode='RGB')
+
+def test_stage_compilation():
+    """No-op options should not produce stages"""
+    print("=== Testing Stage Compilation ===")
+
+    pipeline = ConversionPipeline(ConversionOptions())
+    print(f"  default: {pipeline.stage_names}")
+    assert pipeline.stage_names == ["prescale", "resize", "map"]
+
+    pipeline = ConversionPipeline(ConversionOptions(contrast=1.2, invert=True, edge_detection=True))
+    print(f"  tuned:   {pipeline.stage_names}")
+    assert pipeline.stage_names == ["prescale", "tone", "resize", "edges", "map"]
+
+def test_render_matches_per_pixel_mapping():
+    """Vectorized mapping should agree with get_char_for_pixel"""
+    print("\n=== Testing Vectorized Mapping ===")
+
+    for color_mode in ["grayscale", "ansi", "ansi256", "truecolor"]:
+        converter = EnhancedImageConverter(ConversionOptions(width=40, art_type="ascii", color_mode=color_mode))
+        pixels = np.asarray(make_gradient(40, 20).convert('RGB' if color_mode != "grayscale" else 'L'))
+        result = converter.pipeline.render(pixels)
+
+        for y in range(pixels.shape[0]):
+            for x in range(pixels.shape[1]):
+                char, color = converter.get_char_for_pixel(pixels[y, x])
+                assert result["art"][y][x] == char
+                if color is not None:
+                    expected = tuple(map(int, color)) if isinstance(color, tuple) else color
+                    assert result["colors"][y][x] == expected
+        print(f"  ✓ {color_mode}")
+
+def test_prescale_tolerance():
+    """Resize-first preprocessing stays within one glyph step of full-resolution output"""
+    print("\n=== Testing Prescale Tolerance ===")
+
+    source = make_gradient(1600, 1200)
+    settings = dict(width=80, art_type="ascii", denoise=True, sharpen=True, contrast=1.3)
+    full = ConversionPipeline(ConversionOptions(prescale=0, **settings))
+    fast = ConversionPipeline(ConversionOptions(prescale=3, **settings))
+
+    expected = full.convert_image(source)
+    actual = fast.convert_image(source)
+    assert (actual["width"], actual["height"]) == (expected["width"], expected["height"])
+
+    levels = {char: idx for idx, char in enumerate(full.chars)}
+    diff = np.array([[abs(levels[a] - levels[b]) for a, b in zip(la, lb)]
+                     for la, lb in zip(actual["art"], expected["art"])])
+    print(f"  max diff: {diff.max()}, mean diff: {diff.mean():.4f}")
+    assert diff.max() <= 1
+    assert diff.mean() < 0.05
+
+    # v1 API 不先縮小，輸出與加入此選項前相同
+    assert get_pipeline(80, "ascii").options.prescale == 0
+
+def test_reduced_decode():
+    """JPEG files are decoded at reduced size but keep the original output grid"""
+    print("\n=== Testing Reduced Decode ===")
+
+    test_path = "test_reduced_decode.jpg"
+    make_gradient(2400, 1600).save(test_path, quality=90)
+
+    try:
+        pipeline = ConversionPipeline(ConversionOptions(width=80))
+        image, source_size = pipeline.open_image(test_path)
+        print(f"  source: {source_size}, decoded: {image.size}")
+        assert source_size == (2400, 1600)
+        assert image.width < 2400 and image.width >= 80 * 3
+
+        expected = pipeline.convert_image(Image.open(test_path))
+        actual = pipeline.convert_file(test_path)
+        assert (actual["width"], actual["height"]) == (expected["width"], expected["height"])
+    finally:
+        os.remove(test_path)
+
+def test_frame_tone_matches_pil():
+    """The fused tone LUT reproduces the PIL enhancer chain"""
+    print("\n=== Testing Fused Frame Tone ===")
+
+    image = make_gradient(120, 90)
+    options = ConversionOptions(contrast=1.4, brightness=0.8, invert=True)
+    pipeline = ConversionPipeline(options)
+
+    expected = ImageEnhance.Contrast(image).enhance(options.contrast)
+    expected = ImageEnhance.Brightness(expected).enhance(options.brightness)
+    expected = ImageOps.invert(expected)
+
+    bgr = np.asarray(image)[..., ::-1].copy()
+    actual = pipeline._apply_frame_tone(bgr)[..., ::-1]
+    assert np.array_equal(actual, np.asarray(expected))
+    print("  ✓ Frame path matches ImageEnhance/ImageOps")
+
+    actual = pipeline._apply_image_tone(image)
+    assert np.array_equal(np.asarray(actual), np.asarray(expected))
+    print("  ✓ Image path matches ImageEnhance/ImageOps")
+
+def test_tone_lut_cached():
+    """Tone curves are built once per image statistics"""
+    print("\n=== Testing Tone LUT Cache ===")
+
+    pipeline = ConversionPipeline(ConversionOptions(gamma=1.8, auto_levels=True, invert=True))
+    histogram = np.bincount(np.asarray(make_gradient().convert('L')).ravel(), minlength=256)
+
+    lut = pipeline.tone_lut(histogram)
+    assert lut.dtype == np.uint8 and lut.shape == (256,)
+    assert pipeline.tone_lut(histogram) is lut
+    assert lut[0] == 255 and lut[255] == 0
+    print("  ✓ LUT cached")
+
+def test_shape_matching():
+    """Cells are matched to the glyph with the nearest sub-cell coverage"""
+    print("\n=== Testing Shape Matching ===")
+
+    # 2x3 特徵：空白、左半、右半、全滿
+    features = np.array([
+        [0, 0, 0, 0, 0, 0],
+        [1, 0, 1, 0, 1, 0],
+        [0, 1, 0, 1, 0, 1],
+        [1, 1, 1, 1, 1, 1],
+    ], dtype=np.float32)
+    index = GlyphIndex([' ', '▌', '▐', '█'], (2, 3), features)
+    cells = np.array([[0.9, 0.1, 0.8, 0.0, 1.0, 0.2], [0.1, 0.9, 0.0, 0.8, 0.2, 1.0]], dtype=np.float32)
+    assert index.match(cells).tolist() == [1, 2]
+
+    brightness = ConversionPipeline(ConversionOptions(width=40, art_type="ascii")).convert_image(make_gradient())
+    shape = ConversionPipeline(ConversionOptions(width=40, art_type="ascii", mapping="shape")).convert_image(make_gradient())
+    assert (shape["width"], shape["height"]) == (brightness["width"], brightness["height"])
+    print("  ✓ Nearest glyph selected")
+
+def test_braille_packing():
+    """Each 2x4 block becomes U+2800 plus its dot bits"""
+    print("\n=== Testing Braille Packing ===")
+
+    pipeline = ConversionPipeline(ConversionOptions(mapping="braille"))
+    pixels = np.zeros((4, 4), dtype=np.uint8)
+    pixels[:, 0] = 255                # 左格：左欄四點 -> 點 1,2,3,7
+    pixels[3, 2:] = 255               # 右格：最下列兩點 -> 點 7,8
+    result = pipeline.render(pixels)
+    print(f"  {result['art']}")
+    assert result["art"] == [chr(0x2800 + 0x47) + chr(0x2800 + 0xC0)]
+
+    result = pipeline.convert_image(make_gradient(400, 200))
+    assert result["width"] == 100 and len(result["art"][0]) == 100
+
+def test_halfblock_colors():
+    """Half-block cells carry the top pixel as foreground and the bottom pixel as background"""
+    print("\n=== Testing Half-Block Mode ===")
+
+    pipeline = ConversionPipeline(ConversionOptions(mapping="halfblock", color_mode="truecolor"))
+    pixels = np.array([[[255, 0, 0]], [[0, 0, 255]]], dtype=np.uint8)
+    result = pipeline.render(pixels)
+    assert result["art"] == ['▀']
+    assert result["colors"] == [[(255, 0, 0)]]
+    assert result["background_colors"] == [[(0, 0, 255)]]
+
+    ansi = OutputFormatter.to_ansi(result["art"], result["colors"], result["background_colors"])
+    print(f"  {ansi!r}")
+    assert ansi == "\033[38;2;255;0;0;48;2;0;0;255m▀\033[0m"
+
+    # HTML 的前景與背景也支援 ANSI 顏色名稱與 256 色碼
+    result = ConversionPipeline(ConversionOptions(mapping="halfblock", color_mode="ansi")).render(pixels)
+    page = OutputFormatter.to_html(result["art"], result["colors"], background_colors=result["background_colors"])
+    assert "color: rgb(205,49,49); background-color: rgb(36,114,200)" in page
+    page = OutputFormatter.to_html(['▀'], [[196]], background_colors=[[21]])
+    assert "color: rgb(255,0,0); background-color: rgb(0,0,255)" in page
+    assert OutputFormatter._rgb_color(244) == (128, 128, 128) and OutputFormatter._rgb_color(9) == (255, 0, 0)
+
+def test_frame_buffers_reused():
+    """Buffers are allocated once per output shape"""
+    print("\n=== Testing Buffer Reuse ===")
+
+    pipeline = ConversionPipeline(ConversionOptions(width=60))
+    frame = np.asarray(make_gradient())[..., ::-1].copy()
+
+    first = pipeline.convert_frame(frame)
+    buffers = pipeline._buffers((first["height"], first["width"]))
+    second = pipeline.convert_frame(frame)
+
+    assert first["art"] == second["art"]
+    assert pipeline._buffers((second["height"], second["width"])) is buffers
+    print("  ✓ Buffers reused across frames")
+
+def test_scene_change_sampling():
+    """Static shots are skipped, cuts are emitted immediately and gaps stay bounded"""
+    print("\n=== Testing Scene-Change Sampling ===")
+
+    sampler = SceneChangeSampler(fps=24, max_gap=1.0)
+    bright = np.asarray(make_gradient(320, 180))[..., ::-1].copy()
+    dark = 255 - bright
+
+    # 2 秒靜止畫面後切換鏡頭
+    frames = [bright] * 48 + [dark] * 24
+    emitted = [i for i, frame in enumerate(frames) if sampler.should_emit(frame, i / 24)]
+    print(f"  emitted: {emitted}")
+    assert emitted == [0, 24, 48]
+
+def test_segmented_video():
+    """Segments decoded in separate processes stitch back to the sequential result"""
+    print("\n=== Testing Segment-Parallel Video Decoding ===")
+
+    path = os.path.join(tempfile.mkdtemp(), "segments.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24, (160, 90))
+    for i in range(500):
+        frame = np.full((90, 160, 3), (i * 7) % 256, dtype=np.uint8)
+        cv2.putText(frame, str(i), (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+        writer.write(frame)
+    writer.release()
+
+    # 區段數不超過工作行程數（單核主機上也以兩個行程測試）
+    workers = enhanced_converter.SEGMENT_WORKERS
+    enhanced_converter.SEGMENT_WORKERS = 2
+    try:
+        assert segment_count(0, 500) == segment_count(8, 500) == 2 and segment_count(2, 300) == 1
+        converter = EnhancedVideoConverter(ConversionOptions(width=40, color_mode="ansi256"))
+        sequential = converter.convert_video(path, fps=12)
+        segmented = converter.convert_video(path, fps=12, segments=2)
+    finally:
+        enhanced_converter.SEGMENT_WORKERS = workers
+    print(f"  {sequential[2]} frames, segmented {segmented[2]}")
+    assert segmented == sequential
+
+    # 取消時拋出 ConversionCancelled，旗標在區段結束後釋放
+    token = CancellationToken()
+    token.cancel()
+    free = len(segment_executor._free_slots)
+    try:
+        segment_executor.run([(converter.options, path, 0, None, 12, "fixed", 2.0)], token)
+        assert False, "cancelled run should raise"
+    except ConversionCancelled:
+        pass
+
+    # 工作行程中，設定旗標的區段在下一幀停止
+    flags = multiprocessing.RawArray("b", 1)
+    flags[0] = 1
+    enhanced_converter._init_segment_worker(flags)
+    try:
+        enhanced_converter._convert_segment(converter.options, path, 0, None, 12, "fixed", 2.0, cancel_slot=0)
+        assert False, "flagged segment should stop"
+    except ConversionCancelled:
+        pass
+    finally:
+        enhanced_converter._init_segment_worker(None)
+    for _ in range(100):
+        if len(segment_executor._free_slots) == free:
+            break
+        time.sleep(0.05)
+    assert len(segment_executor._free_slots) == free
+
+def test_time_budget():
+    """An impossible budget degrades quality but still returns frames, then restores the options"""
+    print("\n=== Testing Time Budget ===")
+
+    path = os.path.join(tempfile.mkdtemp(), "budget.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 24, (320, 180))
+    for i in range(48):
+        writer.write(np.roll(np.asarray(make_gradient(320, 180)), i * 4, axis=1))
+    writer.release()
+
+    options = ConversionOptions(width=120, dithering=True, sharpen=True)
+    converter = EnhancedVideoConverter(options)
+    frames, _, count = converter.convert_video(path, fps=24, time_budget=0.001)
+    stages = [change["stage"] for change in converter.quality_changes]
+    print(f"  changes: {converter.quality_changes}")
+    assert stages[:2] == ["dithering", "sharpen"] and "width" in stages
+    assert count >= 1 and len(frames[0]["art"][0]) < 120
+    assert converter.options is options
+
+    # 預算充足時不調整
+    converter.convert_video(path, fps=24, time_budget=600)
+    assert converter.quality_changes == []
+
+def test_dithering_wavefront():
+    """Wavefront dithering matches a per-pixel Floyd-Steinberg scan, across blocks too"""
+    print("\n=== Testing Wavefront Dithering ===")
+
+    def scan(gray):
+        gray = gray.astype(np.float64)
+        h, w = gray.shape
+        for y in range(h):
+            for x in range(w):
+                old = gray[y, x]
+                new = 255.0 if old > 128 else 0.0
+                gray[y, x] = new
+                error = old - new
+                if x + 1 < w:
+                    gray[y, x + 1] = min(255.0, max(0.0, gray[y, x + 1] + error * 7 / 16))
+                if y + 1 < h:
+                    if x > 0:
+                        gray[y + 1, x - 1] = min(255.0, max(0.0, gray[y + 1, x - 1] + error * 3 / 16))
+                    gray[y + 1, x] = min(255.0, max(0.0, gray[y + 1, x] + error * 5 / 16))
+                    if x + 1 < w:
+                        gray[y + 1, x + 1] = min(255.0, max(0.0, gray[y + 1, x + 1] + error * 1 / 16))
+        return gray.astype(np.uint8)
+
+    import enhanced_converter
+    pipeline = ConversionPipeline(ConversionOptions(width=80, dithering=True))
+    rng = np.random.default_rng(0)
+    block_rows = enhanced_converter.DITHER_BLOCK_ROWS
+    try:
+        for rows in (block_rows, 7):
+            enhanced_converter.DITHER_BLOCK_ROWS = rows
+            for shape in [(1, 1), (1, 9), (9, 1), (30, 47)]:
+                gray = rng.integers(0, 256, shape, dtype=np.uint8)
+                assert np.array_equal(pipeline.apply_dithering(gray), scan(gray)), shape
+    finally:
+        enhanced_converter.DITHER_BLOCK_ROWS = block_rows
+    print("  ✓ Identical to per-pixel scan")
+
+def test_row_bands():
+    """Row bands (filters with halo, per-band mapping) give the same art as one pass"""
+    print("\n=== Testing Row Bands ===")
+
+    rng = np.random.default_rng(1)
+    image = Image.fromarray(rng.integers(0, 256, (240, 400, 3), dtype=np.uint8))
+    for options in [
+        ConversionOptions(width=160, color_mode="truecolor", denoise=True, sharpen=True, contrast=1.3, prescale=0),
+        ConversionOptions(width=160, color_mode="ansi256", mapping="shape"),
+        ConversionOptions(width=160, color_mode="ansi", mapping="braille", dithering=True),
+        ConversionOptions(width=160, mapping="halfblock", sharpen=True, prescale=0),
+    ]:
+        pipeline = ConversionPipeline(options)
+        whole = pipeline.convert_image(image.copy(), bands=1)
+        banded = pipeline.convert_image(image.copy(), bands=5)
+        assert banded == whole, options.mapping
+    assert pipeline.band_count((100, 40)) == 1
+    print("  ✓ Banded output identical for brightness, shape, braille and halfblock")
+
+def main():
+    """Run all tests"""
+    print("Conversion Pipeline - Test Suite")
+    print("=" * 50)
+
+    test_stage_compilation()
+    test_render_matches_per_pixel_mapping()
+    test_prescale_tolerance()
+    test_reduced_decode()
+    test_frame_tone_matches_pil()
+    test_tone_lut_cached()
+    test_shape_matching()
+    test_braille_packing()
+    test_halfblock_colors()
+    test_frame_buffers_reused()
+    test_scene_change_sampling()
+    test_segmented_video()
+    test_time_budget()
+    test_dithering_wavefront()
+    test_row_bands()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
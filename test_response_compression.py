@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script for negotiated response compression
+"""
+
+import sys
+import os
+import io
+import json
+import gzip
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+import zstandard
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from response_compression import (
+    ResponseCompressionMiddleware, negotiate, select_dictionary, load_dictionaries
+)
+
+ART = {"art": ["█▓▒░ " * 40] * 30}
+
+def make_app():
+    """Minimal app returning a character-art body"""
+    app = FastAPI()
+    app.add_middleware(ResponseCompressionMiddleware, minimum_size=500)
+
+    @app.get("/art")
+    async def art(request: Request):
+        select_dictionary(request, "block")
+        return ART
+
+    @app.get("/small")
+    async def small():
+        return {"status": "ok"}
+
+    return app
+
+def fetch(client, path, headers):
+    """Return (headers, raw body) without client-side decoding"""
+    with client.stream("GET", path, headers=headers) as response:
+        return response.headers, b"".join(response.iter_raw())
+
+def test_negotiate():
+    """Highest q-value wins, ties go to zstd > br > gzip"""
+    print("=== Testing Negotiation ===")
+
+    assert negotiate("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate("gzip;q=1.0, zstd;q=0.5") == "gzip"
+    assert negotiate("br, gzip") == "br"
+    assert negotiate("*;q=0.1") == "zstd"
+    assert negotiate("identity") is None
+    assert negotiate("") is None
+    print("  ✓ Accept-Encoding parsed")
+
+def test_middleware_encodings():
+    """Bodies are compressed with the negotiated encoding; small bodies are left alone"""
+    print("\n=== Testing Middleware ===")
+
+    client = TestClient(make_app())
+    dict_id = load_dictionaries()["block"].dict_id()
+
+    headers, raw = fetch(client, "/art", {"Accept-Encoding": "gzip"})
+    assert headers["content-encoding"] == "gzip"
+    assert headers["x-zstd-dictionary-available"] == str(dict_id)
+    assert json.loads(gzip.decompress(raw)) == ART
+
+    headers, raw = fetch(client, "/art", {"Accept-Encoding": "zstd"})
+    assert "x-zstd-dictionary" not in headers
+    assert json.loads(zstandard.ZstdDecompressor().decompress(raw)) == ART
+
+    # 客戶端持有字典時以字典壓縮
+    headers, raw = fetch(client, "/art", {"Accept-Encoding": "zstd", "X-Zstd-Dictionary": str(dict_id)})
+    assert headers["x-zstd-dictionary"] == str(dict_id)
+    decompressor = zstandard.ZstdDecompressor(dict_data=load_dictionaries()["block"])
+    assert json.loads(decompressor.decompress(raw)) == ART
+    print(f"  ✓ zstd with dictionary {dict_id}: {len(raw)} bytes")
+
+    headers, raw = fetch(client, "/small", {"Accept-Encoding": "zstd"})
+    assert "content-encoding" not in headers and json.loads(raw) == {"status": "ok"}
+    print("  ✓ Small responses sent uncompressed")
+
+def main():
+    """Run all tests"""
+    print("Response Compression - Test Suite")
+    print("=" * 50)
+
+    test_negotiate()
+    test_middleware_encodings()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test script for resumable chunked uploads
+"""
+
+import sys
+import os
+import io
+import asyncio
+import hashlib
+import tempfile
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+import frame_store
+from admission import admission, benchmark_history
+import result_cache
+import upload_store
+from upload_store import UploadRejected, create_upload, expire, get_upload, remove_upload
+from starlette.requests import ClientDisconnect
+import numpy as np
+import cv2
+
+upload_store.UPLOAD_DIR = tempfile.mkdtemp(prefix="upload_test_")
+result_cache.CACHE_DIR = tempfile.mkdtemp(prefix="result_cache_test_")
+frame_store.STORE_DIR = tempfile.mkdtemp(prefix="frame_store_test_")
+benchmark_history.path = os.path.join(tempfile.mkdtemp(prefix="benchmark_test_"), "history.json")
+
+async def _chunks(*chunks, disconnect=False):
+    for chunk in chunks:
+        yield chunk
+    if disconnect:
+        raise ClientDisconnect()
+
+def test_resume_after_disconnect():
+    """Bytes received before a dropped connection are kept and the hash stays consistent"""
+    print("=== Testing Resume After Disconnect ===")
+
+    data = np.random.default_rng(0).bytes(300_000)
+    upload = create_upload("clip.avi", size=len(data))
+    assert upload.content_type == "video/x-msvideo"
+
+    try:
+        asyncio.run(upload.append(0, _chunks(data[:1000], data[1000:5000], disconnect=True)))
+        assert False, "disconnect should propagate"
+    except ClientDisconnect:
+        pass
+    assert upload.offset == 5000 and os.path.getsize(upload.path) == 5000 and not upload.writing
+
+    # 重送已收到的區塊、超過宣告的大小、尚未完整時完成都會被拒絕
+    for offset, chunks, status in [(0, [data[:5000]], 409), (5000, [data[5000:] + b"x"], 413)]:
+        try:
+            asyncio.run(upload.append(offset, _chunks(*chunks)))
+            assert False, "should be rejected"
+        except UploadRejected as e:
+            assert e.status_code == status and e.offset == 5000
+    try:
+        upload.finish()
+        assert False, "incomplete upload should not finish"
+    except UploadRejected as e:
+        assert e.status_code == 409
+
+    assert asyncio.run(upload.append(5000, _chunks(data[5000:200_000], data[200_000:]))) == len(data)
+    assert upload.finish(hashlib.sha256(data).hexdigest()) == hashlib.sha256(data).digest()
+    with open(upload.path, "rb") as f:
+        assert f.read() == data
+    print(f"  ✓ {len(data)} bytes, sha256 {upload.content_hash.hex()[:16]}...")
+
+def test_expire():
+    """Uploads idle longer than the TTL are removed"""
+    print("\n=== Testing Expiry ===")
+
+    upload = create_upload("a.png", size=0)
+    upload.finish()
+    assert get_upload(upload.upload_id) is upload
+    expire(now=os.path.getmtime(upload.path) + upload_store.UPLOAD_TTL + 1)
+    assert get_upload(upload.upload_id) is None and not os.path.exists(upload.path)
+    assert get_upload("../../etc/passwd") is None
+    print("  ✓ Expired upload removed")
+
+    # 轉換中的上傳不會過期，刪除延到轉換結束
+    upload = create_upload("a.png", size=0)
+    upload.finish()
+    upload.acquire()
+    expire(now=os.path.getmtime(upload.path) + upload_store.UPLOAD_TTL + 1)
+    assert get_upload(upload.upload_id) is upload
+    assert remove_upload(upload.upload_id) and get_upload(upload.upload_id) is None
+    assert os.path.exists(upload.path)
+    upload.release()
+    assert not os.path.exists(upload.path)
+    print("  ✓ Upload in use kept until released")
+
+def test_convert_upload():
+    """Conversion endpoints accept a finished upload instead of a file"""
+    print("\n=== Testing Conversion From Upload ===")
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    path = os.path.join(tempfile.mkdtemp(), "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 12, (64, 48))
+    for index in range(12):
+        writer.write(np.random.default_rng(index).integers(0, 256, (48, 64, 3), dtype=np.uint8))
+    writer.release()
+    with open(path, "rb") as f:
+        video = f.read()
+
+    client = TestClient(app)
+    created = client.post("/api/v2/uploads", data={"filename": "clip.avi", "size": str(len(video))})
+    assert created.status_code == 201
+    url = created.json()["upload_url"]
+    upload_id = created.json()["upload_id"]
+
+    offset = 0
+    for start in range(0, len(video), 4096):
+        response = client.put(f"{url}?offset={offset}", content=video[start:start + 4096])
+        offset = response.json()["offset"]
+    assert client.get(url).json()["offset"] == len(video)
+
+    # 完成前不能轉換
+    assert client.post("/api/v2/convert-video", data={"upload_id": upload_id}).status_code == 404
+    finished = client.post(f"{url}/complete", data={"sha256": hashlib.sha256(video).hexdigest()})
+    assert finished.status_code == 200 and finished.json()["complete"]
+
+    # 已在磁碟上的上傳不佔用記憶體預算：比預算大的上傳也能轉換
+    data = {"width": "20", "fps": "12"}
+    memory_budget = admission.memory_budget
+    admission.memory_budget = len(video) - 1
+    try:
+        from_upload = client.post("/api/v2/convert-video", data={**data, "upload_id": upload_id})
+    finally:
+        admission.memory_budget = memory_budget
+    posted = client.post("/api/v2/convert-video", files={"video": ("clip.avi", video, "video/x-msvideo")}, data=data)
+    assert from_upload.status_code == 200 and from_upload.json()["meta"]["original_filename"] == "clip.avi"
+    assert from_upload.json()["meta"]["result_url"] == posted.json()["meta"]["result_url"]
+    assert from_upload.json()["data"] == posted.json()["data"]
+
+    # 上傳保留到刪除，可以用其他設定再次轉換；圖片端點會拒絕影片
+    assert client.post("/api/v2/convert", data={"upload_id": upload_id}).status_code == 400
+    assert client.delete(url).status_code == 200
+    assert client.post("/api/v2/convert-video", data={"upload_id": upload_id}).status_code == 404
+    print(f"  ✓ {len(from_upload.json()['data']['frames'])} frames from upload")
+
+def main():
+    """Run all tests"""
+    print("Chunked Uploads - Test Suite")
+    print("=" * 50)
+
+    test_resume_after_disconnect()
+    test_expire()
+    test_convert_upload()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared worker pool
+"""
+
+import sys
+import os
+import io
+import threading
+import tempfile
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from worker_pool import WorkerPool, CancellationToken, ConversionCancelled
+from enhanced_converter import EnhancedVideoConverter, ConversionOptions
+from video_converter import convert_video_to_art
+import numpy as np
+import cv2
+
+def test_fair_scheduling():
+    """Priority tasks go first, then jobs take turns"""
+    print("=== Testing Fair Scheduling ===")
+
+    pool = WorkerPool(size=1)
+    gate = threading.Event()
+    order = []
+
+    # 佔住唯一的執行緒，讓後面的任務都排隊
+    blocker = pool.submit(gate.wait)
+    video = pool.job(hint=8)
+    batch = pool.job(hint=8)
+    futures = [video.submit(order.append, f"video-{i}") for i in range(3)]
+    futures += [batch.submit(order.append, f"batch-{i}") for i in range(3)]
+    futures.append(pool.submit(order.append, "image", priority=True))
+
+    gate.set()
+    blocker.result()
+    for future in futures:
+        future.result(timeout=5)
+    print(f"  order: {order}")
+    assert order == ["image", "video-0", "batch-0", "video-1", "batch-1", "video-2", "batch-2"]
+    assert video.max_parallel == 1
+
+def test_close_cancels_pending():
+    """Closing a job drops tasks that have not started"""
+    print("\n=== Testing Job Cancellation ===")
+
+    pool = WorkerPool(size=1)
+    started, gate = threading.Event(), threading.Event()
+    ran = []
+
+    def block():
+        started.set()
+        gate.wait()
+
+    with pool.job() as job:
+        first = job.submit(block)
+        started.wait(5)
+        rest = [job.submit(ran.append, i) for i in range(5)]
+    gate.set()
+    first.result(timeout=5)
+
+    assert all(future.cancelled() for future in rest) and ran == []
+    assert job.submit(ran.append, 0).cancelled()
+    print("  ✓ Pending tasks cancelled")
+
+def test_map_runs_inline():
+    """map() inside a pool task runs pending items itself instead of deadlocking"""
+    print("\n=== Testing Nested Map ===")
+
+    pool = WorkerPool(size=1)
+    future = pool.submit(lambda: pool.map(lambda x: x * x, list(range(6)), priority=True))
+    assert future.result(timeout=5) == [0, 1, 4, 9, 16, 25]
+    print("  ✓ Nested map finished on a single-thread pool")
+
+def test_video_cancellation():
+    """Cancelling the token stops a video conversion at the next frame boundary"""
+    print("\n=== Testing Video Cancellation ===")
+
+    path = os.path.join(tempfile.mkdtemp(), "cancel.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 24, (160, 90))
+    for i in range(120):
+        writer.write(np.full((90, 160, 3), i * 2, dtype=np.uint8))
+    writer.release()
+
+    token = CancellationToken()
+    processed = []
+
+    class CancellingConverter(EnhancedVideoConverter):
+        def _process_frame(self, frame, frame_number):
+            processed.append(frame_number)
+            if len(processed) == 5:
+                token.cancel()
+            return super()._process_frame(frame, frame_number)
+
+    converter = CancellingConverter(ConversionOptions(width=40))
+    try:
+        converter.convert_video(path, fps=24, cancel_token=token)
+        assert False, "conversion was not cancelled"
+    except ConversionCancelled:
+        pass
+    print(f"  ✓ Stopped after {len(processed)} of 120 frames")
+    assert len(processed) < 120
+
+    # 已取消的權杖不會開始轉換
+    try:
+        EnhancedVideoConverter(ConversionOptions(width=40)).convert_video(path, cancel_token=token)
+        assert False, "conversion was not cancelled"
+    except ConversionCancelled:
+        pass
+
+    # v1 轉換同樣在共用執行池中處理並可取消
+    frames, _, count = convert_video_to_art(path, width=40, fps=24, cancel_token=CancellationToken())
+    assert count == len(frames) == 120 and [f["frame_number"] for f in frames] == list(range(120))
+    try:
+        convert_video_to_art(path, width=40, fps=24, cancel_token=token)
+        assert False, "conversion was not cancelled"
+    except ConversionCancelled:
+        pass
+
+def main():
+    """Run all tests"""
+    print("Worker Pool - Test Suite")
+    print("=" * 50)
+
+    test_fair_scheduling()
+    test_close_cancels_pending()
+    test_map_runs_inline()
+    test_video_cancellation()
+
+    print("\n" + "=" * 50)
+    print("All tests completed!")
+
+if __name__ == "__main__":
+    main()